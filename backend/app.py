@@ -1,27 +1,50 @@
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 from datetime import datetime
-import json
-from queue import Queue, Empty
+import functools
+import time
 import pytz
-from db import db
-from models import Guest, Token, Checkin, Event, User, UserToken
-import secrets
-import csv
-import io
-import qrcode
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from db import db, chunked, insert_ignoring
+from db_config import configure_database, install_connection_hooks
+from db_replica import read_replica, replica_read
+from models import Guest, Token, Checkin, Event, User, ImportJob, get_hanoi_time
 from io import BytesIO
 from datetime import datetime
 import os
 import hashlib
+from sqlalchemy import and_, update, delete, select, exists, literal
+from sqlalchemy.orm import joinedload
 from batch_api import batch_bp
-from jwt_utils import generate_access_token, generate_refresh_token, verify_jwt_token, jwt_required, get_current_user
+from batch_cache import batch_cache
+from token_index import token_index
+from invite_cache import invite_cache
+from guest_import import import_csv_stream, import_json_rows, IMPORT_CHUNK_SIZE
+from import_jobs import job_queue
+from qr_cache import qr_image_cache, qr_cache_key, QR_CACHE_MAX_AGE
+from qr_pack import stream_qr_pdf, stream_qr_zip
+from event_counters import get_event_stats
+from migrations import init_schema
+from guest_search import search_guest_ids
+from event_hub import event_log, format_sse, parse_last_event_id
+from token_provisioning import event_guest_tokens, generate_unique_tokens, provision_tokens
+from password_hashing import upgrade_password_hash
+from jwt_utils import (
+    generate_access_token, generate_refresh_token, verify_jwt_token, jwt_required, get_current_user,
+    bearer_token, revoked_tokens,
+)
+
+
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "1"))
+# Most scans one /api/checkin/batch request may replay; scanners split longer backlogs
+CHECKIN_BATCH_MAX_SCANS = int(os.getenv("CHECKIN_BATCH_MAX_SCANS", "1000"))
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///exp_guest.db"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # DATABASE_URL, pool size and SQLite pragmas, see db_config.py
+    configure_database(app)
     
     # CORS configuration with environment variable support
     cors_origins = os.getenv("CORS_ORIGINS", "http://192.168.1.135:9009")
@@ -48,38 +71,23 @@ def create_app() -> Flask:
 
     # Ensure tables and columns exist even when running via `python -m backend.app`
     with app.app_context():
+        install_connection_hooks(db.engine)
         try:
-            db.create_all()
-            # --- lightweight migration for new Event fields on SQLite ---
-            try:
-                existing_cols = set()
-                result = db.session.execute(db.text("PRAGMA table_info(events)"))
-                for row in result:
-                    # row columns: cid, name, type, notnull, dflt_value, pk
-                    existing_cols.add(str(row[1]))
-
-                alter_statements: list[str] = []
-                if "venue_address" not in existing_cols:
-                    alter_statements.append("ALTER TABLE events ADD COLUMN venue_address TEXT")
-                if "venue_map_url" not in existing_cols:
-                    alter_statements.append("ALTER TABLE events ADD COLUMN venue_map_url TEXT")
-                if "program_outline" not in existing_cols:
-                    alter_statements.append("ALTER TABLE events ADD COLUMN program_outline TEXT")
-                if "dress_code" not in existing_cols:
-                    alter_statements.append("ALTER TABLE events ADD COLUMN dress_code TEXT")
-
-                for stmt in alter_statements:
-                    try:
-                        db.session.execute(db.text(stmt))
-                    except Exception as _:
-                        pass
-                if alter_statements:
-                    db.session.commit()
-            except Exception as _:
-                # Do not block app start if pragma/alter fails
-                db.session.rollback()
+            # Tables, then versioned schema changes (columns, indexes, triggers), see migrations.py;
+            # one process at a time, the others wait and find nothing pending
+            init_schema()
         except Exception as e:
+            # Refuse to start on a half-migrated schema (gunicorn stops booting workers)
             print(f"DB init error: {e}")
+            raise
+
+    # Import jobs run in `python import_jobs.py`; IMPORT_WORKER_THREADS>0 also runs them in this process
+    job_queue.init_app(app)
+    qr_image_cache.init_app(app)
+    event_log.init_app(app)
+    batch_cache.init_app(app)
+    # Read-only list/stats routes may read from DATABASE_REPLICA_URL
+    read_replica.init_app(app)
 
     # CORS headers are handled by Flask-CORS, no need for manual headers
 
@@ -132,10 +140,11 @@ def create_app() -> Flask:
             ).first()
             if not user or not user.verify_password(password):
                 return {"message": "invalid credentials"}, 401
+            stale_hash = user.password_hash if user.password_needs_rehash() else None
 
             # Generate access and refresh tokens
             access_token = generate_access_token(user.id, user.username, user.email)
-            refresh_token = generate_refresh_token(user.id, user.username)
+            refresh_token = generate_refresh_token(user.id, user.username, user.email)
             
             response = jsonify({
                 "access_token": access_token,
@@ -152,11 +161,24 @@ def create_app() -> Flask:
                 secure=False,  # Set to True in production with HTTPS
                 samesite='Strict'
             )
+
+            if stale_hash:
+                # Hash policy changed (PASSWORD_HASH_METHOD): re-hash once the response has gone out
+                response.call_on_close(functools.partial(_upgrade_password_hash, user.id, stale_hash, password))
             
             return response, 200
+        except FuturesTimeoutError:
+            return {"message": "login busy, try again"}, 503
         except Exception as e:
             return {"message": f"login error: {str(e)}"}, 500
 
+    def _upgrade_password_hash(user_id: int, stale_hash: str, password: str) -> None:
+        try:
+            with app.app_context():
+                upgrade_password_hash(user_id, stale_hash, password)
+        except Exception as e:
+            print(f"Password rehash error for user {user_id}: {e}")
+
     @app.route("/api/auth/refresh", methods=["POST"])
     def refresh_token():
         """Refresh access token using refresh token"""
@@ -168,14 +190,15 @@ def create_app() -> Flask:
                 return {"message": "Refresh token not found"}, 401
             
             # Verify refresh token
-            payload = verify_jwt_token(refresh_token)
-            if not payload or payload.get('type') != 'refresh':
+            payload = verify_jwt_token(refresh_token, 'refresh')
+            if not payload:
                 return {"message": "Invalid refresh token"}, 401
             
             # Generate new access token
             access_token = generate_access_token(
                 payload['user_id'], 
-                payload['username']
+                payload['username'],
+                payload.get('email')
             )
             
             return {"access_token": access_token}, 200
@@ -185,7 +208,17 @@ def create_app() -> Flask:
 
     @app.route("/api/auth/logout", methods=["POST"])
     def logout():
-        """Logout and clear refresh token"""
+        """Logout, revoke the presented tokens and clear refresh token"""
+        try:
+            # Revoked jti go to user_tokens; every worker keeps them in memory (jwt_utils.RevokedTokens)
+            presented = [(request.cookies.get('refresh-token'), 'refresh'), (bearer_token(), 'access')]
+            for token, token_type in presented:
+                payload = verify_jwt_token(token, token_type) if token else None
+                if payload:
+                    revoked_tokens.revoke(payload)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Logout revoke error: {e}")
         response = jsonify({"message": "Logged out successfully"})
         response.set_cookie('refresh-token', '', expires=0)
         return response, 200
@@ -200,28 +233,22 @@ def create_app() -> Flask:
 
     @app.route("/api/auth/me", methods=["GET"])
     def auth_get_current_user():
-        try:
-            # Lấy token từ header Authorization
-            auth_header = request.headers.get('Authorization')
-            if not auth_header or not auth_header.startswith('Bearer '):
-                return {"message": "Missing or invalid authorization header"}, 401
-            
-            token = auth_header.split(' ')[1]
-            
-            # Tìm token trong database
-            token_obj = UserToken.query.filter_by(token=token).first()
-            if not token_obj:
-                return {"message": "Invalid token"}, 401
-            
-            # Lấy user từ token
-            user = User.query.get(token_obj.user_id)
-            if not user:
-                return {"message": "User not found"}, 401
-            
-            return {"user": user.to_public_dict()}, 200
-                
-        except Exception as e:
-            return {"message": f"get current user error: {str(e)}"}, 500
+        # Served from the access token's claims: no database query per call
+        token = bearer_token()
+        if not token:
+            return {"message": "Missing or invalid authorization header"}, 401
+        payload = verify_jwt_token(token, 'access')
+        if not payload:
+            return {"message": "Invalid token"}, 401
+        return {"user": {
+            "id": payload['user_id'],
+            "username": payload['username'],
+            "email": payload.get('email'),
+        }}, 200
+
+    def _wants_async_import() -> bool:
+        flag = request.args.get("async") or request.form.get("async") or ""
+        return flag.lower() in ("1", "true", "yes")
 
     @app.route("/api/guests/import", methods=["POST"])
     @jwt_required
@@ -232,69 +259,17 @@ def create_app() -> Flask:
         data = request.get_json(silent=True) or []
         if not isinstance(data, list):
             return {"message": "Body must be an array"}, 400
-        imported = 0
-        failed = 0
-        errors = []
-        for row in data:
-            name = (row or {}).get("name")
-            title = (row or {}).get("title")
-            role = (row or {}).get("role")
-            organization = (row or {}).get("organization")
-            tag = (row or {}).get("tag")
-            email = (row or {}).get("email")
-            phone = (row or {}).get("phone")
-            event_id = (row or {}).get("event_id")
-            
-            # Debug logging
-            print(f"Processing guest: {name}")
-            print(f"  Raw role: {repr((row or {}).get('role'))}")
-            print(f"  Raw organization: {repr((row or {}).get('organization'))}")
-            print(f"  Mapped role: {repr(role)}")
-            print(f"  Mapped organization: {repr(organization)}")
-            if not name:
-                failed += 1
-                errors.append("Missing name")
-                continue
-            try:
-                # Set empty values to None to avoid UNIQUE constraint issues
-                if not email or email.strip() == '':
-                    email = None
-                if not phone or phone.strip() == '':
-                    phone = None
-                
-                # Check if email already exists (only if email is not None)
-                if email and Guest.query.filter_by(email=email).first():
-                    failed += 1
-                    errors.append(f"Email {email} already exists")
-                    continue
-                
-                # Check if phone already exists (only if phone is not None)
-                if phone and Guest.query.filter_by(phone=phone).first():
-                    failed += 1
-                    errors.append(f"Phone {phone} already exists")
-                    continue
-                
-                g = Guest(
-                    name=name,
-                    title=title,
-                    role=role,
-                    organization=organization,
-                    tag=tag,
-                    email=email,
-                    phone=phone,
-                    checkin_status="not_arrived",  # Default status for imported guests
-                    rsvp_status="pending",  # Default RSVP status for imported guests
-                    event_id=event_id
-                )
-                db.session.add(g)
-                imported += 1
-            except Exception as e:
-                failed += 1
-                errors.append(str(e))
-                continue
-        db.session.commit()
-        print(f"Import completed: {imported} imported, {failed} failed")
-        return {"imported": imported, "failed": failed, "errors": errors}, 200
+        chunk_size = request.args.get("chunk_size", type=int) or IMPORT_CHUNK_SIZE
+        if _wants_async_import():
+            job = job_queue.enqueue_json(data, chunk_size=chunk_size)
+            return {"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}, 202
+        try:
+            result = import_json_rows(data, chunk_size=chunk_size)
+        except Exception as e:
+            db.session.rollback()
+            return {"message": f"Error importing guests: {str(e)}"}, 500
+        print(f"Import completed: {result.imported} imported, {result.failed} failed")
+        return result.to_dict(), 200
 
     @app.route("/api/guests/import-csv", methods=["POST"])
     @jwt_required
@@ -313,110 +288,33 @@ def create_app() -> Flask:
         try:
             # Get event_id from form
             form_event_id = request.form.get('event_id', '').strip()
-            
-            # Read CSV content with UTF-8 support
-            try:
-                # Try UTF-8 first
-                csv_content = file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                try:
-                    # Try UTF-8 with BOM
-                    file.seek(0)
-                    csv_content = file.read().decode('utf-8-sig')
-                except UnicodeDecodeError:
-                    try:
-                        # Try Windows-1252 (common for Excel exports)
-                        file.seek(0)
-                        csv_content = file.read().decode('windows-1252')
-                    except UnicodeDecodeError:
-                        # Fallback to latin-1
-                        file.seek(0)
-                        csv_content = file.read().decode('latin-1')
-            
-            # Check if CSV has proper headers
-            lines = csv_content.strip().split('\n')
-            first_line = lines[0] if lines else ""
-            
-            # If first line doesn't contain expected headers, add them
-            expected_headers = ['title', 'Name', 'Role', 'Organization', 'tags', 'host', 'message']
-            if not any(header in first_line for header in expected_headers):
-                print("No proper headers found, adding headers...")
-                csv_content = ','.join(expected_headers) + '\n' + csv_content
-            
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
-            
-            imported = 0
-            failed = 0
-            errors = []
-            
-            for row in csv_reader:
-                print(f"Processing row: {row}")
-                
-                # Smart mapping to handle different CSV formats
-                # Check if data is shifted (Name contains Mr/Mrs instead of actual name)
-                name_field = row.get('Name', '').strip()
-                role_field = row.get('Role', '').strip()
-                
-                # If Name field contains title (Mr/Mrs/Ms) and Role contains actual name, swap them
-                if name_field in ['Mr', 'Mrs', 'Ms', 'Dr'] and role_field and role_field not in ['Mr', 'Mrs', 'Ms', 'Dr']:
-                    # Data is shifted: title is in Name, actual name is in Role
-                    title = name_field
-                    name = role_field
-                    role = row.get('Organization', '').strip() or None
-                    organization = row.get('tags', '').strip() or None
-                    tag = row.get('host', '').strip() or None
-                    host = None
-                    # Message might be in None key or message key
-                    message = row.get('message', '').strip() or None
-                    if not message and None in row:
-                        message = ' '.join(row[None]) if isinstance(row[None], list) else str(row[None])
-                else:
-                    # Normal mapping
-                    name = name_field
-                    title = row.get('title', '').strip() or None
-                    role = role_field or None
-                    organization = row.get('Organization', '').strip() or None
-                    tag = row.get('tags', '').strip() or None
-                    host = row.get('host', '').strip() or None
-                    message = row.get('message', '').strip() or None
-                
-                print(f"Parsed data: name='{name}', title='{title}', role='{role}', organization='{organization}', tag='{tag}', host='{host}', event_id='{form_event_id}'")
-                
-                if not name:
-                    failed += 1
-                    errors.append(f"Row {imported + failed + 1}: Missing name")
-                    print(f"Failed: Missing name")
-                    continue
-                
-                try:
-                    g = Guest(
-                        name=name,
-                        title=title,
-                        role=role,
-                        organization=organization,
-                        tag=tag,
-                        email=None,  # Always None for CSV import
-                        phone=None,  # Always None for CSV import
-                        event_content=message,  # Store message in event_content
-                        checkin_status="not_arrived",  # Default status for imported guests
-                        rsvp_status="pending",  # Default RSVP status for imported guests
-                        event_id=int(form_event_id) if form_event_id and form_event_id.isdigit() else None
-                    )
-                    db.session.add(g)
-                    imported += 1
-                    print(f"Success: Added guest {name}")
-                except Exception as e:
-                    failed += 1
-                    errors.append(f"Row {imported + failed + 1}: {str(e)}")
-                    print(f"Error: {str(e)}")
-                    continue
-            
-            db.session.commit()
-            return {"imported": imported, "failed": failed, "errors": errors}, 200
+            event_id = int(form_event_id) if form_event_id and form_event_id.isdigit() else None
+            chunk_size = request.form.get('chunk_size', type=int) or IMPORT_CHUNK_SIZE
+
+            if _wants_async_import():
+                job = job_queue.enqueue_csv(file, event_id, chunk_size=chunk_size)
+                return {"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}, 202
+
+            def log_progress(processed: int, imported: int, failed: int) -> None:
+                print(f"CSV import progress: {processed} rows processed, {imported} imported, {failed} failed")
+
+            # Rows are decoded and inserted as they stream in, committed every chunk_size rows
+            result = import_csv_stream(file.stream, event_id, chunk_size=chunk_size, progress=log_progress)
+            return result.to_dict(), 200
             
         except Exception as e:
+            db.session.rollback()
             return {"message": f"Error processing CSV: {str(e)}"}, 400
 
+    @app.get("/api/jobs/<job_id>")
+    @jwt_required
+    def get_import_job(job_id: str):
+        """Progress of a background import: rows processed, failures and ETA"""
+        job = ImportJob.query.get(job_id)
+        if not job:
+            return {"message": "Job not found"}, 404
+        return {"job": job.to_dict()}, 200
+
     @app.route("/api/guests/cleanup-empty-phones", methods=["POST"])
     @jwt_required
     def cleanup_empty_phones():
@@ -424,6 +322,7 @@ def create_app() -> Flask:
             # Update all guests with empty phone to NULL
             updated = Guest.query.filter_by(phone='').update({'phone': None})
             db.session.commit()
+            batch_cache.invalidate("guests")
             print(f"Updated {updated} guests with empty phone to NULL")
             return {"message": f"Updated {updated} guests with empty phone to NULL"}, 200
         except Exception as e:
@@ -431,9 +330,11 @@ def create_app() -> Flask:
             return {"message": "Error cleaning up empty phones"}, 500
 
     @app.route("/api/guests", methods=["GET"])
+    @replica_read
     def get_guests():
         try:
-            guests = Guest.query.all()
+            # Event names come from the same query (serialize_guest reads guest.event)
+            guests = Guest.query.options(joinedload(Guest.event)).all()
             print(f"Found {len(guests)} guests in database")
             from batch_api import serialize_guest
             return {"guests": [serialize_guest(guest) for guest in guests]}, 200
@@ -441,7 +342,28 @@ def create_app() -> Flask:
             print(f"Error getting guests: {e}")
             return {"error": str(e), "guests": []}, 500
 
+    @app.get("/api/guests/search")
+    @replica_read
+    def search_guests():
+        """Ranked typeahead search: ?q=<text>[&event_id=<id>][&limit=<n>]"""
+        try:
+            q = (request.args.get("q") or "").strip()
+            if not q:
+                return {"guests": []}, 200
+            event_id = request.args.get("event_id", type=int)
+            limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+
+            guest_ids = search_guest_ids(q, event_id=event_id, limit=limit)
+            guests = Guest.query.options(joinedload(Guest.event)).filter(Guest.id.in_(guest_ids)).all() if guest_ids else []
+            by_id = {guest.id: guest for guest in guests}
+            from batch_api import serialize_guest
+            return {"guests": [serialize_guest(by_id[guest_id]) for guest_id in guest_ids if guest_id in by_id]}, 200
+        except Exception as e:
+            print(f"Error searching guests: {e}")
+            return {"error": str(e), "guests": []}, 500
+
     @app.route("/api/guests/checked-in", methods=["GET"])
+    @replica_read
     def get_checked_in_guests():
         try:
             # Lấy tham số lọc theo sự kiện (tùy chọn)
@@ -451,7 +373,11 @@ def create_app() -> Flask:
                 event_filter = int(event_id_param)
 
             # Lấy danh sách khách đã check-in với thông tin check-in
-            query = db.session.query(Checkin, Guest).join(Guest, Checkin.guest_id == Guest.id)
+            query = (
+                db.session.query(Checkin, Guest)
+                .join(Guest, Checkin.guest_id == Guest.id)
+                .options(joinedload(Guest.event))
+            )
             if event_filter is not None:
                 query = query.filter(Guest.event_id == event_filter)
             checkins = query.all()
@@ -515,6 +441,7 @@ def create_app() -> Flask:
             
             db.session.add(guest)
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Created guest: {guest.name}")
             return {"message": "Guest created successfully", "guest": guest.to_dict()}, 201
@@ -565,6 +492,7 @@ def create_app() -> Flask:
             print(f"Updating guest {guest.name}: rsvp_status = {guest.rsvp_status}, checkin_status = {guest.checkin_status}")
             
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Updated guest: {guest.name}, rsvp_status: {guest.rsvp_status}")
             return {"message": "Guest updated successfully", "guest": guest.to_dict()}, 200
@@ -587,6 +515,7 @@ def create_app() -> Flask:
             # Delete the guest - related tokens and checkins will be automatically deleted due to CASCADE
             db.session.delete(guest)
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Deleted guest: {guest_name}")
             return {"message": "Guest deleted successfully"}, 200
@@ -598,21 +527,13 @@ def create_app() -> Flask:
 
     # --- QR / Token ---
     def _generate_unique_token() -> str:
-        while True:
-            candidate = secrets.token_urlsafe(16)
-            if not Token.query.filter_by(token=candidate).first():
-                return candidate
+        return generate_unique_tokens(1)[0]
 
     # --- Realtime (SSE) for instant invite updates ---
-    token_subscribers: dict[str, list[Queue]] = {}
-
+    # Notifications go through the shared event log so every worker (and the standalone
+    # event hub, see event_hub.py) sees them, not only the process that wrote them.
     def _notify_token(token_str: str, payload: dict):
-        queues = token_subscribers.get(token_str, [])
-        for q in list(queues):
-            try:
-                q.put_nowait(payload)
-            except Exception:
-                pass
+        event_log.publish(token_str, payload)
 
     @app.get("/api/qr/stream")
     def qr_stream():
@@ -624,32 +545,34 @@ def create_app() -> Flask:
         if not tok:
             return {"message": "token not found"}, 404
 
-        q: Queue = Queue()
-        token_subscribers.setdefault(token_str, []).append(q)
-
-        def event_stream():
-            try:
-                yield f": ping\n\n"
-                while True:
-                    try:
-                        message = q.get(timeout=15)
-                        yield f"data: {json.dumps(message)}\n\n"
-                    except Empty:
-                        yield f": ping\n\n"
-            finally:
-                try:
-                    token_subscribers[token_str].remove(q)
-                    if not token_subscribers[token_str]:
-                        del token_subscribers[token_str]
-                except Exception:
-                    pass
+        # Resume after the last event the client saw, otherwise start from now
+        last_id = parse_last_event_id(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+        if last_id is None:
+            last_id = event_log.latest_id()
+
+        def event_stream(last_id: int):
+            yield ": ping\n\n"
+            idle = 0.0
+            while True:
+                events = event_log.read_since(last_id, token_str)
+                for event_id, _token, payload in events:
+                    last_id = event_id
+                    yield format_sse(event_id, payload)
+                if events:
+                    idle = 0.0
+                    continue
+                time.sleep(STREAM_POLL_INTERVAL)
+                idle += STREAM_POLL_INTERVAL
+                if idle >= 15:
+                    idle = 0.0
+                    yield ": ping\n\n"
 
         headers = {
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no",
             "Content-Type": "text/event-stream",
         }
-        return app.response_class(event_stream(), headers=headers)
+        return app.response_class(event_stream(last_id), headers=headers)
 
     @app.post("/api/guests/<int:guest_id>/qr")
     def generate_qr_for_guest(guest_id: int):
@@ -666,31 +589,44 @@ def create_app() -> Flask:
 
     @app.get("/api/guests/<int:guest_id>/qr-image")
     def get_guest_qr_image(guest_id: int):
-        guest = Guest.query.get(guest_id)
-        if not guest:
+        # Guest name and active token in one query
+        row = (
+            db.session.query(Guest.name, Token.token)
+            .outerjoin(Token, and_(Token.guest_id == Guest.id, Token.status == "active"))
+            .filter(Guest.id == guest_id)
+            .first()
+        )
+        if not row:
             return {"message": "Guest not found"}, 404
+        guest_name, token_str = row
         
         # Reuse single active token per guest; create if none exists
-        token = Token.query.filter_by(guest_id=guest_id, status="active").first()
-        if not token:
+        if not token_str:
             token = Token(guest_id=guest_id, token=_generate_unique_token(), status="active")
             db.session.add(token)
             db.session.commit()
+            token_str = token.token
         
-        # Tạo QR code với token trực tiếp thay vì URL
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(token.token)  # Chỉ chứa token, không phải URL
-        qr.make(fit=True)
+        # QR chỉ chứa token; ảnh được cache theo token + tham số render
+        cache_key = qr_cache_key(token_str)
+        if request.if_none_match.contains(cache_key):
+            response = app.response_class(status=304)
+            response.set_etag(cache_key)
+            response.cache_control.public = True
+            response.cache_control.max_age = QR_CACHE_MAX_AGE
+            return response
+        png, cache_key = qr_image_cache.get(token_str)
         
-        # Tạo ảnh QR
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Lưu vào BytesIO
-        img_io = BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        
-        return send_file(img_io, mimetype='image/png', as_attachment=True, download_name=f'qr_{guest.name}_{guest_id}.png')
+        response = send_file(
+            BytesIO(png),
+            mimetype='image/png',
+            as_attachment=True,
+            download_name=f'qr_{guest_name}_{guest_id}.png',
+            etag=cache_key,
+            max_age=QR_CACHE_MAX_AGE,
+        )
+        response.cache_control.public = True
+        return response
 
     @app.get("/api/qr/validate")
     def validate_qr():
@@ -769,6 +705,7 @@ def create_app() -> Flask:
             print(f"Guest {guest.id} checkin_status is now: '{guest.checkin_status}'")
 
             db.session.commit()
+            batch_cache.invalidate("guests")
 
             return {"message": "Check-in deleted and status updated to not_arrived"}, 200
         except Exception as e:
@@ -778,109 +715,214 @@ def create_app() -> Flask:
     @app.post("/api/checkin")
     def checkin():
         try:
-            print(f"Checkin Request received: {request.method} {request.url}")
-            print(f"Request headers: {dict(request.headers)}")
-            
             body = request.get_json(silent=True) or {}
-            print(f"Request body: {body}")
-            
+
             # Hỗ trợ cả token và qr_code
             token_str = body.get("token") or body.get("qr_code")
             gate = body.get("gate", "QR Scanner")
             staff = body.get("staff", "System")
             event_id_param = body.get("event_id")
-            
-            print(f"Token: {token_str}, Gate: {gate}, Staff: {staff}")
-            
+
             if not token_str:
-                print("No token provided")
                 return {"message": "token required"}, 400
-                
-            tok = Token.query.filter_by(token=token_str, status="active").first()
-            if not tok:
+
+            # Resolve token -> guest/event from the per-worker index (no DB read on a hit)
+            record = token_index.get(token_str)
+            if not record:
                 print(f"Token not found: {token_str}")
                 return {"message": "invalid token"}, 404
-            
-            # Kiểm tra token có hết hạn không
-            if tok.is_expired():
-                print(f"Token expired: {token_str}")
-                return {"message": "token expired"}, 410
-                
+
             # Nếu có event_id truyền lên, đảm bảo guest thuộc sự kiện đó
             if event_id_param and isinstance(event_id_param, int):
-                guest_for_event = Guest.query.get(tok.guest_id)
-                if guest_for_event and guest_for_event.event_id and guest_for_event.event_id != event_id_param:
+                if record.event_id and record.event_id != event_id_param:
                     return {"message": "guest does not belong to selected event"}, 400
 
-            existing = Checkin.query.filter_by(guest_id=tok.guest_id).first()
-            if existing:
-                print(f"Guest {tok.guest_id} already checked in at {existing.time}")
-                # Ensure status consistency for guests list
-                guest_already = Guest.query.get(tok.guest_id)
-                if guest_already and guest_already.checkin_status != "checked_in":
-                    print(f"Updating already checked-in guest {guest_already.id} ({guest_already.name}) checkin_status from '{guest_already.checkin_status}' to 'checked_in'")
-                    guest_already.checkin_status = "checked_in"
-                    db.session.commit()
-                    print(f"Already checked-in guest {guest_already.id} status updated to: '{guest_already.checkin_status}'")
+            # Single write transaction: insert the check-in only if the token is still
+            # active and the guest has no check-in yet, then flip the guest status.
+            # ON CONFLICT covers a scan of the same guest committed by another worker meanwhile.
+            now = get_hanoi_time()
+            inserted = db.session.execute(
+                insert_ignoring(Checkin, "guest_id").from_select(
+                    ["guest_id", "time", "gate", "staff"],
+                    select(
+                        literal(record.guest_id),
+                        literal(now, Checkin.time.type),
+                        literal(gate, Checkin.gate.type),
+                        literal(staff, Checkin.staff.type),
+                    ).where(
+                        exists().where(Token.token == token_str, Token.status == "active"),
+                        ~exists().where(Checkin.guest_id == record.guest_id),
+                    ),
+                )
+                # INSERT rowcounts are dropped on PostgreSQL (psycopg) unless asked for
+                .execution_options(preserve_rowcount=True)
+            ).rowcount
+            if inserted:
+                db.session.execute(
+                    update(Guest)
+                    .where(Guest.id == record.guest_id, Guest.checkin_status != "checked_in")
+                    .values(checkin_status="checked_in")
+                    .execution_options(status_only=True, guest_ids=[record.guest_id], synchronize_session=False)
+                )
+            db.session.commit()
+            if inserted:
+                # A repeat scan changes nothing, so cached guest lists stay valid
+                batch_cache.invalidate("guests")
+
+            if not inserted:
+                existing = Checkin.query.filter_by(guest_id=record.guest_id).first()
+                if not existing:
+                    # Token was revoked by another worker since it was indexed
+                    token_index.invalidate_token(token_str)
+                    return {"message": "invalid token"}, 404
                 return {
-                    "message": "already checked in", 
+                    "message": "already checked in",
                     "checked_in_at": existing.time.isoformat(),
-                    "guest": {
-                        "id": guest_already.id, 
-                        "name": guest_already.name,
-                        "title": guest_already.title,
-                        "position": guest_already.role,
-                        "company": guest_already.organization,
-                        "tag": guest_already.tag,
-                        "email": guest_already.email,
-                        "phone": guest_already.phone,
-                        "event_id": guest_already.event_id,
-                        "event_name": guest_already.event.name if guest_already.event else None
-                    }
+                    "guest": record.guest_payload()
                 }, 409
-                
-            ci = Checkin(guest_id=tok.guest_id, gate=gate, staff=staff)
-            db.session.add(ci)
-            
-            # Update guest status so Guests list reflects immediately
-            guest = Guest.query.get(tok.guest_id)
-            if guest:
-                print(f"Updating guest {guest.id} ({guest.name}) checkin_status from '{guest.checkin_status}' to 'checked_in'")
-                guest.checkin_status = "checked_in"
-                print(f"Guest {guest.id} checkin_status is now: '{guest.checkin_status}'")
-
-            db.session.commit()
-            print(f"Database committed. Guest {guest.id} final status: '{guest.checkin_status}'")
 
+            checked_in_at = now.replace(tzinfo=None).isoformat()
             result = {
-                "message": "ok", 
-                "guest": {
-                    "id": guest.id, 
-                    "name": guest.name,
-                    "title": guest.title,
-                    "position": guest.role,
-                    "company": guest.organization,
-                    "tag": guest.tag,
-                    "email": guest.email,
-                    "phone": guest.phone,
-                    "event_id": guest.event_id,
-                    "event_name": guest.event.name if guest.event else None
-                }, 
-                "checked_in_at": ci.time.isoformat(),
-                "time": ci.time.isoformat()
+                "message": "ok",
+                "guest": record.guest_payload(),
+                "checked_in_at": checked_in_at,
+                "time": checked_in_at
             }
-            print(f"Checkin success: {result}")
+            print(f"Checkin success: guest {record.guest_id} at gate {gate}")
             # Notify invite stream instantly
             try:
-                _notify_token(token_str, {"type": "checkin", "guest_id": guest.id, "time": ci.time.isoformat()})
+                _notify_token(token_str, {"type": "checkin", "guest_id": record.guest_id, "time": checked_in_at})
             except Exception:
                 pass
             return result, 200
-            
+
         except Exception as e:
+            db.session.rollback()
             print(f"Checkin error: {str(e)}")
             return {"message": f"Internal error: {str(e)}"}, 500
 
+    def _parse_scanned_at(value, default: datetime) -> datetime:
+        """Parse an ISO scan time from an offline scanner; fall back to ``default``."""
+        if not value or not isinstance(value, str):
+            return default
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return default
+        hanoi_tz = pytz.timezone('Asia/Ho_Chi_Minh')
+        if parsed.tzinfo is None:
+            return hanoi_tz.localize(parsed)
+        return parsed.astimezone(hanoi_tz)
+
+    @app.post("/api/checkin/batch")
+    def checkin_batch():
+        """Replay many buffered scans in one request and one write transaction"""
+        try:
+            body = request.get_json(silent=True)
+            scans = body.get("scans") if isinstance(body, dict) else body
+            if not isinstance(scans, list) or not scans:
+                return {"message": "scans must be a non-empty array"}, 400
+            if len(scans) > CHECKIN_BATCH_MAX_SCANS:
+                return {"message": f"at most {CHECKIN_BATCH_MAX_SCANS} scans per batch"}, 400
+            event_id_param = body.get("event_id") if isinstance(body, dict) else None
+
+            # Resolve every token with one IN query (fresh from DB, also refreshes the index)
+            tokens = [
+                str(scan.get("token") or scan.get("qr_code") or "") if isinstance(scan, dict) else ""
+                for scan in scans
+            ]
+            records = token_index.load_many([t for t in set(tokens) if t])
+
+            guest_ids = sorted({r.guest_id for r in records.values()})
+            existing_times: dict[int, datetime] = {}
+            for chunk in chunked(guest_ids):
+                for guest_id, checked_at in db.session.query(Checkin.guest_id, Checkin.time).filter(Checkin.guest_id.in_(chunk)):
+                    existing_times.setdefault(guest_id, checked_at)
+
+            now = get_hanoi_time()
+            results = []
+            new_rows = []
+            pending: dict[int, dict] = {}  # guest_id -> its "ok" result, until the insert confirms it
+            checked_in_ids: set[int] = set()
+            for index, (scan, token_str) in enumerate(zip(scans, tokens)):
+                if not isinstance(scan, dict):
+                    results.append({"index": index, "token": None, "status": "invalid", "reason": "scan must be an object"})
+                    continue
+                record = records.get(token_str)
+                if not record:
+                    results.append({"index": index, "token": token_str, "status": "invalid", "reason": "invalid token"})
+                    continue
+                if event_id_param and isinstance(event_id_param, int) and record.event_id and record.event_id != event_id_param:
+                    results.append({"index": index, "token": token_str, "status": "invalid", "reason": "guest does not belong to selected event"})
+                    continue
+                checked_in_ids.add(record.guest_id)
+                if record.guest_id in existing_times:
+                    results.append({
+                        "index": index,
+                        "token": token_str,
+                        "status": "already",
+                        "guest": record.guest_payload(),
+                        "checked_in_at": existing_times[record.guest_id].isoformat()
+                    })
+                    continue
+
+                scanned_at = _parse_scanned_at(scan.get("scanned_at"), now)
+                existing_times[record.guest_id] = scanned_at.replace(tzinfo=None)
+                new_rows.append({
+                    "guest_id": record.guest_id,
+                    "time": scanned_at,
+                    "gate": scan.get("gate", "QR Scanner"),
+                    "staff": scan.get("staff", "System"),
+                })
+                pending[record.guest_id] = {
+                    "index": index,
+                    "token": token_str,
+                    "status": "ok",
+                    "guest": record.guest_payload(),
+                    "checked_in_at": existing_times[record.guest_id].isoformat()
+                }
+                results.append(pending[record.guest_id])
+
+            # One transaction: insert skipping guests checked in meanwhile (another gate or
+            # worker), then one status UPDATE per id chunk
+            inserted_ids: set[int] = set()
+            if new_rows:
+                inserted_ids = set(db.session.execute(
+                    insert_ignoring(Checkin, "guest_id").returning(Checkin.guest_id), new_rows
+                ).scalars())
+                raced_ids = sorted(set(pending) - inserted_ids)
+                for chunk in chunked(raced_ids):
+                    for guest_id, checked_at in db.session.query(Checkin.guest_id, Checkin.time).filter(Checkin.guest_id.in_(chunk)):
+                        pending[guest_id].update(status="already", checked_in_at=checked_at.isoformat())
+            for chunk in chunked(sorted(checked_in_ids)):
+                db.session.execute(
+                    update(Guest)
+                    .where(Guest.id.in_(chunk), Guest.checkin_status != "checked_in")
+                    .values(checkin_status="checked_in")
+                    .execution_options(status_only=True, guest_ids=chunk, synchronize_session=False)
+                )
+            db.session.commit()
+            if inserted_ids:
+                batch_cache.invalidate("guests")
+
+            # One event-log transaction for the whole batch, not one fsync per scan
+            try:
+                event_log.publish_many(
+                    (result["token"], {"type": "checkin", "guest_id": result["guest"]["id"], "time": result["checked_in_at"]})
+                    for result in results if result["status"] == "ok"
+                )
+            except Exception as e:
+                print(f"Batch check-in notify error: {e}")
+
+            summary = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "already", "invalid")}
+            print(f"Batch check-in: {len(scans)} scans, {summary}")
+            return {"results": results, "summary": summary}, 200
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"Batch checkin error: {str(e)}")
+            return {"message": f"Internal error: {str(e)}"}, 500
+
     @app.post("/api/checkin/undo")
     def checkin_undo():
         body = request.get_json(silent=True) or {}
@@ -929,6 +971,7 @@ def create_app() -> Flask:
             print(f"Updating guest {guest.id} status from {guest.rsvp_status} to {status}")
             guest.rsvp_status = status
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             result = {"message": "ok", "guest": guest.to_dict()}
             print(f"RSVP success: {result}")
@@ -940,6 +983,7 @@ def create_app() -> Flask:
 
     # Events API
     @app.route("/api/events", methods=["GET"])
+    @replica_read
     def get_events():
         """Lấy danh sách tất cả sự kiện"""
         try:
@@ -1049,6 +1093,7 @@ def create_app() -> Flask:
             
             db.session.add(event)
             db.session.commit()
+            batch_cache.invalidate("events")
             
             return jsonify(event.to_dict()), 201
         except Exception as e:
@@ -1065,6 +1110,17 @@ def create_app() -> Flask:
             print(f"Error getting event: {e}")
             return jsonify({"error": str(e)}), 500
 
+    @app.get("/api/events/<int:event_id>/stats")
+    def get_event_live_stats(event_id: int):
+        """RSVP/check-in counters for one event, read from event_stats (O(1) per event)"""
+        try:
+            if not db.session.query(exists().where(Event.id == event_id)).scalar():
+                return {"message": "Event not found"}, 404
+            return get_event_stats(event_id), 200
+        except Exception as e:
+            print(f"Error getting event stats: {e}")
+            return {"message": f"Error getting event stats: {str(e)}"}, 500
+
     @app.route("/api/events/<int:event_id>", methods=["PUT"])
     @jwt_required
     def update_event(event_id):
@@ -1146,6 +1202,7 @@ def create_app() -> Flask:
                     return jsonify({"error": f"Invalid max_guests value: {str(e)}"}), 400
             
             db.session.commit()
+            batch_cache.invalidate("events")
             return jsonify(event.to_dict()), 200
         except Exception as e:
             db.session.rollback()
@@ -1165,6 +1222,7 @@ def create_app() -> Flask:
             # Xóa sự kiện (cascade delete sẽ tự động xóa khách mời)
             db.session.delete(event)
             db.session.commit()
+            batch_cache.invalidate("events", "guests")
             
             message = f"Event deleted successfully"
             if guest_count > 0:
@@ -1178,12 +1236,81 @@ def create_app() -> Flask:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
 
+    @app.post("/api/events/<int:event_id>/tokens")
+    @jwt_required
+    def provision_event_tokens(event_id: int):
+        """Tạo token cho mọi khách của sự kiện chưa có token, trả về {guest_id: token}"""
+        try:
+            if not db.session.query(exists().where(Event.id == event_id)).scalar():
+                return {"message": "Event not found"}, 404
+
+            guest_ids = [guest_id for (guest_id,) in db.session.query(Guest.id).filter(Guest.event_id == event_id)]
+            # Candidates generated in memory, collision-checked in one query, inserted in one transaction
+            mapping, created = provision_tokens(guest_ids)
+            db.session.commit()
+
+            print(f"Provisioned {created} tokens for event {event_id} ({len(mapping)} guests)")
+            return {
+                "event_id": event_id,
+                "created": created,
+                "total": len(mapping),
+                "tokens": {str(guest_id): token_str for guest_id, token_str in mapping.items()}
+            }, 200
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error provisioning tokens: {e}")
+            return {"message": f"Error provisioning tokens: {str(e)}"}, 500
+
+    @app.get("/api/events/<int:event_id>/qr-pack")
+    @jwt_required
+    def export_event_qr_pack(event_id: int):
+        """Tải toàn bộ QR của sự kiện: ZIP các file PNG (mặc định) hoặc PDF nhiều trang (?format=pdf)"""
+        try:
+            event = Event.query.get(event_id)
+            if not event:
+                return {"message": "Event not found"}, 404
+            export_format = (request.args.get("format") or "zip").lower()
+            if export_format not in ("zip", "pdf"):
+                return {"message": "format must be zip or pdf"}, 400
+
+            # Missing tokens for the whole event are created with one bulk insert
+            guests, created = event_guest_tokens(event_id)
+            if created:
+                db.session.commit()
+            event_name = event.name
+            print(f"QR pack for event {event_id}: {len(guests)} guests, {created} new tokens, format={export_format}")
+
+            if export_format == "pdf":
+                body = stream_qr_pdf(guests, event_name)
+                mimetype = "application/pdf"
+            else:
+                body = stream_qr_zip(guests)
+                mimetype = "application/zip"
+            headers = {
+                "Content-Disposition": f'attachment; filename="qr_event_{event_id}.{export_format}"',
+                "X-Accel-Buffering": "no",
+            }
+            return app.response_class(body, mimetype=mimetype, headers=headers)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error exporting QR pack: {e}")
+            return {"message": f"Error exporting QR pack: {str(e)}"}, 500
+
     # Bulk Operations
+    def _requested_guest_ids(data: dict) -> list[int]:
+        ids = set()
+        for raw in data.get("guest_ids", []) or []:
+            try:
+                ids.add(int(raw))
+            except (TypeError, ValueError):
+                continue
+        return sorted(ids)
+
     @app.post("/api/guests/bulk-checkin")
     def bulk_checkin():
         try:
             data = request.get_json(silent=True) or {}
-            guest_ids = data.get("guest_ids", [])
+            guest_ids = _requested_guest_ids(data)
             event_id = data.get("event_id")
             
             if not guest_ids:
@@ -1192,53 +1319,48 @@ def create_app() -> Flask:
             if not event_id:
                 return {"message": "Event ID is required"}, 400
             
-            # Get guests
-            guests = Guest.query.filter(Guest.id.in_(guest_ids)).all()
+            # One query per id chunk for the guests and one for their existing check-ins
+            guests: dict[int, str] = {}
+            existing: dict[int, datetime] = {}
+            for chunk in chunked(guest_ids):
+                guests.update(db.session.query(Guest.id, Guest.name).filter(Guest.id.in_(chunk)).all())
+                for guest_id, checked_at in db.session.query(Checkin.guest_id, Checkin.time).filter(Checkin.guest_id.in_(chunk)):
+                    existing.setdefault(guest_id, checked_at)
             if not guests:
                 return {"message": "No guests found"}, 404
             
-            # Create check-in records and update status
-            checkin_count = 0
-            status_updated_count = 0
-            already_checked_in = []
-            
-            for guest in guests:
-                print(f"Processing guest {guest.id} ({guest.name}) with checkin_status: '{guest.checkin_status}'")
-                # Check if already checked in
-                existing_checkin = Checkin.query.filter_by(guest_id=guest.id).first()
-                if not existing_checkin:
-                    # Create new check-in record
-                    checkin = Checkin(
-                        guest_id=guest.id,
-                        time=datetime.now(pytz.timezone('Asia/Ho_Chi_Minh')),
-                        gate="Bulk",
-                        staff="System"
-                    )
-                    db.session.add(checkin)
-                    checkin_count += 1
-                    print(f"Created check-in record for guest {guest.id} ({guest.name})")
-                    
-                    # Update guest checkin_status to "checked_in"
-                    print(f"Updating guest {guest.id} ({guest.name}) checkin_status from '{guest.checkin_status}' to 'checked_in'")
-                    guest.checkin_status = "checked_in"
-                    status_updated_count += 1
-                    print(f"Updated guest {guest.id} ({guest.name}) status to checked_in. Final status: '{guest.checkin_status}'")
-                else:
-                    # Guest already checked in
-                    print(f"Guest {guest.id} ({guest.name}) already checked in with status: '{guest.checkin_status}'")
-                    already_checked_in.append({
-                        "id": guest.id,
-                        "name": guest.name,
-                        "checkin_time": existing_checkin.time.isoformat()
-                    })
-                    print(f"Guest {guest.id} ({guest.name}) already checked in at {existing_checkin.time} with status: '{guest.checkin_status}'")
+            new_ids = [guest_id for guest_id in guests if guest_id not in existing]
             
+            # One transaction: executemany insert skipping guests checked in meanwhile (a scan
+            # at a gate or another worker), then a set-based status update for the inserted ids
+            now = datetime.now(pytz.timezone('Asia/Ho_Chi_Minh'))
+            inserted_ids: list[int] = []
+            if new_ids:
+                inserted_ids = list(db.session.execute(
+                    insert_ignoring(Checkin, "guest_id").returning(Checkin.guest_id),
+                    [{"guest_id": guest_id, "time": now, "gate": "Bulk", "staff": "System"} for guest_id in new_ids]
+                ).scalars())
+                raced_ids = sorted(set(new_ids) - set(inserted_ids))
+                for chunk in chunked(raced_ids):
+                    existing.update(db.session.query(Checkin.guest_id, Checkin.time).filter(Checkin.guest_id.in_(chunk)))
+            already_checked_in = [
+                {"id": guest_id, "name": guests[guest_id], "checkin_time": existing[guest_id].isoformat()}
+                for guest_id in guests if guest_id in existing
+            ]
+            status_updated_count = 0
+            for chunk in chunked(inserted_ids):
+                status_updated_count += db.session.execute(
+                    update(Guest)
+                    .where(Guest.id.in_(chunk))
+                    .values(checkin_status="checked_in")
+                    .execution_options(status_only=True, guest_ids=chunk, synchronize_session=False)
+                ).rowcount
             db.session.commit()
+            if inserted_ids:
+                batch_cache.invalidate("guests")
+            checkin_count = len(inserted_ids)
             
             print(f"Bulk check-in: {checkin_count} new check-ins, {status_updated_count} status updates, {len(already_checked_in)} already checked in")
-            print(f"Final status summary:")
-            for guest in guests:
-                print(f"  Guest {guest.id} ({guest.name}): checkin_status = '{guest.checkin_status}'")
             
             # Prepare response message
             if len(already_checked_in) > 0:
@@ -1256,6 +1378,7 @@ def create_app() -> Flask:
             }, 200
             
         except Exception as e:
+            db.session.rollback()
             print(f"Error in bulk check-in: {e}")
             return {"message": f"Error in bulk check-in: {str(e)}"}, 500
 
@@ -1263,36 +1386,31 @@ def create_app() -> Flask:
     def bulk_checkout():
         try:
             data = request.get_json(silent=True) or {}
-            guest_ids = data.get("guest_ids", [])
+            guest_ids = _requested_guest_ids(data)
             
             if not guest_ids:
                 return {"message": "No guests selected"}, 400
             
-            # Get guests
-            guests = Guest.query.filter(Guest.id.in_(guest_ids)).all()
-            if not guests:
-                return {"message": "No guests found"}, 404
-            
-            # Update status to checked_out
+            # UPDATE ... WHERE id IN (...) per chunk, committed once
             checkout_count = 0
-            for guest in guests:
-                print(f"Processing guest {guest.id} ({guest.name}) with checkin_status: '{guest.checkin_status}'")
-                
-                # Update guest checkin_status to checked_out
-                print(f"Updating guest {guest.id} ({guest.name}) checkin_status from '{guest.checkin_status}' to 'checked_out'")
-                guest.checkin_status = "checked_out"
-                print(f"Guest {guest.id} checkin_status is now: '{guest.checkin_status}'")
-                checkout_count += 1
-            
+            for chunk in chunked(guest_ids):
+                checkout_count += db.session.execute(
+                    update(Guest)
+                    .where(Guest.id.in_(chunk))
+                    .values(checkin_status="checked_out")
+                    .execution_options(status_only=True, guest_ids=chunk, synchronize_session=False)
+                ).rowcount
+            if not checkout_count:
+                db.session.rollback()
+                return {"message": "No guests found"}, 404
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Bulk check-out: {checkout_count} guests")
-            print(f"Final status summary:")
-            for guest in guests:
-                print(f"  Guest {guest.id} ({guest.name}): checkin_status = '{guest.checkin_status}'")
             return {"message": f"Successfully checked out {checkout_count} guests", "count": checkout_count}, 200
             
         except Exception as e:
+            db.session.rollback()
             print(f"Error in bulk check-out: {e}")
             return {"message": f"Error in bulk check-out: {str(e)}"}, 500
 
@@ -1300,33 +1418,30 @@ def create_app() -> Flask:
     def bulk_delete():
         try:
             data = request.get_json(silent=True) or {}
-            guest_ids = data.get("guest_ids", [])
+            guest_ids = _requested_guest_ids(data)
             
             if not guest_ids:
                 return {"message": "No guests selected"}, 400
             
-            # Get guests
-            guests = Guest.query.filter(Guest.id.in_(guest_ids)).all()
-            if not guests:
-                return {"message": "No guests found"}, 404
-            
-            # Delete guests and their check-ins
+            # Delete check-ins, tokens and guests with one DELETE per id chunk each
             delete_count = 0
-            for guest in guests:
-                print(f"Deleting guest {guest.id} ({guest.name}) with checkin_status: '{guest.checkin_status}'")
-                # Delete check-in records first
-                Checkin.query.filter_by(guest_id=guest.id).delete()
-                
-                # Delete guest
-                db.session.delete(guest)
-                delete_count += 1
-            
+            for chunk in chunked(guest_ids):
+                db.session.execute(delete(Checkin).where(Checkin.guest_id.in_(chunk)).execution_options(synchronize_session=False))
+                db.session.execute(delete(Token).where(Token.guest_id.in_(chunk)).execution_options(guest_ids=chunk, synchronize_session=False))
+                delete_count += db.session.execute(
+                    delete(Guest).where(Guest.id.in_(chunk)).execution_options(guest_ids=chunk, synchronize_session=False)
+                ).rowcount
+            if not delete_count:
+                db.session.rollback()
+                return {"message": "No guests found"}, 404
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Bulk delete: {delete_count} guests")
             return {"message": f"Successfully deleted {delete_count} guests", "count": delete_count}, 200
             
         except Exception as e:
+            db.session.rollback()
             print(f"Error in bulk delete: {e}")
             return {"message": f"Error in bulk delete: {str(e)}"}, 500
 
@@ -1334,7 +1449,7 @@ def create_app() -> Flask:
     def bulk_update_rsvp():
         try:
             data = request.get_json(silent=True) or {}
-            guest_ids = data.get("guest_ids", [])
+            guest_ids = _requested_guest_ids(data)
             rsvp_status = data.get("rsvp_status", "pending")
             
             if not guest_ids:
@@ -1343,73 +1458,45 @@ def create_app() -> Flask:
             if rsvp_status not in ["pending", "accepted", "declined"]:
                 return {"message": "Invalid RSVP status"}, 400
             
-            # Get guests
-            guests = Guest.query.filter(Guest.id.in_(guest_ids)).all()
-            if not guests:
-                return {"message": "No guests found"}, 404
-            
-            # Update RSVP status
             update_count = 0
-            for guest in guests:
-                print(f"Updating guest {guest.name}: rsvp_status from {guest.rsvp_status} to {rsvp_status}")
-                guest.rsvp_status = rsvp_status
-                update_count += 1
-            
+            for chunk in chunked(guest_ids):
+                update_count += db.session.execute(
+                    update(Guest)
+                    .where(Guest.id.in_(chunk))
+                    .values(rsvp_status=rsvp_status)
+                    .execution_options(status_only=True, guest_ids=chunk, synchronize_session=False)
+                ).rowcount
+            if not update_count:
+                db.session.rollback()
+                return {"message": "No guests found"}, 404
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Bulk RSVP update: {update_count} guests updated to {rsvp_status}")
             return {"message": f"Successfully updated {update_count} guests to {rsvp_status}", "count": update_count}, 200
             
         except Exception as e:
+            db.session.rollback()
             print(f"Error in bulk RSVP update: {e}")
             return {"message": f"Error in bulk RSVP update: {str(e)}"}, 500
 
     @app.get("/api/invite/<token>")
     def get_invite_data(token):
         try:
-            # Find token
-            tok = Token.query.filter_by(token=token).first()
-            if not tok:
-                return {"error": "Invalid token"}, 404
-            
-            # Get guest
-            guest = Guest.query.get(tok.guest_id)
-            if not guest:
-                return {"error": "Guest not found"}, 404
-            
-            # Get event
-            event = None
-            if guest.event_id:
-                event = Event.query.get(guest.event_id)
-            
-            if not event:
-                return {"error": "Event not found"}, 404
-            
-            # Check if guest is still active in the event
-            # This prevents deleted guests from accessing invitations
-            if guest.event_id != event.id:
-                return {"error": "Guest is no longer associated with this event"}, 404
-            
-            # Prepare response
-            response = {
-                "token": token,
-                "event": event.to_dict(),
-                "guest": {
-                    "id": guest.id,
-                    "name": guest.name,
-                    "email": guest.email,
-                    "title": guest.title or "Ông/Bà",
-                    "role": guest.role or "Khách mời",
-                    "organization": guest.organization or "",
-                    "group_tag": guest.tag or "",
-                    "is_vip": guest.tag == "VIP" if guest.tag else False,
-                    "rsvp_status": guest.rsvp_status or "pending",
-                    "checkin_status": guest.checkin_status or "not_arrived",
-                    "event_content": guest.event_content or ""
-                }
-            }
-            
-            return response, 200
+            # Token, guest and event in one joined query, then served from invite_cache
+            # until one of them is written (or INVITE_CACHE_TTL passes)
+            payload, error = invite_cache.get(token)
+            if payload is None:
+                return {"error": error}, 404
+
+            # Pages are revalidated on every open: unchanged ones get an empty 304
+            if request.if_none_match.contains(payload.etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(payload.body, mimetype="application/json")
+            response.set_etag(payload.etag)
+            response.cache_control.no_cache = True
+            return response
             
         except Exception as e:
             print(f"Error getting invite data: {e}")
@@ -1442,6 +1529,7 @@ def create_app() -> Flask:
             guest.rsvp_status = rsvp_status
             
             db.session.commit()
+            batch_cache.invalidate("guests")
             
             print(f"Successfully updated guest {guest.name} RSVP to {rsvp_status}")
             return {"message": "RSVP updated successfully", "guest": guest.to_dict()}, 200
@@ -1456,7 +1544,10 @@ def create_app() -> Flask:
     return app
 
 
-app = create_app()
+# Helper processes (QR render pool, see qr_render.py) load this file as __mp_main__ under
+# `python app.py`; they only need importable functions, not a second app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     with app.app_context():
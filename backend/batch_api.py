@@ -1,46 +1,46 @@
 # Batch Loading API for Preload Pagination
 # Tối ưu API để hỗ trợ batch loading nhiều trang cùng lúc
 
-from flask import Blueprint, request, jsonify
-from sqlalchemy import and_, or_, desc, asc
+from flask import Blueprint, current_app, g, request, jsonify
+from sqlalchemy import and_, or_, desc, asc, func, literal
 from sqlalchemy.orm import joinedload
 from models import Guest, Event, Checkin, db
+from batch_cache import batch_cache
+from db_replica import read_replica, replica_read
+from event_counters import get_event_stats
+from guest_search import search_condition
 from datetime import datetime, timedelta
+import base64
 import json
-import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 batch_bp = Blueprint('batch', __name__, url_prefix='/api/batch')
 
-# Cache for batch requests (in production, use Redis)
-batch_cache = {}
-CACHE_TTL = 300  # 5 minutes
+# Entities each batch endpoint reads; a write to any of them invalidates its cached pages
+CACHE_DEPENDS = {
+    'guests': ('guests', 'events'),
+    'events': ('events',),
+    'checkin': ('guests', 'events'),
+}
 
 def get_cache_key(endpoint: str, params: Dict[str, Any]) -> str:
     """Generate cache key for batch request"""
-    sorted_params = sorted(params.items())
-    return f"{endpoint}:{hash(str(sorted_params))}"
-
-def is_cache_valid(cache_entry: Dict[str, Any]) -> bool:
-    """Check if cache entry is still valid"""
-    return time.time() - cache_entry['timestamp'] < CACHE_TTL
-
-def get_cached_data(cache_key: str) -> Optional[Dict[str, Any]]:
-    """Get cached data if valid"""
-    if cache_key in batch_cache:
-        cache_entry = batch_cache[cache_key]
-        if is_cache_valid(cache_entry):
-            return cache_entry['data']
-        else:
-            del batch_cache[cache_key]
-    return None
-
-def set_cached_data(cache_key: str, data: Dict[str, Any]) -> None:
-    """Set cached data"""
-    batch_cache[cache_key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
+    return batch_cache.key_for(endpoint, params, CACHE_DEPENDS[endpoint])
+
+def get_cached_response(cache_key: str):
+    """Cached JSON response if present and fresh"""
+    if g.get('db_read_primary_for_client'):
+        return None  # may have been built from a replica that lacks this client's last write
+    body = batch_cache.get(cache_key)
+    if body is None:
+        return None
+    return current_app.response_class(body, mimetype='application/json')
+
+def cache_response(endpoint: str, cache_key: str, data: Dict[str, Any]):
+    """Serialize once, cache the bytes and return the response"""
+    response = jsonify(data)
+    batch_cache.set(cache_key, response.get_data(), CACHE_DEPENDS[endpoint], ttl=read_replica.cache_ttl(batch_cache.ttl))
+    return response
 
 def build_guests_query(filters: Dict[str, Any]):
     """Build query for guests with filters"""
@@ -50,19 +50,11 @@ def build_guests_query(filters: Dict[str, Any]):
     if filters.get('event_id'):
         query = query.filter(Guest.event_id == filters['event_id'])
     
-    # Search filter
+    # Search filter (full-text index, see guest_search.py)
     if filters.get('search'):
-        search_term = f"%{filters['search']}%"
-        query = query.filter(
-            or_(
-                Guest.name.ilike(search_term),
-                Guest.email.ilike(search_term),
-                Guest.phone.ilike(search_term),
-                Guest.role.ilike(search_term),
-                Guest.company.ilike(search_term),
-                Guest.tag.ilike(search_term)
-            )
-        )
+        condition = search_condition(filters['search'])
+        if condition is not None:
+            query = query.filter(condition)
     
     # Status filter
     if filters.get('status') and filters['status'] != 'all':
@@ -92,8 +84,8 @@ def build_events_query(filters: Dict[str, Any]):
         query = query.filter(
             or_(
                 Event.name.ilike(search_term),
-                Event.description.ilike(search_term),
-                Event.location.ilike(search_term)
+                Event.location.ilike(search_term),
+                Event.venue_address.ilike(search_term)
             )
         )
     
@@ -129,19 +121,11 @@ def build_checkin_query(filters: Dict[str, Any]):
     if filters.get('event_id'):
         query = query.filter(Guest.event_id == filters['event_id'])
     
-    # Search filter
+    # Search filter (full-text index, see guest_search.py)
     if filters.get('search'):
-        search_term = f"%{filters['search']}%"
-        query = query.filter(
-            or_(
-                Guest.name.ilike(search_term),
-                Guest.email.ilike(search_term),
-                Guest.phone.ilike(search_term),
-                Guest.role.ilike(search_term),
-                Guest.company.ilike(search_term),
-                Guest.tag.ilike(search_term)
-            )
-        )
+        condition = search_condition(filters['search'])
+        if condition is not None:
+            query = query.filter(condition)
     
     # Status filter
     if filters.get('status') and filters['status'] != 'all':
@@ -158,7 +142,7 @@ def build_checkin_query(filters: Dict[str, Any]):
     return query
 
 def serialize_guest(guest: Guest) -> Dict[str, Any]:
-    """Serialize guest object"""
+    """Serialize guest object (list queries should joinedload Guest.event)"""
     return {
         'id': guest.id,
         'name': guest.name,
@@ -181,7 +165,6 @@ def serialize_event(event: Event) -> Dict[str, Any]:
     return {
         'id': event.id,
         'name': event.name,
-        'description': event.description,
         'date': event.date.isoformat() if event.date else None,
         'time': event.time.isoformat() if event.time else None,
         'location': event.location,
@@ -194,242 +177,281 @@ def serialize_event(event: Event) -> Dict[str, Any]:
         'created_at': event.created_at.isoformat() if event.created_at else None
     }
 
+def encode_cursor(last_id: int, page: int) -> str:
+    """Opaque cursor pointing just after row ``last_id``, the last row of ``page``"""
+    raw = json.dumps({'id': last_id, 'page': page}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """(last_id, page) from a cursor; ValueError if it was not issued by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value = json.loads(raw)
+        return int(value['id']), int(value['page'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def get_cached_count(endpoint: str, query, filters: Dict[str, Any]) -> int:
+    """Row count for a filter set, cached until the entities it reads change"""
+    cache_key = batch_cache.key_for(f'{endpoint}_count', {'filters': filters}, CACHE_DEPENDS[endpoint])
+    cached = None if g.get('db_read_primary_for_client') else batch_cache.get(cache_key)
+    if cached is not None:
+        return int(cached)
+    total_items = query.order_by(None).count()
+    batch_cache.set(cache_key, str(total_items).encode('ascii'), CACHE_DEPENDS[endpoint],
+                    ttl=read_replica.cache_ttl(batch_cache.ttl))
+    return total_items
+
+def requested_pages(data: Dict[str, Any]) -> Tuple[List[int], int, int]:
+    """(pages, after_id, after_page) for a batch request; ValueError for pages the cursor cannot reach.
+
+    Pages are read with an index seek from the cursor (or from the first row), so
+    they must run without gaps from the page after the cursor's page.
+    """
+    after_id, after_page = decode_cursor(data['cursor']) if data.get('cursor') else (0, 0)
+    pages = sorted({page for page in data.get('pages', []) if isinstance(page, int)})
+    if pages != list(range(after_page + 1, after_page + 1 + len(pages))):
+        raise ValueError(
+            f'Pages must run without gaps from page {after_page + 1}; '
+            'send the cursor of the page before the first page you want'
+        )
+    return pages, after_id, after_page
+
+def load_pages(endpoint: str, query, model, serialize, data: Dict[str, Any],
+               options: Tuple = ()) -> Dict[str, Any]:
+    """Keyset pagination ordered by id: one range scan from the cursor, no OFFSET.
+
+    With the cursor returned for page P, pages P+1.. start from an index seek on
+    id, so deep pages cost the same as the first one.
+    """
+    pages = data.get('pages', [])
+    items_per_page = data.get('items_per_page', 10)
+    filters = data.get('filters', {})
+    wanted, after_id, _ = requested_pages(data)
+
+    # Loader options (e.g. joinedload) apply to the page scans only, not to the count
+    run = (
+        query.options(*options)
+        .filter(model.id > after_id)
+        .order_by(model.id.asc())
+        .limit(len(wanted) * items_per_page + 1)
+        .all()
+    )
+    rows_by_page: Dict[int, list] = {}
+    for index, page in enumerate(wanted):
+        rows_by_page[page] = run[index * items_per_page:(index + 1) * items_per_page]
+    has_more = len(run) > len(wanted) * items_per_page
+
+    result = {}
+    cursors = {}
+    for page in pages:
+        rows = rows_by_page.get(page, [])
+        result[page] = [serialize(row) for row in rows]
+        if rows:
+            cursors[page] = encode_cursor(rows[-1].id, page)
+
+    last_page = wanted[-1] if wanted else None
+    pagination = {
+        'items_per_page': items_per_page,
+        'loaded_pages': pages,
+        'cursors': cursors,
+        'next_cursor': cursors.get(last_page) if has_more else None,
+        'has_more': has_more,
+    }
+    if data.get('include_count', True):
+        total_items = get_cached_count(endpoint, query, filters)
+        pagination['total_items'] = total_items
+        pagination['total_pages'] = (total_items + items_per_page - 1) // items_per_page
+
+    return {'data': result, 'pagination': pagination}
+
+def batch_pages_response(endpoint: str, build_query, model, serialize, options: Tuple = ()):
+    """Shared body of the batch page endpoints: validate, check cache, load, cache"""
+    data = request.get_json()
+    pages = data.get('pages', [])
+
+    if not pages:
+        return jsonify({'error': 'No pages specified'}), 400
+    try:
+        requested_pages(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Generate cache key
+    cache_key = get_cache_key(endpoint, {
+        'pages': sorted(pages),
+        'items_per_page': data.get('items_per_page', 10),
+        'filters': data.get('filters', {}),
+        'cursor': data.get('cursor'),
+        'include_count': data.get('include_count', True),
+    })
+
+    # Check cache first
+    cached_response = get_cached_response(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    query = build_query(data.get('filters', {}))
+    response_data = load_pages(endpoint, query, model, serialize, data, options)
+
+    # Cache the result
+    return cache_response(endpoint, cache_key, response_data)
+
 @batch_bp.route('/guests', methods=['POST'])
+@replica_read
 def batch_get_guests():
     """Batch get guests for multiple pages"""
     try:
-        data = request.get_json()
-        pages = data.get('pages', [])
-        items_per_page = data.get('items_per_page', 10)
-        filters = data.get('filters', {})
-        
-        if not pages:
-            return jsonify({'error': 'No pages specified'}), 400
-        
-        # Generate cache key
-        cache_key = get_cache_key('guests', {
-            'pages': sorted(pages),
-            'items_per_page': items_per_page,
-            'filters': filters
-        })
-        
-        # Check cache first
-        cached_data = get_cached_data(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
-        
-        # Build base query
-        query = build_guests_query(filters)
-        
-        # Get total count
-        total_items = query.count()
-        total_pages = (total_items + items_per_page - 1) // items_per_page
-        
-        # Get data for requested pages
-        result = {}
-        for page in pages:
-            if page < 1 or page > total_pages:
-                result[page] = []
-                continue
-            
-            offset = (page - 1) * items_per_page
-            page_query = query.offset(offset).limit(items_per_page)
-            guests = page_query.all()
-            
-            result[page] = [serialize_guest(guest) for guest in guests]
-        
-        response_data = {
-            'data': result,
-            'pagination': {
-                'total_items': total_items,
-                'total_pages': total_pages,
-                'items_per_page': items_per_page,
-                'loaded_pages': pages
-            }
-        }
-        
-        # Cache the result
-        set_cached_data(cache_key, response_data)
-        
-        return jsonify(response_data)
-        
+        return batch_pages_response('guests', build_guests_query, Guest, serialize_guest,
+                                    options=(joinedload(Guest.event),))
     except Exception as e:
         print(f"Error in batch_get_guests: {e}")
         return jsonify({'error': str(e)}), 500
 
 @batch_bp.route('/events', methods=['POST'])
+@replica_read
 def batch_get_events():
     """Batch get events for multiple pages"""
     try:
-        data = request.get_json()
-        pages = data.get('pages', [])
-        items_per_page = data.get('items_per_page', 10)
-        filters = data.get('filters', {})
-        
-        if not pages:
-            return jsonify({'error': 'No pages specified'}), 400
-        
-        # Generate cache key
-        cache_key = get_cache_key('events', {
-            'pages': sorted(pages),
-            'items_per_page': items_per_page,
-            'filters': filters
-        })
-        
-        # Check cache first
-        cached_data = get_cached_data(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
-        
-        # Build base query
-        query = build_events_query(filters)
-        
-        # Get total count
-        total_items = query.count()
-        total_pages = (total_items + items_per_page - 1) // items_per_page
-        
-        # Get data for requested pages
-        result = {}
-        for page in pages:
-            if page < 1 or page > total_pages:
-                result[page] = []
-                continue
-            
-            offset = (page - 1) * items_per_page
-            page_query = query.offset(offset).limit(items_per_page)
-            events = page_query.all()
-            
-            result[page] = [serialize_event(event) for event in events]
-        
-        response_data = {
-            'data': result,
-            'pagination': {
-                'total_items': total_items,
-                'total_pages': total_pages,
-                'items_per_page': items_per_page,
-                'loaded_pages': pages
-            }
-        }
-        
-        # Cache the result
-        set_cached_data(cache_key, response_data)
-        
-        return jsonify(response_data)
-        
+        return batch_pages_response('events', build_events_query, Event, serialize_event)
     except Exception as e:
         print(f"Error in batch_get_events: {e}")
         return jsonify({'error': str(e)}), 500
 
 @batch_bp.route('/checkin', methods=['POST'])
+@replica_read
 def batch_get_checkin():
     """Batch get checked-in guests for multiple pages"""
     try:
-        data = request.get_json()
-        pages = data.get('pages', [])
-        items_per_page = data.get('items_per_page', 10)
-        filters = data.get('filters', {})
-        
-        if not pages:
-            return jsonify({'error': 'No pages specified'}), 400
-        
-        # Generate cache key
-        cache_key = get_cache_key('checkin', {
-            'pages': sorted(pages),
-            'items_per_page': items_per_page,
-            'filters': filters
-        })
-        
-        # Check cache first
-        cached_data = get_cached_data(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
-        
-        # Build base query
-        query = build_checkin_query(filters)
-        
-        # Get total count
-        total_items = query.count()
-        total_pages = (total_items + items_per_page - 1) // items_per_page
-        
-        # Get data for requested pages
-        result = {}
-        for page in pages:
-            if page < 1 or page > total_pages:
-                result[page] = []
-                continue
-            
-            offset = (page - 1) * items_per_page
-            page_query = query.offset(offset).limit(items_per_page)
-            guests = page_query.all()
-            
-            result[page] = [serialize_guest(guest) for guest in guests]
-        
-        response_data = {
-            'data': result,
-            'pagination': {
-                'total_items': total_items,
-                'total_pages': total_pages,
-                'items_per_page': items_per_page,
-                'loaded_pages': pages
-            }
-        }
-        
-        # Cache the result
-        set_cached_data(cache_key, response_data)
-        
-        return jsonify(response_data)
-        
+        return batch_pages_response('checkin', build_checkin_query, Guest, serialize_guest,
+                                    options=(joinedload(Guest.event),))
     except Exception as e:
         print(f"Error in batch_get_checkin: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Optional per-group breakdown for guest stats: group_by value -> column
+STATS_GROUP_COLUMNS = {
+    'event': Guest.event_id,
+    'tag': Guest.tag,
+    'organization': Guest.organization,
+}
+
+def guest_status_counts(rows) -> Dict[Any, Dict[Tuple[str, str], int]]:
+    """{group: {(rsvp_status, checkin_status): count}} from GROUP BY rows"""
+    counts: Dict[Any, Dict[Tuple[str, str], int]] = {}
+    for group, rsvp_status, checkin_status, count in rows:
+        counts.setdefault(group, {})[(rsvp_status, checkin_status)] = count
+    return counts
+
+def summarize_guests(counts: Dict[Tuple[str, str], int]) -> Dict[str, int]:
+    return {
+        'total': sum(counts.values()),
+        'accepted': sum(n for (rsvp, _), n in counts.items() if rsvp == 'accepted'),
+        'declined': sum(n for (rsvp, _), n in counts.items() if rsvp == 'declined'),
+        'pending': sum(n for (rsvp, _), n in counts.items() if rsvp == 'pending'),
+        'checked_in': sum(n for (_, status), n in counts.items() if status in ('checked_in', 'checked_out'))
+    }
+
+def summarize_checkin(counts: Dict[Tuple[str, str], int]) -> Dict[str, int]:
+    return {
+        'total': sum(counts.values()),
+        'checked_in': sum(n for (_, status), n in counts.items() if status in ('checked_in', 'checked_out')),
+        'not_checked_in': sum(n for (_, status), n in counts.items() if status == 'not_arrived')
+    }
+
+def grouped_guest_stats(query, summarize, group_by: Optional[str]) -> Dict[str, Any]:
+    """Status totals from one GROUP BY query, plus a per-group breakdown if requested"""
+    group_column = STATS_GROUP_COLUMNS.get(group_by)
+    group_key = group_column if group_column is not None else literal(None)
+    rows = (
+        query.order_by(None)
+        .with_entities(group_key, Guest.rsvp_status, Guest.checkin_status, func.count(Guest.id))
+        .group_by(group_key, Guest.rsvp_status, Guest.checkin_status)
+        .all()
+    )
+    counts = guest_status_counts(rows)
+    overall: Dict[Tuple[str, str], int] = {}
+    for group_counts in counts.values():
+        for statuses, n in group_counts.items():
+            overall[statuses] = overall.get(statuses, 0) + n
+
+    stats = summarize(overall)
+    if group_column is not None:
+        stats['breakdown'] = {
+            str(group) if group is not None else 'none': summarize(group_counts)
+            for group, group_counts in counts.items()
+        }
+    return stats
+
+def counter_stats(filters: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """event_stats row when the filters select exactly one whole event, else None"""
+    if not filters.get('event_id'):
+        return None
+    narrowing = [key for key, value in filters.items()
+                 if key != 'event_id' and value not in (None, '', 'all')]
+    if narrowing:
+        return None
+    return get_event_stats(int(filters['event_id']))
+
 @batch_bp.route('/stats', methods=['POST'])
+@replica_read
 def batch_get_stats():
     """Batch get statistics for multiple entities"""
     try:
         data = request.get_json()
         entities = data.get('entities', [])  # ['guests', 'events', 'checkin']
         filters = data.get('filters', {})
+        group_by = data.get('group_by')  # optional: 'event', 'tag' or 'organization'
         
         if not entities:
             return jsonify({'error': 'No entities specified'}), 400
+        if group_by is not None and group_by not in STATS_GROUP_COLUMNS:
+            return jsonify({'error': f"group_by must be one of {', '.join(STATS_GROUP_COLUMNS)}"}), 400
         
         result = {}
         
+        # Every count is a GROUP BY in SQL: constant memory whatever the number of rows
         for entity in entities:
-            if entity == 'guests':
-                query = build_guests_query(filters)
-                guests = query.all()
-                
+            # Single-event dashboards read the trigger-maintained counters instead
+            counters = counter_stats(filters) if group_by is None and entity in ('guests', 'checkin') else None
+            if entity == 'guests' and counters is not None:
                 result['guests'] = {
-                    'total': len(guests),
-                    'accepted': len([g for g in guests if g.rsvp_status == 'accepted']),
-                    'declined': len([g for g in guests if g.rsvp_status == 'declined']),
-                    'pending': len([g for g in guests if g.rsvp_status == 'pending']),
-                    'checked_in': len([g for g in guests if g.checkin_status in ['checked_in', 'checked_out']])
+                    'total': counters['total'],
+                    'accepted': counters['accepted'],
+                    'declined': counters['declined'],
+                    'pending': counters['pending'],
+                    'checked_in': counters['checked_in'] + counters['checked_out']
+                }
+
+            elif entity == 'checkin' and counters is not None:
+                result['checkin'] = {
+                    'total': counters['total'],
+                    'checked_in': counters['checked_in'] + counters['checked_out'],
+                    'not_checked_in': counters['not_arrived']
                 }
+
+            elif entity == 'guests':
+                result['guests'] = grouped_guest_stats(build_guests_query(filters), summarize_guests, group_by)
                 
             elif entity == 'events':
                 query = build_events_query(filters)
-                events = query.all()
+                counts = dict(
+                    query.order_by(None)
+                    .with_entities(Event.status, func.count(Event.id))
+                    .group_by(Event.status)
+                    .all()
+                )
                 
                 result['events'] = {
-                    'total': len(events),
-                    'upcoming': len([e for e in events if e.status == 'upcoming']),
-                    'ongoing': len([e for e in events if e.status == 'ongoing']),
-                    'completed': len([e for e in events if e.status == 'completed']),
-                    'cancelled': len([e for e in events if e.status == 'cancelled'])
+                    'total': sum(counts.values()),
+                    'upcoming': counts.get('upcoming', 0),
+                    'ongoing': counts.get('ongoing', 0),
+                    'completed': counts.get('completed', 0),
+                    'cancelled': counts.get('cancelled', 0)
                 }
                 
             elif entity == 'checkin':
-                query = build_checkin_query(filters)
-                guests = query.all()
-                
-                result['checkin'] = {
-                    'total': len(guests),
-                    'checked_in': len([g for g in guests if g.checkin_status in ['checked_in', 'checked_out']]),
-                    'not_checked_in': len([g for g in guests if g.checkin_status == 'not_arrived'])
-                }
+                result['checkin'] = grouped_guest_stats(build_checkin_query(filters), summarize_checkin, group_by)
         
         return jsonify(result)
         
@@ -441,7 +463,6 @@ def batch_get_stats():
 def clear_cache():
     """Clear batch cache"""
     try:
-        global batch_cache
         batch_cache.clear()
         return jsonify({'message': 'Cache cleared successfully'})
     except Exception as e:
@@ -452,14 +473,7 @@ def clear_cache():
 def cache_stats():
     """Get cache statistics"""
     try:
-        total_entries = len(batch_cache)
-        total_size = sum(len(str(entry)) for entry in batch_cache.values())
-        
-        return jsonify({
-            'total_entries': total_entries,
-            'total_size_bytes': total_size,
-            'cache_ttl_seconds': CACHE_TTL
-        })
+        return jsonify(batch_cache.stats())
     except Exception as e:
         print(f"Error getting cache stats: {e}")
         return jsonify({'error': str(e)}), 500
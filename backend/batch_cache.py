@@ -0,0 +1,337 @@
+# Batch pagination cache
+# Cache kết quả /api/batch/*: giới hạn số mục và dung lượng, LRU + TTL, vô hiệu hoá theo bộ đếm thế hệ
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+BATCH_CACHE_TTL = int(os.getenv("BATCH_CACHE_TTL", "300"))  # seconds
+BATCH_CACHE_MAX_ENTRIES = int(os.getenv("BATCH_CACHE_MAX_ENTRIES", "1000"))
+BATCH_CACHE_MAX_BYTES = int(os.getenv("BATCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# sqlite: one cache file shared by every worker on the host; memory: per worker
+BATCH_CACHE_BACKEND = os.getenv("BATCH_CACHE_BACKEND", "sqlite")
+BATCH_CACHE_DB = os.getenv("BATCH_CACHE_DB")  # defaults to <instance>/batch_cache.db
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    expires_at: float
+    depends: Tuple[str, ...]
+
+
+# Generation bumped by clear(): part of every key, so clearing also reaches entries
+# that are being computed right now in another worker
+ALL_ENTITIES = "*"
+
+
+class MemoryCacheBackend:
+    """Entries in this process only: fastest, but every worker warms its own copy"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def generations(self, entities: List[str]) -> Dict[str, int]:
+        return {entity: self._generations.get(entity, 0) for entity in entities}
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def get(self, key: str) -> Tuple[Optional[bytes], bool]:
+        """(body, expired)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            if entry.expires_at <= time.time():
+                self._drop(key)
+                return None, True
+            self._entries.move_to_end(key)
+            return entry.body, False
+
+    def set(self, key: str, body: bytes, ttl: int, depends: Tuple[str, ...]) -> Tuple[int, int]:
+        """Store an entry; returns (expired, evicted) counts"""
+        now = time.time()
+        expired = evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # Expired entries collect at the cold end; sweep them before evicting live ones
+            while self._entries:
+                oldest_key, oldest = next(iter(self._entries.items()))
+                if oldest.expires_at > now:
+                    break
+                self._drop(oldest_key)
+                expired += 1
+            self._entries[key] = CacheEntry(body, now + ttl, depends)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                evicted += 1
+        return expired, evicted
+
+    def invalidate(self, entities: Tuple[str, ...]) -> int:
+        with self._lock:
+            for entity in entities:
+                self._generations[entity] = self._generations.get(entity, 0) + 1
+            if ALL_ENTITIES not in entities:
+                return 0
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return dropped
+
+    def usage(self) -> Tuple[int, int]:
+        return len(self._entries), self._bytes
+
+
+class SQLiteCacheBackend:
+    """Entries and generations in a SQLite file shared by every worker on the host.
+
+    One worker's miss warms the cache for all of them, and invalidate/clear
+    from any worker is seen by the others on their next lookup.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection must not cross a fork (gunicorn --preload)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, "
+                "depends TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access ON cache_entries (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_generations (entity TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def generations(self, entities: List[str]) -> Dict[str, int]:
+        placeholders = ",".join("?" for _ in entities)
+        rows = self._connection().execute(
+            f"SELECT entity, generation FROM cache_generations WHERE entity IN ({placeholders})", entities
+        )
+        found = dict(rows.fetchall())
+        return {entity: found.get(entity, 0) for entity in entities}
+
+    def get(self, key: str) -> Tuple[Optional[bytes], bool]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT body, expires_at, last_access FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        now = time.time()
+        if row[1] <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return None, True
+        if now - row[2] > 1:
+            # LRU recency at one-second resolution keeps hits mostly read-only
+            conn.execute("UPDATE cache_entries SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], False
+
+    def set(self, key: str, body: bytes, ttl: int, depends: Tuple[str, ...]) -> Tuple[int, int]:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, body, size, depends, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, len(body), "," + ",".join(depends) + ",", now + ttl, now),
+            )
+            expired = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+            evicted = 0
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            if count > self.max_entries:
+                evicted += conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN "
+                    "(SELECT key FROM cache_entries ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+                size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+            while size > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size FROM cache_entries ORDER BY last_access ASC LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                conn.execute("DELETE FROM cache_entries WHERE key = ?", (oldest[0],))
+                size -= oldest[1]
+                evicted += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return expired, evicted
+
+    def invalidate(self, entities: Tuple[str, ...]) -> int:
+        conn = self._connection()
+        # One autocommitted UPSERT per entity: cheap enough for the check-in hot path
+        for entity in entities:
+            conn.execute(
+                "INSERT INTO cache_generations (entity, generation) VALUES (?, 1) "
+                "ON CONFLICT(entity) DO UPDATE SET generation = generation + 1",
+                (entity,),
+            )
+        if ALL_ENTITIES not in entities:
+            return 0
+        return conn.execute("DELETE FROM cache_entries").rowcount
+
+    def usage(self) -> Tuple[int, int]:
+        count, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        return count, size
+
+
+class BatchCache:
+    """LRU + TTL cache of serialized batch responses, bounded by entries and bytes.
+
+    Each entity ("guests", "events") has a generation counter that write routes
+    bump after they commit. Keys embed the generations a response depends on,
+    so a response computed before a write can never be served after it.
+    Invalidating only bumps counters; the unreachable entries age out through
+    TTL and LRU eviction instead of being searched for and deleted.
+    Storage is pluggable (BATCH_CACHE_BACKEND): "memory" per worker or
+    "sqlite" shared by all workers on the host. Cache failures never fail a
+    request: lookups miss and writes are skipped.
+    """
+
+    def __init__(self, ttl: int = BATCH_CACHE_TTL, max_entries: int = BATCH_CACHE_MAX_ENTRIES,
+                 max_bytes: int = BATCH_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = MemoryCacheBackend(max_entries, max_bytes)
+        # Counters are per worker; entries/bytes come from the (possibly shared) backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0  # generation bumps
+        self.errors = 0
+
+    def init_app(self, app, backend: str = BATCH_CACHE_BACKEND) -> None:
+        if backend == "sqlite":
+            path = BATCH_CACHE_DB or os.path.join(app.instance_path, "batch_cache.db")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteCacheBackend(path, self.max_entries, self.max_bytes)
+        elif backend == "memory":
+            self.backend = MemoryCacheBackend(self.max_entries, self.max_bytes)
+        else:
+            raise ValueError(f"Unknown BATCH_CACHE_BACKEND: {backend}")
+
+    def _failed(self, operation: str, e: Exception) -> None:
+        self.errors += 1
+        print(f"Batch cache {operation} error: {e}")
+
+    # --- Keys ---
+    def key_for(self, endpoint: str, params: Dict[str, Any], depends: Iterable[str]) -> str:
+        """Stable key: same params in any order give the same key in every process"""
+        entities = sorted(set(depends) | {ALL_ENTITIES})
+        try:
+            generations = self.backend.generations(entities)
+        except Exception as e:
+            self._failed("generation", e)
+            # Unique key: never matches a stored entry, so the request just misses
+            generations = {"error": time.time()}
+        material = json.dumps(
+            {"params": params, "generations": generations},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return f"{endpoint}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+    # --- Entries ---
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            body, expired = self.backend.get(key)
+        except Exception as e:
+            self._failed("get", e)
+            body, expired = None, False
+        if expired:
+            self.expirations += 1
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def set(self, key: str, body: bytes, depends: Iterable[str] = (), ttl: Optional[int] = None) -> None:
+        if len(body) > self.max_bytes:
+            return
+        try:
+            expired, evicted = self.backend.set(key, body, ttl or self.ttl, tuple(sorted(depends)))
+        except Exception as e:
+            self._failed("set", e)
+            return
+        self.expirations += expired
+        self.evictions += evicted
+
+    def invalidate(self, *entities: str) -> None:
+        """Bump the generation of ``entities``: entries that depend on them are never read again"""
+        try:
+            self.backend.invalidate(tuple(entities))
+            self.invalidations += 1
+        except Exception as e:
+            self._failed("invalidate", e)
+
+    def clear(self) -> None:
+        self.backend.invalidate((ALL_ENTITIES,))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        try:
+            entries, size = self.backend.usage()
+            generations = self.backend.generations(["guests", "events", ALL_ENTITIES])
+        except Exception as e:
+            self._failed("stats", e)
+            entries, size, generations = None, None, {}
+        return {
+            "backend": self.backend.name,
+            "total_entries": entries,
+            "total_size_bytes": size,
+            "cache_ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "generations": generations,
+        }
+
+
+batch_cache = BatchCache()
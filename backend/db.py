@@ -1,8 +1,53 @@
 from __future__ import annotations
 
+from typing import Iterator, Sequence, TypeVar
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica engine a route picked (see db_replica.py).
+
+    Flushes always go to the primary, whatever the route chose.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            engine = g.get("db_read_engine")
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 500
+
+T = TypeVar("T")
+
+
+def chunked(items: Sequence[T], size: int = IN_CHUNK_SIZE) -> Iterator[Sequence[T]]:
+    """Yield consecutive slices of ``items`` with at most ``size`` elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def dialect_name() -> str:
+    """``sqlite``, ``postgresql``, ... of the bound engine (needs an app context)."""
+    return db.engine.dialect.name
 
 
-db = SQLAlchemy()
+def is_sqlite() -> bool:
+    return dialect_name() == "sqlite"
 
 
+def insert_ignoring(model, *index_elements: str):
+    """INSERT that skips rows conflicting on ``index_elements`` (ON CONFLICT DO NOTHING)."""
+    if dialect_name() == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=list(index_elements))
@@ -0,0 +1,242 @@
+# Read replica routing
+# Các route chỉ đọc (danh sách khách, sự kiện, /api/batch/*) đọc từ replica để không tranh pool với check-in.
+# Replica quá cũ (> DB_REPLICA_MAX_LAG giây) hoặc client vừa ghi mà replica chưa theo kịp -> đọc primary.
+#
+# DATABASE_REPLICA_URL is either a second database URL (e.g. a PostgreSQL standby) or, when the
+# primary is SQLite, a second SQLite file that a backup loop refreshes every DB_REPLICA_SYNC_INTERVAL s.
+#
+# Standalone sync loop (set DB_REPLICA_SYNC_INTERVAL=0 for the web workers):
+#   python db_replica.py sync
+
+import fcntl
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+
+from flask import Flask, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db import db
+from db_config import install_connection_hooks, sqlite_pragmas
+
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+# How long a client that wrote keeps reading from the primary, at most
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "30"))
+DB_REPLICA_SYNC_INTERVAL = float(os.getenv("DB_REPLICA_SYNC_INTERVAL", "2"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "1"))
+
+WROTE_AT_COOKIE = "db_wrote_at"
+
+# Lag of a PostgreSQL standby in seconds (0 on a primary or when it has replayed all it received)
+_POSTGRESQL_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def _replica_pragmas(dbapi_connection, connection_record) -> None:
+    # The primary's pragmas minus journal_mode: switching the copy to WAL would leave -wal/-shm
+    # files behind that do not belong to the next copy swapped in under the same name
+    for pragma in sqlite_pragmas():
+        if not pragma.startswith("PRAGMA journal_mode"):
+            dbapi_connection.execute(pragma)
+    # The replica file is replaced by the next sync; a stray write there would be lost
+    dbapi_connection.execute("PRAGMA query_only=ON")
+
+
+class ReadReplica:
+    """Chooses, per request, whether read-only routes use the replica engine."""
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.engine: Optional[Engine] = None
+        self.primary_path: Optional[str] = None
+        self.replica_path: Optional[str] = None
+        self._fresh_as_of: Optional[float] = None
+        self._synced_at: Optional[float] = None  # stamp of the replica file this process's pool has open
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def init_app(self, app: Flask, sync_interval: float = DB_REPLICA_SYNC_INTERVAL) -> None:
+        self.app = app
+        with app.app_context():
+            self.engine = db.engines.get("replica")
+            if self.engine is None:
+                return
+            if self.engine.dialect.name == "sqlite" and db.engine.dialect.name == "sqlite":
+                self.primary_path = db.engine.url.database
+                self.replica_path = self.engine.url.database
+                event.listen(self.engine, "connect", _replica_pragmas)
+            else:
+                install_connection_hooks(self.engine)
+            # create_all() may already have pooled a connection without the hooks
+            self.engine.dispose()
+        app.after_request(self._remember_write)
+        if self.replica_path and sync_interval > 0:
+            self.start(sync_interval)
+
+    # --- Freshness ---
+    @property
+    def _synced_path(self) -> str:
+        return f"{self.replica_path}.synced"
+
+    def _measure_fresh_as_of(self) -> Optional[float]:
+        """Time up to which the replica has every commit; None if unknown (use the primary)"""
+        if self.replica_path:
+            try:
+                with open(self._synced_path) as f:
+                    synced_at = float(f.read().strip())
+            except (OSError, ValueError):
+                return None
+            if synced_at != self._synced_at:
+                # A sync swapped in a new file: pooled connections still have the old one open
+                self.engine.dispose()
+                self._synced_at = synced_at
+            return synced_at
+        if self.engine.dialect.name == "postgresql":
+            with self.engine.connect() as conn:
+                lag = float(conn.exec_driver_sql(_POSTGRESQL_LAG_SQL).scalar() or 0)
+            return time.time() - lag
+        return time.time()
+
+    def fresh_as_of(self) -> Optional[float]:
+        now = time.time()
+        with self._lock:
+            if now - self._checked_at < DB_REPLICA_CHECK_INTERVAL:
+                return self._fresh_as_of
+            self._checked_at = now
+        try:
+            fresh_as_of = self._measure_fresh_as_of()
+        except Exception as e:
+            print(f"Read replica check failed, reading from primary: {e}")
+            fresh_as_of = None
+        with self._lock:
+            self._fresh_as_of = fresh_as_of
+        return fresh_as_of
+
+    # --- Routing ---
+    def begin_read(self) -> None:
+        """Point this request's session at the replica if it is fresh enough for this client"""
+        g.db_replica_lag = None
+        g.db_read_primary_for_client = False
+        if not self.enabled:
+            return
+        fresh_as_of = self.fresh_as_of()
+        if fresh_as_of is None:
+            return
+        lag = max(time.time() - fresh_as_of, 0.0)
+        if lag > DB_REPLICA_MAX_LAG:
+            return
+        # Read-your-writes: this client wrote something the replica has not caught up with
+        wrote_at = request.cookies.get(WROTE_AT_COOKIE, type=float)
+        if wrote_at is not None and wrote_at > fresh_as_of:
+            g.db_read_primary_for_client = True
+            return
+        g.db_read_engine = self.engine
+        g.db_replica_lag = lag
+
+    def cache_ttl(self, ttl: int) -> int:
+        """TTL for a cached response built in this request: replica data may not outlive the lag budget"""
+        lag = g.get("db_replica_lag")
+        if lag is None:
+            return ttl
+        return max(1, min(ttl, int(DB_REPLICA_MAX_LAG - lag)))
+
+    def _remember_write(self, response):
+        if request.method in ("GET", "HEAD", "OPTIONS") or response.status_code >= 400:
+            return response
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, "replica_read", False):
+            return response
+        response.set_cookie(
+            WROTE_AT_COOKIE, f"{time.time():.3f}", max_age=DB_REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax"
+        )
+        return response
+
+    # --- SQLite file replica ---
+    def sync_once(self) -> float:
+        """Copy the primary into a new file and swap it in as the replica; returns the snapshot time"""
+        started = time.time()
+        # Readers never see a half-written copy: the backup goes to a temp file renamed over the replica
+        copy_path = f"{self.replica_path}.{os.getpid()}.tmp"
+        if os.path.exists(copy_path):
+            os.remove(copy_path)  # left by a sync that failed
+        source = sqlite3.connect(self.primary_path, timeout=30)
+        target = sqlite3.connect(copy_path)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(copy_path, self.replica_path)
+        # Written after the swap: a stamp never describes an older file than the one in place
+        tmp_path = f"{self._synced_path}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.write(f"{started:.3f}")
+        os.replace(tmp_path, self._synced_path)
+        return started
+
+    def start(self, interval: float) -> None:
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="replica-sync", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        # One syncing process per host: the others keep retrying the lock in case it exits
+        lock_file = open(f"{self.replica_path}.lock", "w")
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(interval)
+        while True:
+            started = time.time()
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"Read replica sync error: {e}")
+            time.sleep(max(interval - (time.time() - started), 0.1))
+
+
+read_replica = ReadReplica()
+
+
+def replica_read(view):
+    """Mark a read-only view: its queries may be served by the read replica"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        read_replica.begin_read()
+        return view(*args, **kwargs)
+
+    wrapper.replica_read = True
+    return wrapper
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "sync":
+        print("Usage: python db_replica.py sync")
+        sys.exit(1)
+    import importlib
+
+    # create_app() configures db_replica.read_replica, not this module's __main__ copy
+    importlib.import_module("app")
+    from db_replica import read_replica as app_read_replica
+
+    if not app_read_replica.replica_path:
+        print("DATABASE_REPLICA_URL is not a SQLite file replica of a SQLite primary; nothing to sync")
+        sys.exit(1)
+    print(f"Syncing {app_read_replica.primary_path} -> {app_read_replica.replica_path} every {DB_REPLICA_SYNC_INTERVAL or 2}s")
+    app_read_replica._run(DB_REPLICA_SYNC_INTERVAL or 2)
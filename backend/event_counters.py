@@ -0,0 +1,179 @@
+# Per-event guest counters
+# Bảng event_stats đếm RSVP/check-in theo sự kiện; trigger trên bảng guests cập nhật nó trong cùng transaction
+# với mọi thao tác ghi (check-in, bulk, RSVP, import, xoá), nên dashboard đọc O(1) mỗi sự kiện.
+# Trigger có hai bản: SQLite và PostgreSQL (PL/pgSQL).
+#
+# Rebuild from the guests table:  python event_counters.py reconcile
+
+import sys
+from typing import Dict
+
+from db import dialect_name
+from models import EventStats, db
+
+# event_stats column -> (guests column, value counted)
+COUNTERS = {
+    "accepted": ("rsvp_status", "accepted"),
+    "declined": ("rsvp_status", "declined"),
+    "pending": ("rsvp_status", "pending"),
+    "checked_in": ("checkin_status", "checked_in"),
+    "checked_out": ("checkin_status", "checked_out"),
+    "not_arrived": ("checkin_status", "not_arrived"),
+}
+
+# Timestamps elsewhere are stored in Hanoi time (+7)
+_NOW_SQL = {
+    "sqlite": "datetime('now', '+7 hours')",
+    "postgresql": "(now() AT TIME ZONE 'Asia/Ho_Chi_Minh')",
+}
+
+
+def _matches(ref: str, column: str, value: str) -> str:
+    # 0/1 on every dialect, also when the column is NULL
+    return f"(CASE WHEN {ref}.{column} = '{value}' THEN 1 ELSE 0 END)"
+
+
+def _ensure_row_sql(ref: str, dialect: str) -> str:
+    columns = ", ".join(["event_id", "total", *COUNTERS])
+    zeros = ", ".join("0" for _ in range(len(COUNTERS) + 1))
+    if dialect == "postgresql":
+        return f"INSERT INTO event_stats ({columns}) VALUES ({ref}.event_id, {zeros}) ON CONFLICT (event_id) DO NOTHING;"
+    return (
+        f"INSERT OR IGNORE INTO event_stats ({columns}) "
+        f"SELECT {ref}.event_id, {zeros} WHERE {ref}.event_id IS NOT NULL;"
+    )
+
+
+def _apply_sql(ref: str, sign: str, dialect: str) -> str:
+    deltas = ", ".join(
+        f"{name} = {name} {sign} {_matches(ref, column, value)}" for name, (column, value) in COUNTERS.items()
+    )
+    return (
+        f"UPDATE event_stats SET total = total {sign} 1, {deltas}, updated_at = {_NOW_SQL[dialect]} "
+        f"WHERE event_id = {ref}.event_id;"
+    )
+
+
+def _sqlite_trigger_ddl() -> Dict[str, str]:
+    return {
+        "trg_guests_stats_insert": (
+            "CREATE TRIGGER trg_guests_stats_insert AFTER INSERT ON guests BEGIN "
+            f"{_ensure_row_sql('NEW', 'sqlite')} {_apply_sql('NEW', '+', 'sqlite')} END"
+        ),
+        "trg_guests_stats_update": (
+            "CREATE TRIGGER trg_guests_stats_update "
+            "AFTER UPDATE OF event_id, rsvp_status, checkin_status ON guests BEGIN "
+            f"{_apply_sql('OLD', '-', 'sqlite')} {_ensure_row_sql('NEW', 'sqlite')} {_apply_sql('NEW', '+', 'sqlite')} END"
+        ),
+        "trg_guests_stats_delete": (
+            "CREATE TRIGGER trg_guests_stats_delete AFTER DELETE ON guests BEGIN "
+            f"{_apply_sql('OLD', '-', 'sqlite')} END"
+        ),
+        # SQLite does not enforce ON DELETE CASCADE unless foreign_keys is on
+        "trg_events_stats_delete": (
+            "CREATE TRIGGER trg_events_stats_delete AFTER DELETE ON events BEGIN "
+            "DELETE FROM event_stats WHERE event_id = OLD.id; END"
+        ),
+    }
+
+
+def _postgresql_trigger_ddl() -> Dict[str, str]:
+    # One PL/pgSQL function shared by the three guests triggers; the events FK cascades on its own
+    function = (
+        "CREATE OR REPLACE FUNCTION event_stats_apply() RETURNS trigger AS $$ BEGIN "
+        "IF TG_OP <> 'INSERT' AND OLD.event_id IS NOT NULL THEN "
+        f"{_apply_sql('OLD', '-', 'postgresql')} END IF; "
+        "IF TG_OP <> 'DELETE' AND NEW.event_id IS NOT NULL THEN "
+        f"{_ensure_row_sql('NEW', 'postgresql')} {_apply_sql('NEW', '+', 'postgresql')} END IF; "
+        "RETURN NULL; END $$ LANGUAGE plpgsql; "
+    )
+    return {
+        "trg_guests_stats_insert": (
+            f"{function}CREATE TRIGGER trg_guests_stats_insert AFTER INSERT ON guests "
+            "FOR EACH ROW EXECUTE FUNCTION event_stats_apply()"
+        ),
+        "trg_guests_stats_update": (
+            f"{function}CREATE TRIGGER trg_guests_stats_update "
+            "AFTER UPDATE OF event_id, rsvp_status, checkin_status ON guests "
+            "FOR EACH ROW EXECUTE FUNCTION event_stats_apply()"
+        ),
+        "trg_guests_stats_delete": (
+            f"{function}CREATE TRIGGER trg_guests_stats_delete AFTER DELETE ON guests "
+            "FOR EACH ROW EXECUTE FUNCTION event_stats_apply()"
+        ),
+    }
+
+
+def _trigger_ddl() -> Dict[str, str]:
+    dialect = dialect_name()
+    if dialect == "sqlite":
+        return _sqlite_trigger_ddl()
+    if dialect == "postgresql":
+        return _postgresql_trigger_ddl()
+    raise RuntimeError(f"event_stats triggers are not available for {dialect}")
+
+
+def existing_triggers() -> set:
+    if dialect_name() == "postgresql":
+        sql = "SELECT tgname FROM pg_trigger WHERE NOT tgisinternal"
+    else:
+        sql = "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+    return {name for (name,) in db.session.execute(db.text(sql))}
+
+
+def install_counter_triggers(commit: bool = True) -> bool:
+    """Create missing triggers; rebuild the counters if any trigger was missing.
+
+    Returns True when the counters were (re)built.
+    """
+    ddl = _trigger_ddl()
+    existing = existing_triggers()
+    missing = [name for name in ddl if name not in existing]
+    if not missing:
+        return False
+    for name in missing:
+        db.session.execute(db.text(ddl[name]))
+    # Writes made while a trigger was missing were not counted
+    rebuild_event_stats(commit=False)
+    if commit:
+        db.session.commit()
+    return True
+
+
+def rebuild_event_stats(commit: bool = True) -> int:
+    """Recompute every event's counters from the guests table; returns the number of events"""
+    sums = ", ".join(f"SUM({_matches('guests', column, value)})" for column, value in COUNTERS.values())
+    db.session.execute(db.text("DELETE FROM event_stats"))
+    result = db.session.execute(db.text(
+        f"INSERT INTO event_stats (event_id, total, {', '.join(COUNTERS)}, updated_at) "
+        f"SELECT event_id, COUNT(*), {sums}, {_NOW_SQL[dialect_name()]} FROM guests "
+        "WHERE event_id IS NOT NULL AND event_id IN (SELECT id FROM events) GROUP BY event_id"
+    ))
+    if commit:
+        db.session.commit()
+    return result.rowcount
+
+
+def get_event_stats(event_id: int) -> dict:
+    """Counters for one event (zeros if it has no guests yet)"""
+    # populate_existing: triggers change the row behind the ORM's back
+    stats = (
+        db.session.query(EventStats)
+        .filter(EventStats.event_id == event_id)
+        .populate_existing()
+        .first()
+    )
+    if stats is None:
+        return {"event_id": event_id, "total": 0, **{name: 0 for name in COUNTERS}, "updated_at": None}
+    return stats.to_dict()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "reconcile":
+        print("Usage: python event_counters.py reconcile")
+        sys.exit(1)
+    from app import app as flask_app
+
+    with flask_app.app_context():
+        rebuilt = rebuild_event_stats()
+        print(f"Rebuilt counters for {rebuilt} event(s)")
@@ -0,0 +1,260 @@
+# Realtime event log + SSE fan-out hub
+# Worker ghi sự kiện (check-in, ...) vào một log SQLite dùng chung; hub asyncio đọc log và đẩy tới
+# hàng nghìn kết nối SSE, hỗ trợ phát lại theo Last-Event-ID.
+#
+# Run the hub:  python event_hub.py [--host 0.0.0.0] [--port 5010]
+# and route /api/qr/stream to it in nginx. Without the hub, the Flask route tails the same log.
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+EVENT_HUB_DB = os.getenv("EVENT_HUB_DB")  # defaults to <instance>/event_hub.db
+EVENT_HUB_RETENTION = int(os.getenv("EVENT_HUB_RETENTION", "3600"))  # seconds kept for replay
+EVENT_HUB_POLL_INTERVAL = float(os.getenv("EVENT_HUB_POLL_INTERVAL", "0.2"))
+EVENT_HUB_PING_INTERVAL = 15
+EVENT_HUB_QUEUE_SIZE = 100
+
+LogEvent = Tuple[int, str, str]  # (id, token, payload_json)
+
+
+class EventLog:
+    """Append-only SQLite log shared by every worker process on the host"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._local = threading.local()
+
+    def init_app(self, app) -> None:
+        self.path = EVENT_HUB_DB or os.path.join(app.instance_path, "event_hub.db")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stream_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_stream_events_token_id ON stream_events (token, id)")
+            self._local.conn = conn
+        return conn
+
+    def publish(self, token: str, payload: dict) -> int:
+        cur = self._connection().execute(
+            "INSERT INTO stream_events (token, payload, created_at) VALUES (?, ?, ?)",
+            (token, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        if cur.lastrowid % 1000 == 0:
+            # Keep the log bounded even when no hub process is running
+            self.prune()
+        return cur.lastrowid
+
+    def publish_many(self, events: Iterable[Tuple[str, dict]]) -> int:
+        """Append (token, payload) events in one transaction (one fsync); returns the last id"""
+        now = time.time()
+        rows = [(token, json.dumps(payload, ensure_ascii=False), now) for token, payload in events]
+        if not rows:
+            return self.latest_id()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO stream_events (token, payload, created_at) VALUES (?, ?, ?)", rows)
+            last_id = conn.execute("SELECT MAX(id) FROM stream_events").fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if last_id // 1000 != (last_id - len(rows)) // 1000:
+            self.prune()
+        return last_id
+
+    def read_since(self, last_id: int, token: Optional[str] = None, limit: int = 1000) -> List[LogEvent]:
+        if token is None:
+            rows = self._connection().execute(
+                "SELECT id, token, payload FROM stream_events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit),
+            )
+        else:
+            rows = self._connection().execute(
+                "SELECT id, token, payload FROM stream_events WHERE token = ? AND id > ? ORDER BY id LIMIT ?",
+                (token, last_id, limit),
+            )
+        return rows.fetchall()
+
+    def latest_id(self) -> int:
+        row = self._connection().execute("SELECT MAX(id) FROM stream_events").fetchone()
+        return row[0] or 0
+
+    def prune(self, retention: int = EVENT_HUB_RETENTION) -> int:
+        cur = self._connection().execute(
+            "DELETE FROM stream_events WHERE created_at < ?", (time.time() - retention,)
+        )
+        return cur.rowcount
+
+
+event_log = EventLog()
+
+
+def format_sse(event_id: int, payload_json: str) -> str:
+    return f"id: {event_id}\ndata: {payload_json}\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    value = (value or "").strip()
+    return int(value) if value.isdigit() else None
+
+
+class EventHub:
+    """Single asyncio process that tails the event log and fans out to SSE clients.
+
+    Tokens are not checked against the guests DB: they are unguessable and an
+    unknown token only ever receives pings.
+    """
+
+    def __init__(self, log: EventLog):
+        self.log = log
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.last_seen = 0
+
+    async def tail(self) -> None:
+        self.last_seen = await asyncio.to_thread(self.log.latest_id)
+        last_prune = time.time()
+        while True:
+            events: List[LogEvent] = []
+            try:
+                events = await asyncio.to_thread(self.log.read_since, self.last_seen)
+                for event in events:
+                    self.last_seen = event[0]
+                    for queue in list(self.subscribers.get(event[1], ())):
+                        try:
+                            queue.put_nowait(event)
+                        except asyncio.QueueFull:
+                            # Slow consumer: drop its backlog and close; the client reconnects
+                            # and replays from Last-Event-ID
+                            while not queue.empty():
+                                queue.get_nowait()
+                            queue.put_nowait(None)
+                if time.time() - last_prune > 60:
+                    await asyncio.to_thread(self.log.prune)
+                    last_prune = time.time()
+            except Exception as e:
+                print(f"Event hub tail error: {e}")
+            if not events:
+                await asyncio.sleep(EVENT_HUB_POLL_INTERVAL)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            parts = request_line.split()
+            url = urlsplit(parts[1]) if len(parts) >= 2 else urlsplit("/")
+            query = parse_qs(url.query)
+            if url.path in ("/health", "/api/health"):
+                await self._respond(writer, 200, "application/json", json.dumps({
+                    "status": "ok", "service": "EXP Event Hub",
+                    "subscribers": sum(len(q) for q in self.subscribers.values())
+                }))
+                return
+            token = (query.get("token") or [""])[0]
+            if url.path != "/api/qr/stream":
+                await self._respond(writer, 404, "application/json", json.dumps({"message": "not found"}))
+                return
+            if not token:
+                await self._respond(writer, 400, "application/json", json.dumps({"message": "missing token"}))
+                return
+            last_id = parse_last_event_id(headers.get("last-event-id") or (query.get("last_event_id") or [""])[0])
+            await self._stream(writer, token, last_id)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: str) -> None:
+        data = body.encode("utf-8")
+        writer.write((
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+            "Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n"
+        ).encode("latin-1") + data)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, token: str, last_id: Optional[int]) -> None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_HUB_QUEUE_SIZE)
+        self.subscribers.setdefault(token, set()).add(queue)
+        try:
+            writer.write((
+                "HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                "X-Accel-Buffering: no\r\nAccess-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+                ": ping\n\n"
+            ).encode("latin-1"))
+            sent_id = 0
+            if last_id is not None:
+                # Replay what this client missed; live events below are de-duplicated by id
+                for event_id, _token, payload in await asyncio.to_thread(self.log.read_since, last_id, token):
+                    writer.write(format_sse(event_id, payload).encode("utf-8"))
+                    sent_id = event_id
+            await writer.drain()
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HUB_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                if event is None:
+                    return
+                if event[0] <= sent_id:
+                    continue
+                writer.write(format_sse(event[0], event[2]).encode("utf-8"))
+                sent_id = event[0]
+                await writer.drain()
+        finally:
+            subscribers = self.subscribers.get(token)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self.subscribers[token]
+
+
+async def serve(host: str, port: int, path: Optional[str]) -> None:
+    if path:
+        event_log.path = path
+    hub = EventHub(event_log)
+    server = await asyncio.start_server(hub.handle, host, port, limit=16 * 1024)
+    print(f"Event hub listening on {host}:{port}, log {event_log.path}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), hub.tail())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE fan-out hub for /api/qr/stream")
+    parser.add_argument("--host", default=os.getenv("EVENT_HUB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("EVENT_HUB_PORT", "5010")))
+    parser.add_argument("--db", default=EVENT_HUB_DB or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "event_hub.db"))
+    args = parser.parse_args()
+    os.makedirs(os.path.dirname(args.db), exist_ok=True)
+    asyncio.run(serve(args.host, args.port, args.db))
@@ -0,0 +1,259 @@
+# Streaming guest importer
+# Đọc CSV theo từng dòng và ghi DB theo từng lô để import file lớn với bộ nhớ cố định
+
+import codecs
+import csv
+import itertools
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from sqlalchemy import insert
+
+from batch_cache import batch_cache
+from db import chunked
+from models import Guest, db
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+ENCODING_SAMPLE_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+
+EXPECTED_CSV_HEADERS = ['title', 'Name', 'Role', 'Organization', 'tags', 'host', 'message']
+TITLE_VALUES = ['Mr', 'Mrs', 'Ms', 'Dr']
+
+# (processed, imported, failed); called inside each chunk's transaction, before its commit
+ProgressCallback = Callable[[int, int, int], None]
+# A mapped row is either Guest column values or the reason the row was rejected
+MappedRow = Union[Dict[str, Any], str]
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Pick a codec from a leading sample of the upload"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        # Windows-1252 is common for Excel exports
+        sample.decode('windows-1252')
+        return 'windows-1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def iter_text_lines(stream, encoding: str) -> Iterator[str]:
+    """Decode a binary stream line by line"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for raw in stream:
+        text = decoder.decode(raw)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_csv_rows(stream) -> Iterator[Dict[str, Any]]:
+    """Yield CSV rows as dicts, detecting encoding and missing headers from the first bytes"""
+    sample = stream.read(ENCODING_SAMPLE_SIZE)
+    stream.seek(0)
+    encoding = detect_encoding(sample)
+
+    lines = iter_text_lines(stream, encoding)
+    first_line = next(lines, '')
+    lines = itertools.chain([first_line], lines)
+
+    # If first line doesn't contain expected headers, use them as field names
+    if not any(header in first_line for header in EXPECTED_CSV_HEADERS):
+        print("No proper headers found, adding headers...")
+        return csv.DictReader(lines, fieldnames=EXPECTED_CSV_HEADERS)
+    return csv.DictReader(lines)
+
+
+def map_csv_row(row: Dict[str, Any], event_id: Optional[int]) -> MappedRow:
+    """Map a CSV row to Guest column values, or an error message when it has no name"""
+    def field(key: str) -> str:
+        return (row.get(key) or '').strip()
+
+    # Smart mapping to handle different CSV formats
+    # Check if data is shifted (Name contains Mr/Mrs instead of actual name)
+    name_field = field('Name')
+    role_field = field('Role')
+
+    if name_field in TITLE_VALUES and role_field and role_field not in TITLE_VALUES:
+        # Data is shifted: title is in Name, actual name is in Role
+        title = name_field
+        name = role_field
+        role = field('Organization') or None
+        organization = field('tags') or None
+        tag = field('host') or None
+        # Message might be in None key or message key
+        message = field('message') or None
+        if not message and None in row:
+            message = ' '.join(row[None]) if isinstance(row[None], list) else str(row[None])
+    else:
+        # Normal mapping
+        name = name_field
+        title = field('title') or None
+        role = role_field or None
+        organization = field('Organization') or None
+        tag = field('tags') or None
+        message = field('message') or None
+
+    if not name:
+        return "Missing name"
+    return {
+        'name': name,
+        'title': title,
+        'role': role,
+        'organization': organization,
+        'tag': tag,
+        'email': None,  # Always None for CSV import
+        'phone': None,  # Always None for CSV import
+        'event_content': message,  # Store message in event_content
+        'checkin_status': 'not_arrived',  # Default status for imported guests
+        'rsvp_status': 'pending',  # Default RSVP status for imported guests
+        'event_id': event_id,
+    }
+
+
+class ImportResult:
+    """Running totals for an import; errors are capped to keep memory bounded"""
+
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[str] = []
+
+    def fail(self, message: str, count: int = 1) -> None:
+        self.failed += count
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+def insert_guest_rows(rows: Iterable[MappedRow], result: ImportResult,
+                      chunk_size: int = IMPORT_CHUNK_SIZE,
+                      progress: Optional[ProgressCallback] = None) -> ImportResult:
+    """Bulk-insert mapped guest rows, committing every ``chunk_size`` rows.
+
+    String entries are counted as failed rows with that message. A ``result``
+    that already counts processed rows resumes after them. ``progress`` writes
+    made for a chunk commit with its rows, so a recorded offset always matches
+    the committed rows; an exception from it rolls the chunk back.
+    """
+    chunk_size = max(1, chunk_size)
+    if result.processed:
+        rows = itertools.islice(rows, result.processed, None)
+    pending: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        inserted = 0
+        if pending:
+            try:
+                db.session.execute(insert(Guest), pending)
+                inserted = len(pending)
+                result.imported += inserted
+            except Exception as e:
+                db.session.rollback()
+                result.fail(f"Rows {result.processed - len(pending) + 1}-{result.processed}: {str(e)}", len(pending))
+            pending.clear()
+        if progress:
+            progress(result.processed, result.imported, result.failed)
+        db.session.commit()
+        if inserted:
+            batch_cache.invalidate("guests")
+
+    for values in rows:
+        result.processed += 1
+        if isinstance(values, str):
+            result.fail(f"Row {result.processed}: {values}")
+        else:
+            pending.append(values)
+        if result.processed % chunk_size == 0:
+            flush()
+    flush()
+    return result
+
+
+def import_csv_stream(stream, event_id: Optional[int], chunk_size: int = IMPORT_CHUNK_SIZE,
+                      progress: Optional[ProgressCallback] = None,
+                      resume: Optional[ImportResult] = None) -> ImportResult:
+    """Stream a CSV upload into the guests table in chunked commits"""
+    rows = (map_csv_row(row, event_id) for row in iter_csv_rows(stream))
+    return insert_guest_rows(rows, resume or ImportResult(), chunk_size=chunk_size, progress=progress)
+
+
+def _clean(value: Any) -> Optional[str]:
+    # Empty values become None to avoid UNIQUE constraint issues
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _existing_values(column, values: Set[str]) -> Set[str]:
+    found: Set[str] = set()
+    for chunk in chunked(sorted(values)):
+        found.update(v for (v,) in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+
+def iter_json_rows(data: List[Any], chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[MappedRow]:
+    """Map JSON guest rows, rejecting duplicates against the DB and within the payload.
+
+    Existing emails/phones are looked up once per chunk; duplicates inside the
+    payload are caught with in-memory sets.
+    """
+    seen_emails: Set[str] = set()
+    seen_phones: Set[str] = set()
+    for chunk in chunked(data, max(1, chunk_size)):
+        rows = [row if isinstance(row, dict) else {} for row in chunk]
+        emails = {e for e in (_clean(row.get("email")) for row in rows) if e}
+        phones = {p for p in (_clean(row.get("phone")) for row in rows) if p}
+        existing_emails = _existing_values(Guest.email, emails) if emails else set()
+        existing_phones = _existing_values(Guest.phone, phones) if phones else set()
+
+        for row in rows:
+            name = row.get("name")
+            if not name:
+                yield "Missing name"
+                continue
+            email = _clean(row.get("email"))
+            phone = _clean(row.get("phone"))
+            if email and (email in existing_emails or email in seen_emails):
+                yield f"Email {email} already exists"
+                continue
+            if phone and (phone in existing_phones or phone in seen_phones):
+                yield f"Phone {phone} already exists"
+                continue
+            if email:
+                seen_emails.add(email)
+            if phone:
+                seen_phones.add(phone)
+            yield {
+                "name": name,
+                "title": row.get("title"),
+                "role": row.get("role"),
+                "organization": row.get("organization"),
+                "tag": row.get("tag"),
+                "email": email,
+                "phone": phone,
+                "checkin_status": "not_arrived",  # Default status for imported guests
+                "rsvp_status": "pending",  # Default RSVP status for imported guests
+                "event_id": row.get("event_id"),
+            }
+
+
+def import_json_rows(data: List[Any], chunk_size: int = IMPORT_CHUNK_SIZE,
+                     progress: Optional[ProgressCallback] = None,
+                     resume: Optional[ImportResult] = None) -> ImportResult:
+    """Dedupe and bulk-insert a JSON array of guests in chunked commits"""
+    rows = iter_json_rows(data, chunk_size=chunk_size)
+    return insert_guest_rows(rows, resume or ImportResult(), chunk_size=chunk_size, progress=progress)
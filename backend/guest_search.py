@@ -0,0 +1,213 @@
+# Guest full-text search
+# Chỉ mục FTS5 trên tên, email, SĐT, chức vụ, đơn vị, tag; tìm không dấu tiếng Việt, khớp tiền tố, xếp hạng bm25
+# PostgreSQL không có FTS5: cột sinh guests.search_vector (tsvector đã bỏ dấu bằng translate()) + chỉ mục GIN, xếp hạng ts_rank
+
+import re
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import Integer, and_, column, func, or_
+
+from db import dialect_name
+from models import Guest, db
+
+SEARCH_COLUMNS = ("name", "email", "phone", "role", "organization", "tag")
+# bm25 weights in SEARCH_COLUMNS order: a name match ranks above an organization match
+SEARCH_WEIGHTS = (10.0, 4.0, 4.0, 1.0, 1.0, 2.0)
+# The same ordering as tsvector weight classes (A ranks highest)
+SEARCH_WEIGHT_CLASSES = ("A", "B", "B", "D", "D", "C")
+SEARCH_TRIGGERS = ("trg_guests_fts_insert", "trg_guests_fts_update", "trg_guests_fts_delete")
+
+# Vietnamese letters with diacritics, folded by translate() where no FTS5 tokenizer does it
+_VIETNAMESE_LETTERS = "àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ"
+
+# "fts5" (SQLite guests_fts), "tsvector" (PostgreSQL guests.search_vector) or "like"
+_search_backend: Optional[str] = None
+
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """Lowercase, strip Vietnamese diacritics ("Đức" -> "duc")"""
+    value = (value or "").replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in value if not unicodedata.combining(ch)).lower()
+
+
+def _search_words(term: str) -> List[str]:
+    return re.findall(r"\w+", normalize_search_text(term))
+
+
+def fts_query(term: str) -> Optional[str]:
+    """MATCH expression: every word must match as a prefix ("ng duc" -> "ng"* "duc"*)"""
+    words = _search_words(term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def tsquery(term: str) -> Optional[str]:
+    """to_tsquery() input with the same meaning as fts_query ("ng duc" -> ng:* & duc:*)"""
+    words = _search_words(term)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+# --- SQLite: FTS5 table kept in sync by triggers ---
+
+def _indexed(ref: str, name: str) -> str:
+    # unicode61 folds most diacritics itself but not đ/Đ
+    return f"replace(replace(coalesce({ref}.{name}, ''), 'đ', 'd'), 'Đ', 'D')"
+
+
+def _insert_sql(ref: str) -> str:
+    values = ", ".join(_indexed(ref, name) for name in SEARCH_COLUMNS)
+    return f"INSERT INTO guests_fts (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES ({ref}.id, {values});"
+
+
+def _install_fts5() -> bool:
+    try:
+        db.session.execute(db.text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS guests_fts USING fts5({', '.join(SEARCH_COLUMNS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+        ))
+    except Exception as e:
+        print(f"FTS5 unavailable, guest search falls back to LIKE: {e}")
+        return False
+
+    for name in SEARCH_TRIGGERS:
+        db.session.execute(db.text(f"DROP TRIGGER IF EXISTS {name}"))
+    db.session.execute(db.text(
+        f"CREATE TRIGGER trg_guests_fts_insert AFTER INSERT ON guests BEGIN {_insert_sql('NEW')} END"
+    ))
+    db.session.execute(db.text(
+        f"CREATE TRIGGER trg_guests_fts_update AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON guests BEGIN "
+        f"DELETE FROM guests_fts WHERE rowid = OLD.id; {_insert_sql('NEW')} END"
+    ))
+    db.session.execute(db.text(
+        "CREATE TRIGGER trg_guests_fts_delete AFTER DELETE ON guests BEGIN "
+        "DELETE FROM guests_fts WHERE rowid = OLD.id; END"
+    ))
+    rebuild_search_index()
+    return True
+
+
+def rebuild_search_index() -> None:
+    """Refill guests_fts from the guests table (SQLite; the PostgreSQL index maintains itself)"""
+    values = ", ".join(_indexed("guests", name) for name in SEARCH_COLUMNS)
+    db.session.execute(db.text("DELETE FROM guests_fts"))
+    db.session.execute(db.text(
+        f"INSERT INTO guests_fts (rowid, {', '.join(SEARCH_COLUMNS)}) SELECT id, {values} FROM guests"
+    ))
+
+
+# --- PostgreSQL: stored generated tsvector column with a GIN index ---
+
+def _tsvector_sql() -> str:
+    letters = _VIETNAMESE_LETTERS + _VIETNAMESE_LETTERS.upper()
+    folded = normalize_search_text(letters)
+    parts = [
+        f"setweight(to_tsvector('simple', translate(lower(coalesce({name}, '')), '{letters}', '{folded}')), '{weight}')"
+        for name, weight in zip(SEARCH_COLUMNS, SEARCH_WEIGHT_CLASSES)
+    ]
+    return " || ".join(parts)
+
+
+def _install_tsvector_index() -> bool:
+    # Generated columns keep themselves current (PostgreSQL 12+), so there are no triggers to install
+    db.session.execute(db.text(
+        f"ALTER TABLE guests ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({_tsvector_sql()}) STORED"
+    ))
+    db.session.execute(db.text("CREATE INDEX IF NOT EXISTS ix_guests_search ON guests USING GIN (search_vector)"))
+    return True
+
+
+def install_search_index() -> bool:
+    """Create the full-text index for the current database; False if there is none (LIKE fallback)"""
+    dialect = dialect_name()
+    if dialect == "sqlite":
+        return _install_fts5()
+    if dialect == "postgresql":
+        return _install_tsvector_index()
+    return False
+
+
+def search_backend() -> str:
+    global _search_backend
+    if _search_backend is None:
+        dialect = dialect_name()
+        if dialect == "sqlite":
+            found = db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'guests_fts'"
+            )).first()
+            _search_backend = "fts5" if found else "like"
+        elif dialect == "postgresql":
+            found = db.session.execute(db.text("SELECT to_regclass('ix_guests_search')")).scalar()
+            _search_backend = "tsvector" if found else "like"
+        else:
+            _search_backend = "like"
+    return _search_backend
+
+
+def _like_condition(term: str):
+    # Accent-sensitive: every word somewhere in the searched columns
+    words = re.findall(r"\w+", term.lower())
+    if not words:
+        return None
+    columns = [func.lower(getattr(Guest, name)) for name in SEARCH_COLUMNS]
+    return and_(*(or_(*(value.like(f"%{word}%") for value in columns)) for word in words))
+
+
+def search_condition(term: str):
+    """Filter for Guest queries matching ``term`` (None when the term has no words)"""
+    backend = search_backend()
+    if backend == "like":
+        return _like_condition(term)
+    if backend == "tsvector":
+        match = tsquery(term)
+        if match is None:
+            return None
+        return db.text("guests.search_vector @@ to_tsquery('simple', :ts_match)").bindparams(ts_match=match)
+    match = fts_query(term)
+    if match is None:
+        return None
+    matching_ids = (
+        db.text("SELECT rowid FROM guests_fts WHERE guests_fts MATCH :fts_match")
+        .bindparams(fts_match=match)
+        .columns(column("rowid", Integer))
+    )
+    return Guest.id.in_(matching_ids)
+
+
+def search_guest_ids(term: str, event_id: Optional[int] = None, limit: int = 20) -> List[int]:
+    """Best matches first (bm25 / ts_rank), optionally within one event"""
+    backend = search_backend()
+    if backend == "like":
+        condition = _like_condition(term)
+        if condition is None:
+            return []
+        query = db.session.query(Guest.id).filter(condition)
+        if event_id is not None:
+            query = query.filter(Guest.event_id == event_id)
+        return [guest_id for (guest_id,) in query.order_by(Guest.name.asc()).limit(limit)]
+
+    match = fts_query(term) if backend == "fts5" else tsquery(term)
+    if match is None:
+        return []
+    event_filter = " AND guests.event_id = :event_id" if event_id is not None else ""
+    # Score every match, then keep the best: a LIMIT before the ORDER BY would rank an arbitrary
+    # subset. ORDER BY ... LIMIT is a top-N sort, so a short prefix matching most of the table
+    # stays one pass over the matches
+    if backend == "fts5":
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        sql = (
+            "SELECT guests.id FROM guests_fts JOIN guests ON guests.id = guests_fts.rowid "
+            f"WHERE guests_fts MATCH :fts_match{event_filter} "
+            f"ORDER BY bm25(guests_fts, {weights}), guests.id LIMIT :limit"
+        )
+    else:
+        sql = (
+            f"SELECT guests.id FROM guests WHERE guests.search_vector @@ to_tsquery('simple', :fts_match){event_filter} "
+            "ORDER BY ts_rank(guests.search_vector, to_tsquery('simple', :fts_match)) DESC, guests.id LIMIT :limit"
+        )
+    rows = db.session.execute(db.text(sql), {"fts_match": match, "event_id": event_id, "limit": limit})
+    return [guest_id for (guest_id,) in rows]
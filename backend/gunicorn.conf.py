@@ -3,14 +3,27 @@ import multiprocessing
 import os
 
 # Server socket
-bind = "0.0.0.0:3000"
+# 5008: the port nginx, docker-compose and the Dockerfile healthcheck use
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5008")
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
-timeout = 30
+# GUNICORN_WORKER_CLASS=gevent runs the same Flask app on cooperative workers: every
+# process multiplexes SSE streams (/api/qr/stream) and slow uploads on one event loop
+# instead of pinning a whole sync worker per connection.
+#   gunicorn -c gunicorn.conf.py app:app                                 # sync (default)
+#   GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py app:app    # async profile
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+if worker_class == "gevent":
+    # One process per core is enough: concurrency comes from greenlets, not processes
+    workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() + 1))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+    # Heartbeat timeout only: long-lived streams keep yielding to the loop
+    timeout = 120
+else:
+    workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+    worker_connections = 1000
+    timeout = 30
 keepalive = 2
 
 # Restart workers after this many requests, to prevent memory leaks
@@ -18,8 +31,8 @@ max_requests = 1000
 max_requests_jitter = 50
 
 # Logging
-accesslog = "/var/log/exp-gest/access.log"
-errorlog = "/var/log/exp-gest/error.log"
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "/var/log/exp-gest/access.log")
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "/var/log/exp-gest/error.log")
 loglevel = "info"
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
 
@@ -28,7 +41,7 @@ proc_name = "exp-gest-backend"
 
 # Server mechanics
 daemon = False
-pidfile = "/var/run/exp-gest-backend.pid"
+pidfile = os.getenv("GUNICORN_PIDFILE", "/var/run/exp-gest-backend.pid")
 user = None
 group = None
 tmp_upload_dir = None
@@ -0,0 +1,255 @@
+# Background import job queue
+# Nhận file import, lưu ra đĩa và xử lý ở luồng nền để worker web không bị giữ quá timeout
+
+import json
+import os
+import sys
+import threading
+import uuid
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from flask import Flask
+from sqlalchemy import and_, func, or_
+
+from guest_import import IMPORT_CHUNK_SIZE, ImportResult, import_csv_stream, import_json_rows
+from models import ImportJob, db, get_hanoi_time
+
+# Threads per web process that pick up queued jobs. Off by default: jobs run in the
+# standalone runner (`python import_jobs.py`, the import-worker compose service)
+IMPORT_WORKER_THREADS = int(os.getenv("IMPORT_WORKER_THREADS", "0"))
+IMPORT_JOB_POLL_INTERVAL = float(os.getenv("IMPORT_JOB_POLL_INTERVAL", "2"))
+# A running job not heard from for this long is taken over by another runner
+IMPORT_JOB_LEASE_SECONDS = int(os.getenv("IMPORT_JOB_LEASE_SECONDS", "120"))
+# A job that keeps killing its runner is failed after this many claims
+IMPORT_JOB_MAX_ATTEMPTS = int(os.getenv("IMPORT_JOB_MAX_ATTEMPTS", "3"))
+IMPORT_JOB_DIR = os.getenv("IMPORT_JOB_DIR")  # defaults to <instance>/import_jobs
+
+
+class LeaseLost(Exception):
+    """Another runner claimed the job after this one's lease ran out"""
+
+
+def _now():
+    return get_hanoi_time().replace(tzinfo=None)
+
+
+def _lease_until():
+    return _now() + timedelta(seconds=IMPORT_JOB_LEASE_SECONDS)
+
+
+def _count_lines(path: str) -> int:
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            count += block.count(b"\n")
+    return count
+
+
+class ImportJobQueue:
+    """Import jobs persisted in the ``import_jobs`` table.
+
+    Any process may enqueue; runners claim a job with a conditional UPDATE so
+    each job has one runner at a time. The runner renews the job's lease with
+    every progress update. If the runner dies (deploy, OOM kill, worker
+    recycling), the lease runs out and another runner resumes the job after its
+    last committed chunk.
+    """
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.job_dir: Optional[str] = None
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def init_app(self, app: Flask, threads: int = IMPORT_WORKER_THREADS) -> None:
+        self.app = app
+        self.job_dir = IMPORT_JOB_DIR or os.path.join(app.instance_path, "import_jobs")
+        os.makedirs(self.job_dir, exist_ok=True)
+        if threads > 0:
+            self.start(threads)
+
+    def start(self, threads: int) -> None:
+        for i in range(threads):
+            thread = threading.Thread(target=self._run, name=f"import-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # --- Enqueue ---
+    def _new_job(self, kind: str, event_id: Optional[int], chunk_size: Optional[int]) -> ImportJob:
+        job_id = uuid.uuid4().hex
+        return ImportJob(
+            id=job_id,
+            kind=kind,
+            status="queued",
+            payload_path=os.path.join(self.job_dir, f"{job_id}.{kind}"),
+            event_id=event_id,
+            chunk_size=chunk_size or IMPORT_CHUNK_SIZE,
+        )
+
+    def _submit(self, job: ImportJob) -> ImportJob:
+        db.session.add(job)
+        db.session.commit()
+        self._wake.set()
+        return job
+
+    def enqueue_csv(self, file_storage, event_id: Optional[int], chunk_size: Optional[int] = None) -> ImportJob:
+        """Spool an uploaded CSV to disk and queue it"""
+        job = self._new_job("csv", event_id, chunk_size)
+        file_storage.save(job.payload_path)
+        # Line count is an estimate (quoted fields may span lines) used for the ETA
+        job.total_rows = max(_count_lines(job.payload_path) - 1, 0)
+        return self._submit(job)
+
+    def enqueue_json(self, rows: List[Any], chunk_size: Optional[int] = None) -> ImportJob:
+        """Write a JSON guest array to disk and queue it"""
+        job = self._new_job("json", None, chunk_size)
+        with open(job.payload_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        job.total_rows = len(rows)
+        return self._submit(job)
+
+    # --- Workers ---
+    @staticmethod
+    def _claimable():
+        orphaned = and_(
+            ImportJob.status == "running",
+            or_(ImportJob.lease_until.is_(None), ImportJob.lease_until < _now()),
+        )
+        return or_(ImportJob.status == "queued", orphaned)
+
+    def _claim_next(self) -> Optional[ImportJob]:
+        candidate = (
+            db.session.query(ImportJob.id, ImportJob.status, func.coalesce(ImportJob.attempts, 0))
+            .filter(self._claimable())
+            .order_by(ImportJob.created_at.asc())
+            .first()
+        )
+        if not candidate:
+            return None
+        job_id, status, attempts = candidate
+        values = {"status": "running", "lease_until": _lease_until(), "attempts": attempts + 1}
+        if status == "queued":
+            values["started_at"] = get_hanoi_time()
+        # Matching the attempt count makes the claim a compare-and-set between runners
+        claimed = (
+            ImportJob.query
+            .filter(ImportJob.id == job_id, func.coalesce(ImportJob.attempts, 0) == attempts, self._claimable())
+            .update(values, synchronize_session=False)
+        )
+        db.session.commit()
+        if not claimed:
+            return None
+        if status == "running":
+            print(f"Import job {job_id} lease expired, resuming (attempt {attempts + 1})")
+        return ImportJob.query.get(job_id)
+
+    def _update(self, job_id: str, attempt: int, commit: bool = True, **values) -> None:
+        """Write job fields and renew the lease; LeaseLost if another runner took the job over"""
+        updated = (
+            ImportJob.query.filter_by(id=job_id, attempts=attempt)
+            .update({**values, "lease_until": _lease_until()}, synchronize_session=False)
+        )
+        if commit:
+            db.session.commit()
+        if not updated:
+            raise LeaseLost(job_id)
+
+    def process(self, job: ImportJob) -> None:
+        """Run a claimed job to completion, recording progress as chunks commit"""
+        job_id, attempt = job.id, job.attempts
+        if attempt > IMPORT_JOB_MAX_ATTEMPTS:
+            self._update(job_id, attempt, status="failed", finished_at=get_hanoi_time(),
+                         message=f"Import stopped after {IMPORT_JOB_MAX_ATTEMPTS} interrupted attempts")
+            self._remove_payload(job)
+            return
+
+        # Rows up to the last reported chunk are committed, and only those; a resumed job continues after them
+        resume = ImportResult()
+        resume.processed, resume.imported, resume.failed = job.processed or 0, job.imported or 0, job.failed or 0
+        resume.errors = json.loads(job.errors) if job.errors else []
+
+        def report(processed: int, imported: int, failed: int) -> None:
+            # In the chunk's transaction: its rows and this offset commit together, and a lost
+            # lease (LeaseLost) rolls the rows back instead of leaving them for the next runner
+            self._update(job_id, attempt, commit=False, processed=processed, imported=imported, failed=failed,
+                         errors=json.dumps(resume.errors, ensure_ascii=False))
+
+        try:
+            if job.kind == "csv":
+                with open(job.payload_path, "rb") as f:
+                    result = import_csv_stream(f, job.event_id, chunk_size=job.chunk_size, progress=report,
+                                               resume=resume)
+            else:
+                with open(job.payload_path, "r", encoding="utf-8") as f:
+                    rows = json.load(f)
+                result = import_json_rows(rows, chunk_size=job.chunk_size, progress=report, resume=resume)
+            self._update(
+                job_id,
+                attempt,
+                status="completed",
+                processed=result.processed,
+                imported=result.imported,
+                failed=result.failed,
+                errors=json.dumps(result.errors, ensure_ascii=False),
+                total_rows=result.processed,
+                finished_at=get_hanoi_time(),
+            )
+            print(f"Import job {job_id} completed: {result.imported} imported, {result.failed} failed")
+        except LeaseLost:
+            db.session.rollback()
+            print(f"Import job {job_id} was taken over by another runner, stopping")
+            return
+        except Exception as e:
+            db.session.rollback()
+            print(f"Import job {job_id} failed: {e}")
+            try:
+                self._update(job_id, attempt, status="failed", message=str(e), finished_at=get_hanoi_time())
+            except LeaseLost:
+                return
+        self._remove_payload(job)
+
+    @staticmethod
+    def _remove_payload(job: ImportJob) -> None:
+        try:
+            os.remove(job.payload_path)
+        except OSError:
+            pass
+
+    def run_pending(self) -> bool:
+        """Claim and process one queued job; returns False when the queue is empty"""
+        job = self._claim_next()
+        if job is None:
+            return False
+        self.process(job)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.run_pending():
+                        pass
+                    db.session.remove()
+            except Exception as e:
+                print(f"Import worker error: {e}")
+            self._wake.wait(IMPORT_JOB_POLL_INTERVAL)
+            self._wake.clear()
+
+
+job_queue = ImportJobQueue()
+
+
+if __name__ == "__main__":
+    # Standalone runner (the default way jobs run): `python import_jobs.py [threads]`
+    import importlib
+
+    os.environ["IMPORT_WORKER_THREADS"] = "0"
+    # create_app() binds import_jobs.job_queue, not this module's __main__ copy
+    importlib.import_module("app")
+    from import_jobs import job_queue as app_job_queue
+
+    app_job_queue.start(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
+    print(f"Import job runner started with {len(app_job_queue._threads)} thread(s)")
+    for thread in app_job_queue._threads:
+        thread.join()
@@ -0,0 +1,243 @@
+# Invite payload cache for /api/invite/<token>
+# Mỗi worker giữ sẵn payload thiệp mời theo token (khách + sự kiện) để lượt mở thiệp hàng loạt không cần đọc DB;
+# lần trượt đầu tiên của một sự kiện nạp luôn mọi token của sự kiện đó bằng một truy vấn.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Event, Guest, Token, db
+
+INVITE_CACHE_TTL = int(os.getenv("INVITE_CACHE_TTL", "30"))  # seconds
+INVITE_CACHE_MAX_ENTRIES = int(os.getenv("INVITE_CACHE_MAX_ENTRIES", "50000"))
+# On a miss, load every token of the guest's event in one query (invitations go out per event)
+INVITE_CACHE_PRELOAD_EVENT = os.getenv("INVITE_CACHE_PRELOAD_EVENT", "true").lower() in ("1", "true", "yes")
+
+# Columns the invite payload shows; other writes leave cached payloads valid
+_GUEST_FIELDS = (
+    "name", "email", "title", "role", "organization", "tag",
+    "rsvp_status", "checkin_status", "event_content", "event_id",
+)
+_TOKEN_FIELDS = ("token", "guest_id")
+
+_GUEST_COLUMNS = (
+    Guest.id, Guest.name, Guest.email, Guest.title, Guest.role, Guest.organization,
+    Guest.tag, Guest.rsvp_status, Guest.checkin_status, Guest.event_content, Guest.event_id,
+)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _guest_json(row) -> str:
+    guest_id, name, email, title, role, organization, tag, rsvp_status, checkin_status, event_content, _ = row
+    return _dumps({
+        "id": guest_id,
+        "name": name,
+        "email": email,
+        "title": title or "Ông/Bà",
+        "role": role or "Khách mời",
+        "organization": organization or "",
+        "group_tag": tag or "",
+        "is_vip": tag == "VIP" if tag else False,
+        "rsvp_status": rsvp_status or "pending",
+        "checkin_status": checkin_status or "not_arrived",
+        "event_content": event_content or "",
+    })
+
+
+class InviteEntry(NamedTuple):
+    guest_id: int
+    event_id: int
+    guest_json: str
+    loaded_at: float
+
+
+class InvitePayload(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class InviteLookup(NamedTuple):
+    payload: Optional[InvitePayload]
+    error: Optional[str] = None  # why there is no payload: "Invalid token", "Guest not found", "Event not found"
+
+
+class InviteCache:
+    """Per-process map of token -> invite payload parts.
+
+    The event dict is kept once per event and joined with the guest part on
+    each hit. Entries are dropped when the token, its guest or its event is
+    written in this process, and expire after ``ttl`` seconds so writes made
+    by other workers are picked up too.
+    """
+
+    def __init__(self, ttl: int = INVITE_CACHE_TTL, max_entries: int = INVITE_CACHE_MAX_ENTRIES,
+                 preload_event: bool = INVITE_CACHE_PRELOAD_EVENT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.preload_event = preload_event
+        self._entries: Dict[str, InviteEntry] = {}
+        self._events: Dict[int, Tuple[str, float]] = {}  # event_id -> (event json, loaded_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return time.time() - loaded_at < self.ttl
+
+    def _cached(self, token_str: str) -> Optional[InvitePayload]:
+        entry = self._entries.get(token_str)
+        if entry is None or not self._is_fresh(entry.loaded_at):
+            return None
+        cached_event = self._events.get(entry.event_id)
+        if cached_event is None or not self._is_fresh(cached_event[1]):
+            return None
+        return self._payload(token_str, entry.guest_json, cached_event[0])
+
+    @staticmethod
+    def _payload(token_str: str, guest_json: str, event_json: str) -> InvitePayload:
+        # Same keys and order as the sorted JSON Flask would produce for the dict
+        body = f'{{"event":{event_json},"guest":{guest_json},"token":{_dumps(token_str)}}}\n'.encode("utf-8")
+        return InvitePayload(body, hashlib.sha256(body).hexdigest()[:32])
+
+    def get(self, token_str: str) -> InviteLookup:
+        """Payload for any token whose guest belongs to an existing event, or the reason there is none"""
+        if not token_str:
+            return InviteLookup(None, "Invalid token")
+        payload = self._cached(token_str)
+        if payload is not None:
+            self.hits += 1
+            return InviteLookup(payload)
+        self.misses += 1
+        return self._load(token_str)
+
+    def _load(self, token_str: str) -> InviteLookup:
+        # One joined query: token -> guest -> event; outer joins tell which link is missing
+        row = (
+            db.session.query(*_GUEST_COLUMNS, Event)
+            .select_from(Token)
+            .outerjoin(Guest, Guest.id == Token.guest_id)
+            .outerjoin(Event, Event.id == Guest.event_id)
+            .filter(Token.token == token_str)
+            .first()
+        )
+        if row is None:
+            return InviteLookup(None, "Invalid token")
+        guest_row, event_obj = row[:-1], row[-1]
+        if guest_row[0] is None:
+            return InviteLookup(None, "Guest not found")
+        if event_obj is None:
+            return InviteLookup(None, "Event not found")
+        now = time.time()
+        event_json = _dumps(event_obj.to_dict())
+        loaded = {token_str: InviteEntry(guest_row[0], event_obj.id, _guest_json(guest_row), now)}
+        if self.preload_event:
+            loaded.update(self._load_event_tokens(event_obj.id, now))
+        with self._lock:
+            if len(self._entries) + len(loaded) > self.max_entries:
+                self._entries.clear()
+                self._events.clear()
+            self._events[event_obj.id] = (event_json, now)
+            self._entries.update(loaded)
+        return InviteLookup(self._payload(token_str, loaded[token_str].guest_json, event_json))
+
+    def _load_event_tokens(self, event_id: int, now: float) -> Dict[str, InviteEntry]:
+        rows = (
+            db.session.query(Token.token, *_GUEST_COLUMNS)
+            .join(Guest, Guest.id == Token.guest_id)
+            .filter(Guest.event_id == event_id)
+            .limit(self.max_entries)
+            .all()
+        )
+        return {row[0]: InviteEntry(row[1], event_id, _guest_json(row[1:]), now) for row in rows}
+
+    def invalidate_token(self, token_str: str) -> None:
+        with self._lock:
+            self._entries.pop(token_str, None)
+
+    def invalidate_guests(self, guest_ids: Iterable[int]) -> None:
+        guest_ids = set(guest_ids)
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.guest_id in guest_ids]:
+                del self._entries[key]
+
+    def invalidate_event(self, event_id: int) -> None:
+        with self._lock:
+            self._events.pop(event_id, None)
+            for key in [k for k, e in self._entries.items() if e.event_id == event_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._events.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+invite_cache = InviteCache()
+
+
+def _has_changes(target, fields) -> bool:
+    state = inspect(target)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Guest, "after_update")
+def _guest_updated(mapper, connection, target):
+    if _has_changes(target, _GUEST_FIELDS):
+        invite_cache.invalidate_guests([target.id])
+
+
+@event.listens_for(Guest, "after_delete")
+def _guest_deleted(mapper, connection, target):
+    invite_cache.invalidate_guests([target.id])
+
+
+@event.listens_for(Event, "after_update")
+def _event_updated(mapper, connection, target):
+    # The payload carries the whole event dict, so any column counts
+    invite_cache.invalidate_event(target.id)
+
+
+@event.listens_for(Event, "after_delete")
+def _event_deleted(mapper, connection, target):
+    invite_cache.invalidate_event(target.id)
+
+
+@event.listens_for(Token, "after_update")
+def _token_updated(mapper, connection, target):
+    if _has_changes(target, _TOKEN_FIELDS):
+        history = inspect(target).attrs.token.history
+        for token_str in list(history.deleted or []) + [target.token]:
+            invite_cache.invalidate_token(token_str)
+
+
+@event.listens_for(Token, "after_delete")
+def _token_deleted(mapper, connection, target):
+    invite_cache.invalidate_token(target.token)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_write(orm_execute_state):
+    # query.update()/query.delete() bypass the mapper events above. Statements on guests
+    # or their tokens can name the guests they touch (guest_ids=...); others drop everything.
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (Guest, Event, Token):
+        return
+    guest_ids = orm_execute_state.execution_options.get("guest_ids")
+    if guest_ids is not None and mapper.class_ in (Guest, Token):
+        invite_cache.invalidate_guests(guest_ids)
+    else:
+        invite_cache.clear()
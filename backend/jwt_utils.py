@@ -1,8 +1,14 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
 import jwt
 import os
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, has_app_context
 
 # JWT Configuration
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-this-in-production')
@@ -10,70 +16,200 @@ JWT_ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRATION_MINUTES = 15  # Short-lived access token
 REFRESH_TOKEN_EXPIRATION_DAYS = 7     # Long-lived refresh token
 
-def generate_access_token(user_id, username, email=None):
-    """Generate short-lived access token"""
-    payload = {
+# Verified tokens per worker (keyed by SHA-256 of the token, kept until their exp)
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv('JWT_CLAIMS_CACHE_SIZE', '1024'))
+# Revoked token ids (jti) are reloaded from user_tokens at most this often; 0 disables revocation
+JWT_REVOCATION_REFRESH_SECONDS = float(os.getenv('JWT_REVOCATION_REFRESH_SECONDS', '30'))
+
+
+def _token_claims(user_id, username, email, token_type, lifetime):
+    now = datetime.utcnow()
+    return {
         'user_id': user_id,
         'username': username,
         'email': email,
-        'type': 'access',
-        'iat': datetime.utcnow(),
-        'exp': datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES)
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + lifetime,
     }
-    
+
+def generate_access_token(user_id, username, email=None):
+    """Generate short-lived access token"""
+    payload = _token_claims(user_id, username, email, 'access', timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES))
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
 
-def generate_refresh_token(user_id, username):
+def generate_refresh_token(user_id, username, email=None):
     """Generate long-lived refresh token"""
-    payload = {
-        'user_id': user_id,
-        'username': username,
-        'type': 'refresh',
-        'iat': datetime.utcnow(),
-        'exp': datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS)
-    }
-    
+    payload = _token_claims(user_id, username, email, 'refresh', timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS))
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
 
-def verify_jwt_token(token):
-    """Verify JWT token and return payload"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
+
+class RevokedTokens:
+    """Revoked token ids, mirrored from ``user_tokens`` rows with status 'revoked'.
+
+    Each worker reloads every unexpired revoked row at most every
+    JWT_REVOCATION_REFRESH_SECONDS, so a revocation reaches other workers within
+    that window (immediately in the worker that handled the logout).
+    """
+
+    def __init__(self, refresh_seconds=JWT_REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._expires = {}  # jti -> exp (unix time)
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.refresh_seconds > 0
+
+    def _reload(self):
+        from sqlalchemy import or_, select
+        from models import HANOI_TZ, UserToken, db
+
+        # A full reload, not "rows after the highest id seen": on PostgreSQL a revocation
+        # can commit after a row with a higher id was read, and would never be picked up.
+        # Read on the primary: a lagging read replica would miss recent revocations.
+        now = time.time()
+        now_hanoi = datetime.fromtimestamp(now, HANOI_TZ).replace(tzinfo=None)
+        query = select(UserToken.token, UserToken.expires_at).where(
+            UserToken.status == 'revoked',
+            or_(UserToken.expires_at.is_(None), UserToken.expires_at > now_hanoi),
+        )
+        with db.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        with self._lock:
+            # Revocations are never undone: keep what this worker applied meanwhile (revoke())
+            expires = {jti: exp for jti, exp in self._expires.items() if exp >= now}
+            for jti, expires_at in rows:
+                expires[jti] = _unix_time(expires_at) if expires_at else now + REFRESH_TOKEN_EXPIRATION_DAYS * 86400
+            self._expires = expires
+
+    def is_revoked(self, jti):
+        if not self.enabled or not jti:
+            return False
+        now = time.time()
+        if now - self._loaded_at >= self.refresh_seconds and has_app_context():
+            self._loaded_at = now
+            try:
+                self._reload()
+            except Exception as e:
+                print(f"Token revocation reload error: {e}")
+        return jti in self._expires
+
+    def revoke(self, payload):
+        """Persist the revocation of a verified token and apply it in this worker"""
+        if not self.enabled or not payload.get('jti'):
+            return
+        from models import UserToken, db, HANOI_TZ
+
+        expires_at = datetime.fromtimestamp(payload['exp'], HANOI_TZ).replace(tzinfo=None)
+        if not UserToken.query.filter_by(token=payload['jti']).first():
+            db.session.add(UserToken(user_id=payload['user_id'], token=payload['jti'], status='revoked', expires_at=expires_at))
+            db.session.commit()
+        with self._lock:
+            self._expires[payload['jti']] = payload['exp']
+
+
+def _unix_time(hanoi_naive):
+    from models import HANOI_TZ
+    return HANOI_TZ.localize(hanoi_naive).timestamp()
+
+
+class VerifiedClaimsCache:
+    """LRU of token digest -> claims, so a repeated token skips the HMAC check"""
+
+    def __init__(self, max_entries=JWT_CLAIMS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            payload = self._entries.get(digest)
+            if payload is None:
+                return None
+            if payload['exp'] <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return payload
+
+    def set(self, digest, payload):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = payload
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+revoked_tokens = RevokedTokens()
+verified_claims = VerifiedClaimsCache()
+
+
+def verify_jwt_token(token, token_type=None):
+    """Verify JWT token and return payload (None if invalid, expired, revoked or of another type)"""
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = verified_claims.get(digest)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            return None
+        except jwt.InvalidTokenError:
+            return None
+        verified_claims.set(digest, payload)
+    if token_type is not None and payload.get('type') != token_type:
         return None
-    except jwt.InvalidTokenError:
+    if revoked_tokens.is_revoked(payload.get('jti')):
         return None
+    return payload
+
+def bearer_token():
+    """Token from an ``Authorization: Bearer <token>`` header, if any"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header[len('Bearer '):].strip() or None
+    return None
+
+def authenticate_request():
+    """Claims of the access token in the Authorization header, else of the refresh-token cookie"""
+    access_token = bearer_token()
+    if access_token:
+        return verify_jwt_token(access_token, 'access')
+    refresh_token = request.cookies.get('refresh-token')
+    if refresh_token:
+        return verify_jwt_token(refresh_token, 'refresh')
+    return None
 
 def jwt_required(f):
-    """Decorator to require JWT authentication - đơn giản hóa"""
+    """Decorator to require JWT authentication (Bearer access token or refresh-token cookie)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Chỉ kiểm tra refresh token trong cookie
-        refresh_token = request.cookies.get('refresh-token')
-        
-        if not refresh_token:
+        if not bearer_token() and not request.cookies.get('refresh-token'):
             return jsonify({'message': 'Authentication required'}), 401
-        
+
         try:
-            payload = verify_jwt_token(refresh_token)
+            payload = authenticate_request()
             if payload is None:
                 return jsonify({'message': 'Invalid or expired token'}), 401
-            
+
             # Add user info to request context
             request.current_user = {
                 'user_id': payload['user_id'],
                 'username': payload['username'],
                 'email': payload.get('email')
             }
-            
+
         except Exception as e:
             return jsonify({'message': 'Authentication failed'}), 401
-        
+
         return f(*args, **kwargs)
-    
+
     return decorated_function
 
 def get_current_user():
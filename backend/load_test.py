@@ -0,0 +1,106 @@
+# Load test: long-lived invite streams vs. normal API latency
+# Mở N kết nối SSE /api/qr/stream (như N điện thoại đang mở trang thiệp) rồi đo độ trễ /api/health
+#
+#   GUNICORN_WORKER_CLASS=sync   gunicorn -c gunicorn.conf.py -b 127.0.0.1:5008 app:app
+#   GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py -b 127.0.0.1:5008 app:app
+#   python load_test.py --url http://127.0.0.1:5008 --token <invite token> --streams 50
+
+import argparse
+import http.client
+import socket
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def open_stream(host: str, port: int, token: str, hold: float, results: dict, lock: threading.Lock) -> None:
+    """Hold one SSE connection open for ``hold`` seconds; record whether it was served"""
+    started = time.time()
+    try:
+        sock = socket.create_connection((host, port), timeout=hold)
+        sock.sendall(f"GET /api/qr/stream?token={token} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        stream = sock.makefile("rb")
+        status = stream.readline().split()
+        if len(status) < 2 or status[1] != b"200":
+            raise RuntimeError(f"bad status line {status!r}")
+        while stream.readline() not in (b"\r\n", b"\n", b""):  # response headers
+            pass
+        if not stream.readline():  # ": ping" as soon as a worker picks the stream up
+            raise RuntimeError("stream closed")
+        with lock:
+            results["connected"].append(time.time() - started)
+        try:
+            while time.time() - started < hold:
+                sock.settimeout(max(0.1, hold - (time.time() - started)))
+                if not stream.readline():
+                    break
+        except socket.timeout:
+            pass
+        sock.close()
+    except Exception as e:
+        with lock:
+            results["failed"].append(str(e) or type(e).__name__)
+
+
+def probe(host: str, port: int, path: str, count: int) -> list:
+    """Sequential requests while the streams are open; returns latencies in ms (None = failed)"""
+    latencies = []
+    for _ in range(count):
+        started = time.time()
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            latencies.append((time.time() - started) * 1000 if response.status == 200 else None)
+        except Exception:
+            latencies.append(None)
+        time.sleep(0.05)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hold SSE streams open and measure API latency")
+    parser.add_argument("--url", default="http://127.0.0.1:5008")
+    parser.add_argument("--token", required=True, help="an existing invite token")
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--hold", type=float, default=20, help="seconds each stream stays open")
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    results = {"connected": [], "failed": []}
+    lock = threading.Lock()
+
+    threads = [
+        threading.Thread(target=open_stream, args=(host, port, args.token, args.hold, results, lock), daemon=True)
+        for _ in range(args.streams)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(1)
+
+    latencies = probe(host, port, "/api/health", args.requests)
+    ok = [latency for latency in latencies if latency is not None]
+    for thread in threads:
+        thread.join(args.hold + 10)
+
+    connected = sorted(results["connected"])
+    print(f"Streams:   {len(connected)}/{args.streams} served, {len(results['failed'])} failed")
+    if connected:
+        print(f"           time to first byte p50 {statistics.median(connected) * 1000:.0f} ms, "
+              f"max {connected[-1] * 1000:.0f} ms")
+    if results["failed"]:
+        print(f"           first error: {results['failed'][0]}")
+    print(f"Health:    {len(ok)}/{args.requests} ok")
+    if ok:
+        ok.sort()
+        p95 = ok[min(len(ok) - 1, int(len(ok) * 0.95))]
+        print(f"Latency:   p50 {statistics.median(ok):.1f} ms, p95 {p95:.1f} ms, max {ok[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
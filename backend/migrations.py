@@ -0,0 +1,236 @@
+# Versioned schema migrations
+# Mỗi migration chạy đúng một lần, ghi lại trong bảng schema_migrations (thay cho khối PRAGMA/ALTER cũ).
+# Nhiều worker khởi động cùng lúc: chỉ một process chạy migration nhờ khoá liên process
+# (file lock cạnh file SQLite, pg_advisory_lock trên PostgreSQL); các process khác chờ rồi bỏ qua.
+#
+#   python migrations.py status    # applied / pending versions
+#   python migrations.py explain   # check that hot queries use an index
+
+import sys
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, NamedTuple
+
+from sqlalchemy import inspect
+
+from db import dialect_name
+from models import db, get_hanoi_time
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[], None]
+
+
+def _columns(table: str) -> set:
+    return {column["name"] for column in inspect(db.session.connection()).get_columns(table)}
+
+
+def _add_event_venue_columns() -> None:
+    existing = _columns("events")
+    for column in ("venue_address", "venue_map_url", "program_outline", "dress_code"):
+        if column not in existing:
+            db.session.execute(db.text(f"ALTER TABLE events ADD COLUMN {column} TEXT"))
+
+
+# Kept in sync with __table_args__ in models.py (create_all builds them on new databases)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_guests_event_checkin ON guests (event_id, checkin_status)",
+    "CREATE INDEX IF NOT EXISTS ix_guests_event_rsvp ON guests (event_id, rsvp_status)",
+    "CREATE INDEX IF NOT EXISTS ix_guests_checkin_status ON guests (checkin_status)",
+    "CREATE INDEX IF NOT EXISTS ix_guests_tag ON guests (tag)",
+    "CREATE INDEX IF NOT EXISTS ix_guests_organization ON guests (organization)",
+    "CREATE INDEX IF NOT EXISTS ix_tokens_guest_status ON tokens (guest_id, status)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_checkins_guest_id ON checkins (guest_id)",
+    "CREATE INDEX IF NOT EXISTS ix_import_jobs_status_created ON import_jobs (status, created_at)",
+]
+
+
+def _add_indexes() -> None:
+    # One check-in per guest: keep the earliest row before enforcing it
+    removed = db.session.execute(db.text(
+        "DELETE FROM checkins WHERE id NOT IN (SELECT MIN(id) FROM checkins GROUP BY guest_id)"
+    )).rowcount
+    # Logged even when 0, as a record of what the unique index cost
+    print(f"Removed {removed} duplicate check-in row(s)")
+    for statement in INDEXES:
+        db.session.execute(db.text(statement))
+    db.session.execute(db.text("ANALYZE"))
+
+
+def _install_event_counters() -> None:
+    from event_counters import install_counter_triggers
+    install_counter_triggers(commit=False)
+
+
+def _add_import_job_lease_columns() -> None:
+    existing = _columns("import_jobs")
+    if "lease_until" not in existing:
+        db.session.execute(db.text("ALTER TABLE import_jobs ADD COLUMN lease_until TIMESTAMP"))
+    if "attempts" not in existing:
+        db.session.execute(db.text("ALTER TABLE import_jobs ADD COLUMN attempts INTEGER DEFAULT 0"))
+
+
+def _install_guest_search() -> None:
+    from guest_search import install_search_index
+    install_search_index()
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "events venue/program/dress code columns", _add_event_venue_columns),
+    Migration(2, "indexes for guest filters, token and check-in lookups", _add_indexes),
+    Migration(3, "event_stats counter triggers", _install_event_counters),
+    Migration(4, "guest full-text search index", _install_guest_search),
+    Migration(5, "import job lease and attempt columns", _add_import_job_lease_columns),
+]
+
+
+def _ensure_table() -> None:
+    db.session.execute(db.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    db.session.commit()
+
+
+def applied_versions() -> set:
+    _ensure_table()
+    return {version for (version,) in db.session.execute(db.text("SELECT version FROM schema_migrations"))}
+
+
+# pg_advisory_lock key, shared by every process migrating the same database
+MIGRATION_LOCK_KEY = 7_246_153
+
+
+@contextmanager
+def migration_lock() -> Iterator[None]:
+    """Hold a lock that only one process per database can take (blocks until it is free)"""
+    engine = db.engine
+    if engine.dialect.name == "postgresql":
+        # A connection of its own: the session returns its connection to the pool on every commit
+        with engine.connect() as connection:
+            connection.execute(db.text("SET statement_timeout = 0"))
+            connection.execute(db.text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            connection.commit()
+            try:
+                yield
+            finally:
+                connection.execute(db.text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                connection.commit()
+        return
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    try:
+        import fcntl
+    except ImportError:  # Windows: single-process development only
+        fcntl = None
+    if not path or path == ":memory:" or fcntl is None:
+        yield
+        return
+    # SQLite's own locks are released between migrations; a lock file next to the database is not
+    with open(f"{path}.migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_migrations() -> List[int]:
+    """Apply pending migrations in order, each in its own transaction, under migration_lock()"""
+    with migration_lock():
+        return _apply_pending()
+
+
+def init_schema() -> List[int]:
+    """Create missing tables, then apply pending migrations, under one migration_lock()"""
+    with migration_lock():
+        db.create_all()
+        return _apply_pending()
+
+
+def _apply_pending() -> List[int]:
+    # Read after taking the lock: another process may have just applied some
+    done = applied_versions()
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version in done:
+            continue
+        try:
+            migration.apply()
+            db.session.execute(
+                db.text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": migration.version, "d": migration.description, "t": get_hanoi_time().replace(tzinfo=None)},
+            )
+            db.session.commit()
+            applied.append(migration.version)
+            print(f"Applied migration {migration.version}: {migration.description}")
+        except Exception:
+            db.session.rollback()
+            print(f"Migration {migration.version} failed: {migration.description}")
+            raise
+    return applied
+
+
+# Hot queries and the index each must use
+HOT_QUERIES = [
+    ("guests by event and check-in status",
+     "SELECT id FROM guests WHERE event_id = 1 AND checkin_status = 'checked_in'", "ix_guests_event_checkin"),
+    ("guests by event and RSVP status",
+     "SELECT id FROM guests WHERE event_id = 1 AND rsvp_status = 'accepted'", "ix_guests_event_rsvp"),
+    ("guests by tag", "SELECT id FROM guests WHERE tag = 'VIP'", "ix_guests_tag"),
+    ("guests by organization", "SELECT id FROM guests WHERE organization = 'EXP'", "ix_guests_organization"),
+    ("active token of a guest",
+     "SELECT token FROM tokens WHERE guest_id = 1 AND status = 'active'", "ix_tokens_guest_status"),
+    ("check-in of a guest", "SELECT id FROM checkins WHERE guest_id = 1", "ux_checkins_guest_id"),
+    ("next queued import job",
+     "SELECT id FROM import_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1", "ix_import_jobs_status_created"),
+]
+
+
+def query_plan(sql: str) -> str:
+    """Query plan of ``sql`` on one line (PostgreSQL: seq scans off for the current transaction)"""
+    if dialect_name() == "postgresql":
+        # Small tables are cheaper to scan; ask whether the index is usable, not whether it wins today
+        db.session.execute(db.text("SET LOCAL enable_seqscan = off"))
+        explain = "EXPLAIN"
+    else:
+        explain = "EXPLAIN QUERY PLAN"
+    return " | ".join(str(row[-1]) for row in db.session.execute(db.text(f"{explain} {sql}")))
+
+
+def plan_status(plan: str, index: str) -> str:
+    """ok if ``plan`` uses ``index``, "ok, other index" for another index scan, else SCAN"""
+    if index in plan:
+        return "ok"
+    if dialect_name() == "postgresql" and "Index" in plan and "Seq Scan" not in plan:
+        # The planner's statistics favoured a more selective index for this data
+        return "ok, other index"
+    return "SCAN"
+
+
+def explain_hot_queries() -> bool:
+    """Print the query plan of each of HOT_QUERIES; False if one does not use its index"""
+    ok = True
+    for label, sql, index in HOT_QUERIES:
+        plan = query_plan(sql)
+        status = plan_status(plan, index)
+        ok = ok and status != "SCAN"
+        print(f"[{status}] {label}: {plan}")
+    db.session.rollback()
+    return ok
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    from app import app as flask_app  # create_app() applies pending migrations
+
+    with flask_app.app_context():
+        if command == "status":
+            done = applied_versions()
+            for migration in MIGRATIONS:
+                print(f"{migration.version:>3} {'applied' if migration.version in done else 'pending'}  {migration.description}")
+        elif command == "explain":
+            sys.exit(0 if explain_hot_queries() else 1)
+        else:
+            print("Usage: python migrations.py [status|explain]")
+            sys.exit(1)
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime, timedelta
 from typing import Optional
 import pytz
 
 from db import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import password_hasher
 
 # Múi giờ +7 (Hanoi/Bangkok)
 HANOI_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
@@ -68,6 +69,15 @@ class Guest(db.Model):
     # Relationship
     event = db.relationship("Event", backref=db.backref("guests", cascade="all, delete-orphan"))
 
+    # Existing databases get these through migrations.py
+    __table_args__ = (
+        db.Index("ix_guests_event_checkin", "event_id", "checkin_status"),
+        db.Index("ix_guests_event_rsvp", "event_id", "rsvp_status"),
+        db.Index("ix_guests_checkin_status", "checkin_status"),
+        db.Index("ix_guests_tag", "tag"),
+        db.Index("ix_guests_organization", "organization"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -96,6 +106,8 @@ class Token(db.Model):
     created_at = db.Column(db.DateTime, default=get_hanoi_time)
     expires_at = db.Column(db.DateTime, nullable=True)  # Vĩnh viễn: không dùng hết hạn
 
+    __table_args__ = (db.Index("ix_tokens_guest_status", "guest_id", "status"),)
+
     def is_expired(self):
         # Luôn hợp lệ: thiệp mời/QR không bao giờ hết hạn
         return False
@@ -124,6 +136,85 @@ class Checkin(db.Model):
     gate = db.Column(db.String(50), nullable=True)
     staff = db.Column(db.String(100), nullable=True)
 
+    # One check-in per guest
+    __table_args__ = (db.Index("ux_checkins_guest_id", "guest_id", unique=True),)
+
+
+class EventStats(db.Model):
+    """Per-event guest counters, kept current by triggers on guests (see event_counters.py)"""
+    __tablename__ = "event_stats"
+    event_id = db.Column(db.Integer, db.ForeignKey("events.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    accepted = db.Column(db.Integer, nullable=False, default=0)
+    declined = db.Column(db.Integer, nullable=False, default=0)
+    pending = db.Column(db.Integer, nullable=False, default=0)
+    checked_in = db.Column(db.Integer, nullable=False, default=0)
+    checked_out = db.Column(db.Integer, nullable=False, default=0)
+    not_arrived = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "event_id": self.event_id,
+            "total": self.total,
+            "accepted": self.accepted,
+            "declined": self.declined,
+            "pending": self.pending,
+            "checked_in": self.checked_in,
+            "checked_out": self.checked_out,
+            "not_arrived": self.not_arrived,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ImportJob(db.Model):
+    __tablename__ = "import_jobs"
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(10), nullable=False)  # csv/json
+    status = db.Column(db.String(20), default="queued")  # queued/running/completed/failed
+    payload_path = db.Column(db.String(1024), nullable=False)
+    event_id = db.Column(db.Integer, nullable=True)
+    chunk_size = db.Column(db.Integer, nullable=True)
+    total_rows = db.Column(db.Integer, nullable=True)  # estimate for CSV
+    processed = db.Column(db.Integer, default=0)
+    imported = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text, nullable=True)  # JSON list
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=get_hanoi_time)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # A running job whose lease has passed was orphaned by a dead worker and is claimed again
+    lease_until = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, default=0)  # claims so far; also fences out a stale runner
+
+    __table_args__ = (db.Index("ix_import_jobs_status_created", "status", "created_at"),)
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != "running" or not self.started_at or not self.processed or not self.total_rows:
+            return None
+        elapsed = (get_hanoi_time().replace(tzinfo=None) - self.started_at.replace(tzinfo=None)).total_seconds()
+        remaining = max(self.total_rows - self.processed, 0)
+        return round(elapsed / self.processed * remaining, 1)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "event_id": self.event_id,
+            "total_rows": self.total_rows,
+            "processed": self.processed or 0,
+            "imported": self.imported or 0,
+            "failed": self.failed or 0,
+            "errors": json.loads(self.errors) if self.errors else [],
+            "message": self.message,
+            "eta_seconds": self.eta_seconds(),
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
 
 # --- Auth ---
 class User(db.Model):
@@ -139,14 +230,17 @@ class User(db.Model):
         user = User(
             username=username.strip(),
             email=(email.strip() if email else None),
-            password_hash=generate_password_hash(password),
+            password_hash=password_hasher.hash(password),
         )
         db.session.add(user)
         db.session.commit()
         return user
 
     def verify_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        return password_hasher.needs_rehash(self.password_hash)
 
     def to_public_dict(self) -> dict:
         return {
@@ -0,0 +1,132 @@
+# Password hashing policy
+# Thuật toán và tham số băm mật khẩu lấy từ PASSWORD_HASH_METHOD; việc băm/kiểm tra chạy trong một thread pool
+# giới hạn để không giữ luồng xử lý request. Đăng nhập thành công với hash theo chính sách cũ -> băm lại sau khi trả lời.
+#
+# Logins per second per core under the current policy (or another one):
+#   python password_hashing.py bench --seconds 5
+#   python password_hashing.py bench --method pbkdf2:sha256:600000 --threads 4
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug method string: "scrypt:<n>:<r>:<p>" or "pbkdf2:<hash>:<iterations>"
+# scrypt:32768:8:1 is werkzeug 3's default (~160 ms per check on one core); scrypt:16384:8:1 halves it
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_SALT_LENGTH = int(os.getenv("PASSWORD_HASH_SALT_LENGTH", "16"))
+# hashlib releases the GIL while hashing, so these threads use separate cores
+PASSWORD_HASH_THREADS = int(os.getenv("PASSWORD_HASH_THREADS", str(min(4, os.cpu_count() or 1))))
+# A login waiting longer than this for a free hashing thread fails instead of piling up
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+def _gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with one policy, on at most ``threads`` OS threads."""
+
+    def __init__(self, method: str = PASSWORD_HASH_METHOD, threads: int = PASSWORD_HASH_THREADS,
+                 salt_length: int = PASSWORD_HASH_SALT_LENGTH, timeout: float = PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.threads = max(1, threads)
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._hash_prefix = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if _gevent_patched():
+                    # Patched threads are greenlets: hashing there would block the event loop.
+                    # gevent's executor runs on native threads and waits cooperatively.
+                    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                    self._executor = NativeThreadPoolExecutor(max_workers=self.threads)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _run(self, fn: Callable, *args):
+        future: Future = self._pool().submit(fn, *args)
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash_prefix(self) -> str:
+        """The method as werkzeug writes it into hashes ("scrypt" -> "scrypt:32768:8:1")"""
+        # Found by hashing once, on first use: short methods take werkzeug's defaults, and
+        # doing it in __init__ would cost a full hash in every process that imports this module.
+        # Like any hash, it runs on the hashing threads, not the request's
+        if self._hash_prefix is None:
+            self._hash_prefix = self._run(generate_password_hash, "", self.method, 1).split("$", 1)[0]
+        return self._hash_prefix
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if the stored hash was made with another algorithm or other parameters"""
+        return password_hash.split("$", 1)[0] != self.hash_prefix()
+
+
+password_hasher = PasswordHasher()
+
+
+def upgrade_password_hash(user_id: int, old_hash: str, password: str) -> bool:
+    """Store ``password`` under the current policy, unless the hash changed meanwhile (needs an app context)"""
+    from models import User, db
+
+    new_hash = password_hasher.hash(password)
+    updated = User.query.filter_by(id=user_id, password_hash=old_hash).update(
+        {"password_hash": new_hash}, synchronize_session=False
+    )
+    db.session.commit()
+    return bool(updated)
+
+
+def bench(method: str, threads: int, seconds: float) -> float:
+    """Verify one hash from ``threads`` callers for ``seconds``; returns checks per second"""
+    hasher = PasswordHasher(method=method, threads=threads)
+    stored = hasher.hash("correct horse battery staple")
+    done = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def caller(index: int) -> None:
+        while time.perf_counter() < deadline:
+            hasher.verify(stored, "correct horse battery staple")
+            done[index] += 1
+
+    callers = [threading.Thread(target=caller, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    return sum(done) / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hashing policy tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--method", default=PASSWORD_HASH_METHOD)
+    parser.add_argument("--threads", type=int, default=PASSWORD_HASH_THREADS)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    cores = min(args.threads, os.cpu_count() or 1)
+    rate = bench(args.method, args.threads, args.seconds)
+    print(f"{args.method}: {1000 * cores / rate:.0f} ms per check, "
+          f"{rate:.1f} logins/s on {args.threads} thread(s), {rate / cores:.1f} logins/s per core")
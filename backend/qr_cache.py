@@ -0,0 +1,131 @@
+# Content-addressed QR PNG cache
+# Ảnh QR của một token không bao giờ đổi nên chỉ render một lần: LRU trong bộ nhớ + file trên đĩa
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional, Tuple
+
+import qrcode
+
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR")  # defaults to <instance>/qr_cache
+QR_CACHE_MEMORY_ITEMS = int(os.getenv("QR_CACHE_MEMORY_ITEMS", "1024"))
+QR_CACHE_MAX_AGE = int(os.getenv("QR_CACHE_MAX_AGE", "86400"))  # seconds, for Cache-Control
+
+# Render parameters used by /api/guests/<id>/qr-image
+QR_RENDER_PARAMS = {"version": 1, "box_size": 10, "border": 5, "fill_color": "black", "back_color": "white"}
+
+
+def render_qr_png(token: str, version: int = 1, box_size: int = 10, border: int = 5,
+                  fill_color: str = "black", back_color: str = "white") -> bytes:
+    """Render a QR code containing only the token string as PNG bytes"""
+    qr = qrcode.QRCode(version=version, box_size=box_size, border=border)
+    qr.add_data(token)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
+    img_io = BytesIO()
+    img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def qr_cache_key(token: str, **params) -> str:
+    """Stable digest of the token plus every render parameter"""
+    merged = {**QR_RENDER_PARAMS, **params}
+    material = token + "|" + "|".join(f"{k}={merged[k]}" for k in sorted(merged))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class QRImageCache:
+    """In-memory LRU in front of a directory of PNGs named by cache key"""
+
+    def __init__(self, directory: Optional[str] = None, max_items: int = QR_CACHE_MEMORY_ITEMS):
+        self.directory = directory
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def init_app(self, app) -> None:
+        self.directory = QR_CACHE_DIR or os.path.join(app.instance_path, "qr_cache")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def _remember(self, key: str, png: bytes) -> None:
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, png: bytes) -> None:
+        path = self._path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file then rename so concurrent workers never see a partial PNG
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"QR cache write error: {e}")
+
+    def get(self, token: str, **params) -> Tuple[bytes, str]:
+        """Return (png_bytes, cache_key), rendering only on a full miss"""
+        key = qr_cache_key(token, **params)
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return png, key
+        png = self._read_disk(key)
+        if png is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            png = render_qr_png(token, **{**QR_RENDER_PARAMS, **params})
+            self._write_disk(key, png)
+        self._remember(key, png)
+        return png, key
+
+    def peek(self, token: str, **params) -> Optional[bytes]:
+        """Cached PNG from memory or disk without rendering or promoting it"""
+        key = qr_cache_key(token, **params)
+        png = self._memory.get(key)
+        return png if png is not None else self._read_disk(key)
+
+    def put(self, token: str, png: bytes, **params) -> None:
+        """Store a PNG rendered elsewhere (e.g. a process pool) on disk only"""
+        self._write_disk(qr_cache_key(token, **params), png)
+
+    def stats(self) -> dict:
+        return {
+            "memory_items": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+qr_image_cache = QRImageCache()
@@ -0,0 +1,155 @@
+# QR pack export
+# Xuất toàn bộ QR của một sự kiện thành ZIP (PNG) hoặc một file PDF nhiều trang, ghi dần từng phần
+
+import re
+import unicodedata
+import zipfile
+import zlib
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Iterator, List, Tuple
+
+from PIL import Image
+
+from qr_cache import qr_image_cache
+from qr_render import discard_render_pool, render_pool, render_token
+
+QR_PACK_BATCH_SIZE = 256  # images rendered per pool round-trip
+QR_PACK_MIN_PARALLEL = 64  # below this, rendering inline is cheaper than a pool round-trip
+
+GuestToken = Tuple[int, str, str]  # (guest_id, guest_name, token)
+
+
+def _render(tokens: List[str], parallel: bool) -> List[bytes]:
+    pool = render_pool() if parallel else None
+    if pool is not None:
+        try:
+            return list(pool.map(render_token, tokens, chunksize=16))
+        except BrokenProcessPool:
+            discard_render_pool()
+    return [render_token(token) for token in tokens]
+
+
+def iter_qr_pngs(guests: List[GuestToken]) -> Iterator[Tuple[GuestToken, bytes]]:
+    """Yield (guest, png) in order, rendering cache misses in the worker's render pool (qr_render.py)"""
+    parallel = len(guests) >= QR_PACK_MIN_PARALLEL
+    for start in range(0, len(guests), QR_PACK_BATCH_SIZE):
+        batch = guests[start:start + QR_PACK_BATCH_SIZE]
+        pngs = {}
+        misses = []
+        for guest in batch:
+            png = qr_image_cache.peek(guest[2])
+            if png is None:
+                misses.append(guest[2])
+            else:
+                pngs[guest[2]] = png
+
+        if misses:
+            for token_str, png in zip(misses, _render(misses, parallel)):
+                qr_image_cache.put(token_str, png)
+                pngs[token_str] = png
+
+        for guest in batch:
+            yield guest, pngs[guest[2]]
+
+
+def _safe_filename(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\r\n]+', '_', name or '').strip() or 'guest'
+
+
+class _ChunkBuffer:
+    """Write-only file object whose contents are drained after each entry"""
+
+    def __init__(self):
+        self._buffer = BytesIO()
+        self._offset = 0
+
+    def write(self, data: bytes) -> int:
+        self._offset += len(data)
+        return self._buffer.write(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def stream_qr_zip(guests: List[GuestToken]) -> Iterator[bytes]:
+    """Yield a ZIP archive of qr_<name>_<id>.png entries as it is built"""
+    out = _ChunkBuffer()
+    # PNGs are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(out, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for (guest_id, name, _token), png in iter_qr_pngs(guests):
+            archive.writestr(f"qr_{_safe_filename(name)}_{guest_id}.png", png)
+            yield out.drain()
+    yield out.drain()
+
+
+def _pdf_text(value: str) -> str:
+    # Built-in PDF fonts only cover Latin-1: strip Vietnamese diacritics and escape
+    value = (value or "").replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def stream_qr_pdf(guests: List[GuestToken], event_name: str = "") -> Iterator[bytes]:
+    """Yield a multi-page PDF (one QR per page) written object by object"""
+    page_width, page_height, qr_size = 300, 360, 260
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def emit(obj_id: int, body: bytes) -> bytes:
+        nonlocal position
+        offsets[obj_id] = position
+        data = f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+        position += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    # 1 = catalog, 2 = page tree (written last once all pages are known), 3 = font
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    next_id = 4
+    for (guest_id, name, _token), png in iter_qr_pngs(guests):
+        image = Image.open(BytesIO(png)).convert("1")
+        pixels = zlib.compress(image.tobytes())
+        image_id, content_id, page_id = next_id, next_id + 1, next_id + 2
+        next_id += 3
+
+        chunk = emit(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode /Length {len(pixels)} >>\nstream\n"
+        ).encode() + pixels + b"\nendstream")
+        content = (
+            f"q {qr_size} 0 0 {qr_size} 20 80 cm /Im{guest_id} Do Q\n"
+            f"BT /F1 14 Tf 20 50 Td ({_pdf_text(name)}) Tj ET\n"
+            f"BT /F1 9 Tf 20 32 Td ({_pdf_text(event_name)} - #{guest_id}) Tj ET\n"
+        ).encode()
+        chunk += emit(content_id, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        chunk += emit(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] "
+            f"/Resources << /Font << /F1 3 0 R >> /XObject << /Im{guest_id} {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode())
+        page_ids.append(page_id)
+        yield chunk
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+
+    xref_position = position
+    lines = [f"xref\n0 {next_id}\n", "0000000000 65535 f \n"]
+    lines.extend(f"{offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, next_id))
+    lines.append(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+    yield "".join(lines).encode()
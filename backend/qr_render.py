@@ -0,0 +1,47 @@
+# QR render pool
+# Pool process render QR cho xuất gói QR. Dùng forkserver: process con được tạo từ một server sạch
+# chỉ import module này (qrcode + qr_cache), không kế thừa thread, lock hay kết nối DB của worker
+# và không import app.py (không chạy create_app).
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from qr_cache import QR_RENDER_PARAMS, render_qr_png
+
+QR_PACK_PROCESSES = int(os.getenv("QR_PACK_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def render_token(token: str) -> bytes:
+    return render_qr_png(token, **QR_RENDER_PARAMS)
+
+
+def render_pool() -> Optional[ProcessPoolExecutor]:
+    """This process's render pool, started on first use; None when QR_PACK_PROCESSES <= 1"""
+    global _pool, _pool_pid
+    if QR_PACK_PROCESSES <= 1:
+        return None
+    with _pool_lock:
+        # A pool inherited through fork (e.g. gunicorn --preload) belongs to the parent
+        if _pool is None or _pool_pid != os.getpid():
+            context = multiprocessing.get_context("forkserver")
+            # The fork server preloads this module only, not __main__ (app.py under `python app.py`)
+            context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=QR_PACK_PROCESSES, mp_context=context)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def discard_render_pool() -> None:
+    """Drop a broken pool (a child died); the next render_pool() call starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
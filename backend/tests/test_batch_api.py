@@ -0,0 +1,51 @@
+# /api/batch/* keyset pagination: pages are seeked from a cursor, never skipped with OFFSET
+# Phân trang keyset: đọc trang bằng seek từ cursor, không dùng OFFSET; trang cursor không tới được -> 400
+
+from sqlalchemy import event as sa_event
+
+
+def _pages(client, pages, cursor=None):
+    body = {"pages": pages, "items_per_page": 5, "filters": {}, "include_count": False}
+    if cursor:
+        body["cursor"] = cursor
+    return client.post("/api/batch/guests", json=body)
+
+
+def test_cursor_walk_reads_every_guest_once_without_offset(db, seed, client):
+    guest_ids = seed(guests=23)
+    first = _pages(client, [1, 2])
+    assert first.status_code == 200
+    seen = [guest["id"] for page in ("1", "2") for guest in first.json["data"][page]]
+
+    cursor = first.json["pagination"]["next_cursor"]
+    offsets = []
+
+    def record_offset(conn, cursor, statement, parameters, context, executemany):
+        # SQLite always renders "LIMIT ? OFFSET ?"; what counts is the rows it skips
+        if "OFFSET" in statement.upper():
+            offsets.append(parameters[-1] if isinstance(parameters, (list, tuple)) else parameters)
+
+    sa_event.listen(db.engine, "before_cursor_execute", record_offset)
+    try:
+        rest = _pages(client, [3, 4, 5], cursor)
+    finally:
+        sa_event.remove(db.engine, "before_cursor_execute", record_offset)
+    assert rest.status_code == 200
+    assert all(offset == 0 for offset in offsets), offsets
+    seen += [guest["id"] for page in ("3", "4", "5") for guest in rest.json["data"][page]]
+
+    assert seen == guest_ids
+    assert rest.json["pagination"]["has_more"] is False
+    assert rest.json["pagination"]["next_cursor"] is None
+
+
+def test_pages_the_cursor_cannot_reach_are_rejected(db, seed, client):
+    seed(guests=30)
+    cursor = _pages(client, [1, 2]).json["pagination"]["cursors"]["2"]
+
+    assert _pages(client, [3]).status_code == 400  # no cursor: only page 1 onwards
+    assert _pages(client, [1, 3]).status_code == 400  # gap
+    assert _pages(client, [1], cursor).status_code == 400  # before the cursor
+    assert _pages(client, [4], cursor).status_code == 400  # jumps past page 3
+    assert "page 3" in _pages(client, [5], cursor).json["error"]
+    assert _pages(client, [3], cursor).status_code == 200
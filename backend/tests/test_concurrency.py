@@ -0,0 +1,71 @@
+# Parallel writers: no "database is locked" errors, and exactly one check-in per guest
+
+import threading
+
+from sqlalchemy import event as sa_event
+
+from db_config import stress
+from models import Checkin, Guest
+
+WRITERS = 8
+
+
+def test_parallel_checkins_do_not_fail_or_duplicate(app, db, seed):
+    guest_ids = seed(guests=40)
+    statuses = {}  # (writer, guest_id) -> HTTP status
+    start = threading.Barrier(WRITERS)
+
+    def writer(number: int) -> None:
+        client = app.test_client()
+        start.wait()
+        # Every writer scans every guest, from its own gate and in its own order
+        for guest_id in guest_ids[number:] + guest_ids[:number]:
+            response = client.post("/api/checkin", json={"token": f"t{guest_id}", "gate": f"G{number}"})
+            statuses[(number, guest_id)] = response.status_code
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(statuses.values()) <= {200, 409}, sorted(set(statuses.values()))
+    for guest_id in guest_ids:
+        assert sum(statuses[(number, guest_id)] == 200 for number in range(WRITERS)) == 1
+    db.session.expire_all()
+    assert Checkin.query.count() == len(guest_ids)
+    assert Guest.query.filter_by(checkin_status="checked_in").count() == len(guest_ids)
+
+
+def test_parallel_writer_processes_commit_without_errors(db, capsys):
+    # One engine per process, as with one gunicorn worker per writer
+    assert stress(writers=4, seconds=2), capsys.readouterr().out
+
+
+def test_bulk_checkin_skips_guests_checked_in_after_its_read(app, db, seed, client):
+    guest_ids = seed(guests=5)
+    raced_id = guest_ids[2]
+    raced = []
+
+    def scan_lands_first(conn, cursor, statement, parameters, context, executemany):
+        # A gate scan commits between the bulk request's read of existing check-ins and its insert
+        if statement.lstrip().upper().startswith("INSERT INTO CHECKINS") and not raced:
+            raced.append(statement)
+            cursor.connection.cursor().execute(
+                "INSERT INTO checkins (guest_id, time, gate, staff) VALUES "
+                f"({raced_id}, CURRENT_TIMESTAMP, 'A', 'Gate')"
+            )
+
+    sa_event.listen(db.engine, "before_cursor_execute", scan_lands_first)
+    try:
+        response = client.post("/api/guests/bulk-checkin", json={"guest_ids": guest_ids, "event_id": 1})
+    finally:
+        sa_event.remove(db.engine, "before_cursor_execute", scan_lands_first)
+
+    assert response.status_code == 200, response.json
+    assert response.json["count"] == 4
+    assert response.json["status_updated"] == 4
+    assert [guest["id"] for guest in response.json["already_checked_in"]] == [raced_id]
+    db.session.expire_all()
+    assert Checkin.query.count() == 5
+    assert db.session.get(Guest, raced_id).checkin_status == "not_arrived"
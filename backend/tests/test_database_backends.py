@@ -0,0 +1,85 @@
+# Dialect-specific code paths (SQLite and PostgreSQL): counter triggers, guest search, copying data
+# Run the file against PostgreSQL with TEST_DATABASE_URL (see conftest.py)
+
+import datetime
+import os
+
+from sqlalchemy import create_engine, insert
+
+from conftest import TEST_DIR
+from db_config import copy_from
+from event_counters import get_event_stats, rebuild_event_stats
+from guest_search import search_backend, search_guest_ids
+from models import Event, Guest, Token, db as models_db
+
+
+def test_event_stats_triggers_follow_guest_writes(db, seed, client):
+    guest_ids = seed(guests=10)
+    event_id = db.session.get(Guest, guest_ids[0]).event_id
+    client.post("/api/checkin", json={"token": f"t{guest_ids[0]}"})
+    guest = db.session.get(Guest, guest_ids[1])
+    guest.rsvp_status = "accepted"
+    db.session.delete(db.session.get(Guest, guest_ids[2]))
+    db.session.commit()
+
+    stats = get_event_stats(event_id)
+    assert (stats["total"], stats["checked_in"], stats["accepted"], stats["not_arrived"]) == (9, 1, 1, 8)
+
+    rebuild_event_stats()
+    rebuilt = get_event_stats(event_id)
+    assert {k: v for k, v in rebuilt.items() if k != "updated_at"} == {k: v for k, v in stats.items() if k != "updated_at"}
+
+
+def test_search_folds_diacritics_and_matches_prefixes(db, seed):
+    seed(guests=5)
+    db.session.add_all([
+        Guest(name="Nguyễn Văn An", organization="Công ty Ánh Dương"),
+        Guest(name="Trần Thị Bình", organization="EXP"),
+    ])
+    db.session.commit()
+
+    assert search_backend() in ("fts5", "tsvector")
+    found = [db.session.get(Guest, guest_id).name for guest_id in search_guest_ids("nguyen an")]
+    assert found == ["Nguyễn Văn An"]
+    assert [db.session.get(Guest, guest_id).name for guest_id in search_guest_ids("anh duo")] == ["Nguyễn Văn An"]
+
+
+def test_search_ranks_every_match_before_limiting(db):
+    # Weaker (organization-only) matches come first in id order; the name match must still win
+    db.session.add_all([Guest(name=f"Guest {n}", organization="An Phát") for n in range(50)])
+    db.session.add(Guest(name="Lê An"))
+    db.session.commit()
+
+    best = search_guest_ids("an", limit=3)
+    assert db.session.get(Guest, best[0]).name == "Lê An"
+    assert len(best) == 3
+
+
+def test_copy_from_sqlite_keeps_rows_ids_and_counters(db):
+    source_path = os.path.join(TEST_DIR, "copy_source.db")
+    if os.path.exists(source_path):
+        os.remove(source_path)
+    source = create_engine(f"sqlite:///{source_path}")
+    models_db.metadata.create_all(source)
+    with source.begin() as connection:
+        connection.execute(insert(Event.__table__), [{"id": 7, "name": "Gala", "date": datetime.date.today()}])
+        connection.execute(insert(Guest.__table__), [
+            {"id": 100 + n, "name": f"Guest {n}", "event_id": 7, "rsvp_status": "accepted" if n % 2 else "pending"}
+            for n in range(20)
+        ])
+        connection.execute(insert(Token.__table__), [{"guest_id": 100 + n, "token": f"copy{n}"} for n in range(20)])
+    source.dispose()
+
+    assert copy_from(f"sqlite:///{source_path}")
+    db.session.remove()
+
+    assert Guest.query.count() == 20
+    stats = get_event_stats(7)
+    assert (stats["total"], stats["accepted"], stats["pending"]) == (20, 10, 10)
+    # New rows continue after the copied ids
+    guest = Guest(name="After copy", event_id=7)
+    db.session.add(guest)
+    db.session.commit()
+    assert guest.id > 119
+    # A second copy into the now non-empty database is refused
+    assert not copy_from(f"sqlite:///{source_path}")
@@ -0,0 +1,68 @@
+# SQLite file replica: each sync swaps in a complete copy and readers reopen it
+# Replica SQLite: mỗi lần sync thay cả file bằng bản sao hoàn chỉnh, process đọc mở lại kết nối
+
+import os
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from conftest import TEST_DIR
+from db_replica import ReadReplica, _replica_pragmas
+
+
+def _replica(name: str) -> ReadReplica:
+    primary_path = os.path.join(TEST_DIR, f"{name}.db")
+    replica = ReadReplica()
+    replica.primary_path = primary_path
+    replica.replica_path = os.path.join(TEST_DIR, f"{name}.replica.db")
+    replica.engine = create_engine(f"sqlite:///{replica.replica_path}")
+    event.listen(replica.engine, "connect", _replica_pragmas)
+    with sqlite3.connect(primary_path) as primary:
+        primary.execute("PRAGMA journal_mode=WAL")
+        primary.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    return replica
+
+
+def _add_item(replica: ReadReplica) -> None:
+    with sqlite3.connect(replica.primary_path) as primary:
+        primary.execute("INSERT INTO items DEFAULT VALUES")
+
+
+def _count(replica: ReadReplica) -> int:
+    with replica.engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM items")).scalar()
+
+
+def test_sync_replaces_the_file_and_readers_see_the_new_copy():
+    replica = _replica("swap")
+    _add_item(replica)
+    first = replica.sync_once()
+    assert replica.fresh_as_of() == pytest.approx(first, abs=0.001)
+    assert _count(replica) == 1  # leaves a pooled connection on the first copy
+
+    _add_item(replica)
+    time.sleep(0.01)  # stamps have millisecond resolution
+    second = replica.sync_once()
+    replica._checked_at = 0.0
+    assert replica.fresh_as_of() == pytest.approx(second, abs=0.001)
+    assert _count(replica) == 2
+
+    leftovers = [f for f in os.listdir(TEST_DIR) if f.startswith("swap.replica.db") and f.endswith(("tmp", "-wal"))]
+    assert leftovers == []
+    replica.engine.dispose()
+
+
+def test_replica_connections_are_read_only():
+    replica = _replica("readonly")
+    replica.sync_once()
+    with replica.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        try:
+            conn.execute(text("INSERT INTO items DEFAULT VALUES"))
+        except Exception as e:
+            assert "readonly" in str(e)
+        else:
+            raise AssertionError("write to the replica succeeded")
+    replica.engine.dispose()
@@ -0,0 +1,41 @@
+# Event log shared by workers and the SSE hub
+# Log sự kiện dùng chung: check-in theo lô ghi mọi sự kiện trong một transaction
+
+import json
+import os
+
+from conftest import TEST_DIR
+from event_hub import EventLog, event_log
+
+
+def test_publish_many_appends_in_order():
+    log = EventLog(os.path.join(TEST_DIR, "publish_many.db"))
+    first = log.publish("a", {"n": 0})
+    last = log.publish_many([("a", {"n": 1}), ("b", {"n": 2}), ("a", {"n": 3})])
+    assert last == first + 3
+    assert [json.loads(payload)["n"] for _, _, payload in log.read_since(first, "a")] == [1, 3]
+    assert log.publish_many([]) == last
+
+
+def test_batch_checkin_publishes_once(db, seed, client, monkeypatch):
+    guest_ids = seed(guests=20)
+    published = []
+    publish_many = event_log.publish_many
+
+    def record(events):
+        events = list(events)
+        published.append(events)
+        return publish_many(events)
+
+    def publish(*args):
+        raise AssertionError("batch check-in published a single event")
+
+    monkeypatch.setattr(event_log, "publish_many", record)
+    monkeypatch.setattr(event_log, "publish", publish)
+    start = event_log.latest_id()
+    scans = [{"token": f"t{guest_id}"} for guest_id in guest_ids] + [{"token": f"t{guest_ids[0]}"}]
+    response = client.post("/api/checkin/batch", json={"scans": scans})
+
+    assert response.json["summary"] == {"ok": 20, "already": 1, "invalid": 0}
+    assert len(published) == 1 and len(published[0]) == 20
+    assert len(event_log.read_since(start)) == 20
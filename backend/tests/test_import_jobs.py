@@ -0,0 +1,42 @@
+# Import jobs: a runner that dies mid-job is resumed by another without re-inserting rows
+# Job import: runner chết giữa chừng thì runner khác làm tiếp, không chèn trùng khách
+
+from io import BytesIO
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from import_jobs import ImportJobQueue, job_queue
+from models import Guest, ImportJob
+
+
+class RunnerKilled(BaseException):
+    """Stands in for the runner process dying; process() only handles Exception"""
+
+
+def test_job_killed_between_chunks_resumes_without_duplicates(db, monkeypatch):
+    csv_bytes = ("Name,title,Role,Organization\n" + "".join(f"Guest {n},Mr,Staff,EXP\n" for n in range(10))).encode()
+    job_id = job_queue.enqueue_csv(FileStorage(BytesIO(csv_bytes), "guests.csv"), None, chunk_size=3).id
+
+    update = ImportJobQueue._update
+
+    def dies_recording_second_chunk(self, *args, **values):
+        if values.get("processed") == 6:
+            raise RunnerKilled
+        return update(self, *args, **values)
+
+    monkeypatch.setattr(ImportJobQueue, "_update", dies_recording_second_chunk)
+    with pytest.raises(RunnerKilled):
+        job_queue.run_pending()
+    db.session.rollback()  # the dead process's open transaction goes with it
+    monkeypatch.undo()
+
+    # Its lease runs out and another runner claims the job
+    ImportJob.query.filter_by(id=job_id).update({"lease_until": None})
+    db.session.commit()
+    assert job_queue.run_pending()
+
+    job = db.session.get(ImportJob, job_id)
+    assert (job.status, job.attempts, job.processed, job.imported) == ("completed", 2, 10, 10)
+    names = [name for (name,) in db.session.query(Guest.name).order_by(Guest.id)]
+    assert names == [f"Guest {n}" for n in range(10)]
@@ -0,0 +1,34 @@
+# /api/invite/<token>: cached payload, ETag revalidation, 404 reasons
+# Thiệp mời: payload lấy từ invite_cache, ETag trả 304, lỗi 404 nói rõ thiếu token, khách hay sự kiện
+
+from models import Guest
+
+
+def test_invite_is_cached_and_revalidated(db, seed, client):
+    guest_id = seed(guests=3)[0]
+    first = client.get(f"/api/invite/t{guest_id}")
+    assert first.status_code == 200
+    assert first.json["guest"]["id"] == guest_id
+    assert first.json["event"]["name"] == "Event 0"
+
+    again = client.get(f"/api/invite/t{guest_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+    guest = db.session.get(Guest, guest_id)
+    guest.rsvp_status = "accepted"
+    db.session.commit()
+    changed = client.get(f"/api/invite/t{guest_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
+    assert changed.json["guest"]["rsvp_status"] == "accepted"
+
+
+def test_invite_404_says_what_is_missing(db, seed, client):
+    guest_id = seed(guests=2)[0]
+    assert client.get("/api/invite/nope").json == {"error": "Invalid token"}
+
+    guest = db.session.get(Guest, guest_id)
+    guest.event_id = None
+    db.session.commit()
+    response = client.get(f"/api/invite/t{guest_id}")
+    assert response.status_code == 404
+    assert response.json == {"error": "Event not found"}
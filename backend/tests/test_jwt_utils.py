@@ -0,0 +1,35 @@
+# Token revocations reach every worker, whatever order their rows commit in
+# Thu hồi token: mọi worker đều thấy, kể cả khi hàng có id nhỏ hơn commit sau
+
+import datetime
+
+from jwt_utils import RevokedTokens
+from models import User, UserToken, get_hanoi_time
+
+
+def _revoke_row(db, row_id, jti, expires_at):
+    db.session.add(UserToken(id=row_id, user_id=1, token=jti, status="revoked", expires_at=expires_at))
+    db.session.commit()
+
+
+def test_revocation_committed_after_a_higher_id_is_picked_up(db):
+    db.session.add(User(id=1, username="admin", email="admin@example.com", password_hash="x"))
+    db.session.commit()
+    revoked = RevokedTokens(refresh_seconds=30)
+    in_a_day = get_hanoi_time().replace(tzinfo=None) + datetime.timedelta(days=1)
+
+    # Row 5 commits first; row 3 (id taken earlier by a slower transaction) commits after the reload
+    _revoke_row(db, 5, "later-id", in_a_day)
+    assert revoked.is_revoked("later-id")
+    _revoke_row(db, 3, "earlier-id", in_a_day)
+    revoked._loaded_at = 0.0
+    assert revoked.is_revoked("earlier-id")
+    assert revoked.is_revoked("later-id")
+
+
+def test_expired_revocations_are_dropped(db):
+    db.session.add(User(id=1, username="admin", email="admin@example.com", password_hash="x"))
+    db.session.commit()
+    revoked = RevokedTokens(refresh_seconds=30)
+    _revoke_row(db, 1, "expired", get_hanoi_time().replace(tzinfo=None) - datetime.timedelta(minutes=1))
+    assert not revoked.is_revoked("expired")
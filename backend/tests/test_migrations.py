@@ -0,0 +1,45 @@
+# Schema migrations: concurrent startups apply each migration once; a failing one stops startup
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR, TEST_DIR
+from migrations import MIGRATIONS, Migration, run_migrations
+
+
+def test_concurrent_startups_apply_each_migration_once(db):
+    if db.engine.dialect.name != "sqlite":
+        pytest.skip("needs a database of its own; the SQLite run covers the file lock")
+    path = os.path.join(TEST_DIR, "startup_race.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    starts = [
+        subprocess.Popen([sys.executable, "-c", "import app"], cwd=BACKEND_DIR, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for _ in range(6)
+    ]
+    outputs = [start.communicate(timeout=120)[0] for start in starts]
+
+    assert [start.returncode for start in starts] == [0] * len(starts), outputs
+    log = "".join(outputs)
+    for migration in MIGRATIONS:
+        assert log.count(f"Applied migration {migration.version}:") == 1, log
+    assert "DB init error" not in log
+
+
+def test_failed_migration_is_raised_and_not_recorded(db, monkeypatch, capsys):
+    def broken():
+        db.session.execute(db.text("SELECT * FROM no_such_table"))
+
+    monkeypatch.setattr("migrations.MIGRATIONS", MIGRATIONS + [Migration(99, "broken", broken)])
+    with pytest.raises(Exception):
+        run_migrations()
+
+    assert "Migration 99 failed" in capsys.readouterr().out
+    versions = {v for (v,) in db.session.execute(db.text("SELECT version FROM schema_migrations"))}
+    assert 99 not in versions
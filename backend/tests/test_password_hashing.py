@@ -0,0 +1,24 @@
+# Password hashing policy: hashes made under the current policy are never re-hashed
+# Chính sách băm mật khẩu: hash vừa tạo theo chính sách hiện tại không bị băm lại
+
+import pytest
+
+from password_hashing import PasswordHasher
+
+
+@pytest.mark.parametrize("method", ["pbkdf2:sha256", "pbkdf2:sha256:1000000", "scrypt", "scrypt:32768:8:1"])
+def test_hash_under_the_policy_needs_no_rehash(method):
+    hasher = PasswordHasher(method=method, threads=1)
+    assert not hasher.needs_rehash(hasher.hash("secret"))
+
+
+def test_short_and_expanded_methods_are_the_same_policy():
+    short, expanded = PasswordHasher(method="scrypt", threads=1), PasswordHasher(method="scrypt:32768:8:1", threads=1)
+    assert not short.needs_rehash(expanded.hash("secret"))
+    assert not expanded.needs_rehash(short.hash("secret"))
+
+
+def test_hash_under_another_policy_needs_rehash():
+    hasher = PasswordHasher(method="scrypt:16384:8:1", threads=1)
+    assert hasher.needs_rehash(PasswordHasher(method="pbkdf2:sha256:1000", threads=1).hash("secret"))
+    assert hasher.needs_rehash(PasswordHasher(method="scrypt:32768:8:1", threads=1).hash("secret"))
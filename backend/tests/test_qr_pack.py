@@ -0,0 +1,33 @@
+# QR packs render cache misses in a forkserver pool whose processes never load the app
+
+import uuid
+
+import pytest
+
+import qr_render
+from qr_pack import QR_PACK_MIN_PARALLEL, iter_qr_pngs
+
+
+@pytest.fixture
+def render_pool(monkeypatch):
+    monkeypatch.setattr(qr_render, "QR_PACK_PROCESSES", 2)
+    qr_render.discard_render_pool()
+    yield qr_render.render_pool()
+    qr_render.discard_render_pool()
+
+
+def test_pool_renders_the_same_pngs_as_inline(render_pool):
+    guests = [(n, f"Guest {n}", f"pack-{uuid.uuid4().hex}") for n in range(QR_PACK_MIN_PARALLEL + 16)]
+
+    rendered = list(iter_qr_pngs(guests))
+
+    assert [guest for guest, _png in rendered] == guests
+    assert all(png == qr_render.render_token(guest[2]) for guest, png in rendered)
+
+
+def test_render_processes_do_not_import_the_app(render_pool):
+    loaded = render_pool.submit(
+        eval, "[m for m in ('app', 'models', 'db', 'flask') if m in __import__('sys').modules]"
+    ).result(timeout=60)
+
+    assert loaded == []
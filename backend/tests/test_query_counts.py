@@ -0,0 +1,38 @@
+# List endpoints load guest events eagerly: the number of queries does not grow with the result size
+
+import pytest
+
+from batch_cache import batch_cache
+from conftest import count_queries
+
+PAGE = {"pages": [1, 2, 3], "items_per_page": 25, "filters": {}}
+
+LIST_ENDPOINTS = [
+    ("get", "/api/guests", None),
+    ("get", "/api/guests/checked-in", None),
+    ("post", "/api/batch/guests", PAGE),
+    ("post", "/api/batch/checkin", PAGE),
+]
+
+# Page scans + count; the session's own queries stay well under this
+MAX_QUERIES = 4
+
+
+def _queries(client, db, method, path, body):
+    batch_cache.clear()
+    with count_queries(db.engine) as statements:
+        response = getattr(client, method)(path, json=body)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return statements
+
+
+@pytest.mark.parametrize("method, path, body", LIST_ENDPOINTS)
+def test_list_query_count_does_not_grow_with_rows(client, db, seed, method, path, body):
+    seed(guests=3, events=3, checked_in=True)
+    small = _queries(client, db, method, path, body)
+
+    seed(guests=60, events=20, checked_in=True)
+    large = _queries(client, db, method, path, body)
+
+    assert len(large) == len(small), large
+    assert len(large) <= MAX_QUERIES, large
@@ -0,0 +1,23 @@
+# Hot filters and lookups are served by the indexes of migration 2 (see migrations.HOT_QUERIES)
+
+import pytest
+
+from migrations import HOT_QUERIES, explain_hot_queries, plan_status, query_plan
+
+
+@pytest.mark.parametrize("label, sql, index", HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_index(db, seed, label, sql, index):
+    seed(guests=300, events=3, checked_in=True)
+    db.session.execute(db.text("ANALYZE"))
+
+    plan = query_plan(sql)
+
+    assert plan_status(plan, index) != "SCAN", plan
+    db.session.rollback()
+
+
+def test_explain_command_reports_every_index(db, seed, capsys):
+    seed(guests=50)
+
+    assert explain_hot_queries()
+    assert capsys.readouterr().out.count("[ok") == len(HOT_QUERIES)
@@ -0,0 +1,194 @@
+# In-memory token -> guest index for the check-in hot path
+# Mỗi worker giữ một bảng tra cứu token -> thông tin khách/sự kiện để quét QR không cần đọc DB
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from db import chunked
+from models import Guest, Token, Event, db
+
+TOKEN_INDEX_TTL = int(os.getenv("TOKEN_INDEX_TTL", "60"))  # seconds
+TOKEN_INDEX_MAX_ENTRIES = int(os.getenv("TOKEN_INDEX_MAX_ENTRIES", "50000"))
+
+# Only changes to these columns make a cached record stale
+_GUEST_FIELDS = ("name", "title", "role", "organization", "tag", "email", "phone", "event_id")
+_EVENT_FIELDS = ("name",)
+_TOKEN_FIELDS = ("token", "status", "guest_id")
+
+
+class TokenRecord(NamedTuple):
+    """Compact guest/event snapshot for an active token"""
+    token: str
+    guest_id: int
+    name: str
+    title: Optional[str]
+    role: Optional[str]
+    organization: Optional[str]
+    tag: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    event_id: Optional[int]
+    event_name: Optional[str]
+    loaded_at: float
+
+    def guest_payload(self) -> Dict[str, object]:
+        """Guest dict in the shape returned by /api/checkin"""
+        return {
+            "id": self.guest_id,
+            "name": self.name,
+            "title": self.title,
+            "position": self.role,
+            "company": self.organization,
+            "tag": self.tag,
+            "email": self.email,
+            "phone": self.phone,
+            "event_id": self.event_id,
+            "event_name": self.event_name,
+        }
+
+
+class TokenIndex:
+    """Per-process map of active token string -> TokenRecord.
+
+    Entries are dropped when the token, its guest or its event is written in
+    this process, and expire after ``ttl`` seconds so writes made by other
+    workers are picked up too.
+    """
+
+    def __init__(self, ttl: int = TOKEN_INDEX_TTL, max_entries: int = TOKEN_INDEX_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, TokenRecord] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, record: TokenRecord) -> bool:
+        return time.time() - record.loaded_at < self.ttl
+
+    def get(self, token_str: str) -> Optional[TokenRecord]:
+        """Return the record for an active token, loading it on a miss"""
+        if not token_str:
+            return None
+        record = self._entries.get(token_str)
+        if record is not None and self._is_fresh(record):
+            return record
+        return self.load_many([token_str]).get(token_str)
+
+    def get_many(self, tokens: Iterable[str]) -> Dict[str, TokenRecord]:
+        """Resolve many tokens, loading every miss with a single IN query"""
+        found: Dict[str, TokenRecord] = {}
+        missing: List[str] = []
+        for token_str in set(t for t in tokens if t):
+            record = self._entries.get(token_str)
+            if record is not None and self._is_fresh(record):
+                found[token_str] = record
+            else:
+                missing.append(token_str)
+        if missing:
+            found.update(self.load_many(missing))
+        return found
+
+    def load_many(self, tokens: List[str]) -> Dict[str, TokenRecord]:
+        """Load active tokens with their guest and event in one query per chunk"""
+        rows = []
+        for chunk in chunked(list(tokens)):
+            rows.extend(
+                db.session.query(
+                    Token.token, Guest.id, Guest.name, Guest.title, Guest.role,
+                    Guest.organization, Guest.tag, Guest.email, Guest.phone,
+                    Guest.event_id, Event.name,
+                )
+                .join(Guest, Guest.id == Token.guest_id)
+                .outerjoin(Event, Event.id == Guest.event_id)
+                .filter(Token.token.in_(chunk), Token.status == "active")
+                .all()
+            )
+        now = time.time()
+        loaded = {row[0]: TokenRecord(*row, loaded_at=now) for row in rows}
+        with self._lock:
+            if len(self._entries) + len(loaded) > self.max_entries:
+                self._entries.clear()
+            self._entries.update(loaded)
+        return loaded
+
+    def invalidate_token(self, token_str: str) -> None:
+        with self._lock:
+            self._entries.pop(token_str, None)
+
+    def invalidate_guest(self, guest_id: int) -> None:
+        with self._lock:
+            for key in [k for k, r in self._entries.items() if r.guest_id == guest_id]:
+                del self._entries[key]
+
+    def invalidate_event(self, event_id: int) -> None:
+        with self._lock:
+            for key in [k for k, r in self._entries.items() if r.event_id == event_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_index = TokenIndex()
+
+
+def _has_changes(target, fields) -> bool:
+    state = inspect(target)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Guest, "after_update")
+def _guest_updated(mapper, connection, target):
+    if _has_changes(target, _GUEST_FIELDS):
+        token_index.invalidate_guest(target.id)
+
+
+@event.listens_for(Guest, "after_delete")
+def _guest_deleted(mapper, connection, target):
+    token_index.invalidate_guest(target.id)
+
+
+@event.listens_for(Event, "after_update")
+def _event_updated(mapper, connection, target):
+    if _has_changes(target, _EVENT_FIELDS):
+        token_index.invalidate_event(target.id)
+
+
+@event.listens_for(Event, "after_delete")
+def _event_deleted(mapper, connection, target):
+    token_index.invalidate_event(target.id)
+
+
+@event.listens_for(Token, "after_update")
+def _token_updated(mapper, connection, target):
+    if _has_changes(target, _TOKEN_FIELDS):
+        history = inspect(target).attrs.token.history
+        for token_str in list(history.deleted or []) + [target.token]:
+            token_index.invalidate_token(token_str)
+        token_index.invalidate_guest(target.guest_id)
+
+
+@event.listens_for(Token, "after_delete")
+def _token_deleted(mapper, connection, target):
+    token_index.invalidate_token(target.token)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_write(orm_execute_state):
+    # query.update()/query.delete() bypass the mapper events above.
+    # Statements that only touch rsvp/checkin status opt out with status_only=True.
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get("status_only"):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Guest, Event, Token):
+        token_index.clear()
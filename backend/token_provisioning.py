@@ -0,0 +1,83 @@
+# Bulk token provisioning
+# Tạo token QR cho nhiều khách cùng lúc: sinh trong bộ nhớ, kiểm tra trùng bằng một truy vấn, ghi một lần
+
+import secrets
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, insert
+
+from db import chunked
+from models import Guest, Token, db
+
+
+def _new_candidates(count: int) -> List[str]:
+    candidates = set()
+    while len(candidates) < count:
+        candidates.add(secrets.token_urlsafe(16))
+    return list(candidates)
+
+
+def _taken(candidates: List[str]) -> set:
+    taken = set()
+    for chunk in chunked(candidates):
+        taken.update(t for (t,) in db.session.query(Token.token).filter(Token.token.in_(chunk)))
+    return taken
+
+
+def generate_unique_tokens(count: int) -> List[str]:
+    """Generate ``count`` token strings that are not in the tokens table yet"""
+    tokens: List[str] = []
+    while len(tokens) < count:
+        candidates = _new_candidates(count - len(tokens))
+        taken = _taken(candidates)
+        tokens.extend(c for c in candidates if c not in taken)
+    return tokens
+
+
+def provision_tokens(guest_ids: List[int]) -> Tuple[Dict[int, str], int]:
+    """Ensure every guest in ``guest_ids`` has an active token.
+
+    Returns ({guest_id: token}, number_created). Missing tokens are inserted
+    with a single executemany; the caller owns the commit.
+    """
+    mapping: Dict[int, str] = {}
+    for chunk in chunked(sorted(set(guest_ids))):
+        for guest_id, token_str in (
+            db.session.query(Token.guest_id, Token.token)
+            .filter(Token.guest_id.in_(chunk), Token.status == "active")
+            .order_by(Token.id.asc())
+        ):
+            mapping.setdefault(guest_id, token_str)
+
+    missing = [guest_id for guest_id in sorted(set(guest_ids)) if guest_id not in mapping]
+    if missing:
+        new_tokens = generate_unique_tokens(len(missing))
+        rows = [{"guest_id": guest_id, "token": token_str, "status": "active"}
+                for guest_id, token_str in zip(missing, new_tokens)]
+        db.session.execute(insert(Token), rows)
+        mapping.update(zip(missing, new_tokens))
+    return mapping, len(missing)
+
+
+def event_guest_tokens(event_id: int) -> Tuple[List[Tuple[int, str, str]], int]:
+    """[(guest_id, guest_name, token)] for every guest of an event, creating missing tokens"""
+    rows = (
+        db.session.query(Guest.id, Guest.name, Token.token)
+        .outerjoin(Token, and_(Token.guest_id == Guest.id, Token.status == "active"))
+        .filter(Guest.event_id == event_id)
+        .order_by(Guest.id.asc(), Token.id.asc())
+        .all()
+    )
+    names: Dict[int, str] = {}
+    tokens: Dict[int, Optional[str]] = {}
+    for guest_id, name, token_str in rows:
+        names[guest_id] = name
+        if tokens.get(guest_id) is None:
+            tokens[guest_id] = token_str
+
+    created = 0
+    missing = [guest_id for guest_id, token_str in tokens.items() if token_str is None]
+    if missing:
+        provisioned, created = provision_tokens(missing)
+        tokens.update(provisioned)
+    return [(guest_id, names[guest_id], tokens[guest_id]) for guest_id in names], created
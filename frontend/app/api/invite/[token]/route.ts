@@ -13,13 +13,23 @@ export async function GET(
     
     console.log(`Loading invite data for token: ${token}`)
     
+    // Forward the browser's ETag so an unchanged invite comes back as an empty 304
+    const ifNoneMatch = request.headers.get('if-none-match')
     const response = await fetch(`${backendUrl}/api/invite/${token}`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
+        ...(ifNoneMatch ? { 'If-None-Match': ifNoneMatch } : {}),
       },
+      cache: 'no-store',
     })
     
+    const etag = response.headers.get('etag')
+    const cacheHeaders: Record<string, string> = etag ? { 'ETag': etag, 'Cache-Control': 'no-cache' } : {}
+    if (response.status === 304) {
+      return new NextResponse(null, { status: 304, headers: cacheHeaders })
+    }
+    
     if (!response.ok) {
       const errorText = await response.text()
       console.error('Backend invite API error:', errorText)
@@ -32,7 +42,7 @@ export async function GET(
     const data = await response.json()
     console.log('Invite data received:', data)
     
-    return NextResponse.json(data)
+    return NextResponse.json(data, { headers: cacheHeaders })
   } catch (error) {
     console.error('Invite API error:', error)
     return NextResponse.json(
@@ -7,10 +7,14 @@ import { Guest, Event } from '@/lib/types/guest'
 export interface BatchApiResponse<T = any> {
   data: { [page: number]: T[] }
   pagination: {
-    total_items: number
-    total_pages: number
+    total_items?: number
+    total_pages?: number
     items_per_page: number
     loaded_pages: number[]
+    // Opaque cursor after the last row of each loaded page; send one back to resume there
+    cursors: { [page: number]: string }
+    next_cursor: string | null
+    has_more: boolean
   }
 }
 
@@ -18,6 +22,8 @@ export interface BatchApiParams {
   pages: number[]
   items_per_page: number
   filters: Record<string, any>
+  cursor?: string
+  include_count?: boolean
 }
 
 export interface BatchStatsResponse {
@@ -215,6 +221,8 @@ export function createSmartBatchLoader<T>(
 ) {
   const cache = new Map<string, BatchApiResponse<T>>()
   const loadingPromises = new Map<string, Promise<BatchApiResponse<T>>>()
+  // Cursors the server returned per filter set (page -> cursor after its last row)
+  const cursorsByFilters = new Map<string, Map<number, string>>()
   
   return {
     async loadPages(
@@ -264,19 +272,38 @@ export function createSmartBatchLoader<T>(
       retryAttempts: number
     ): Promise<BatchApiResponse<T>> {
       // Split pages into chunks for concurrent loading
-      const chunks = this.chunkArray(pages, Math.ceil(pages.length / 3))
+      const sortedPages = [...pages].sort((a, b) => a - b)
+      const chunks = this.chunkArray(sortedPages, Math.ceil(sortedPages.length / 3))
       const results: BatchApiResponse<T>[] = []
+      const cursorsKey = JSON.stringify({ filters, itemsPerPage })
+      if (!cursorsByFilters.has(cursorsKey)) {
+        cursorsByFilters.set(cursorsKey, new Map())
+      }
+      const knownCursors = cursorsByFilters.get(cursorsKey)!
       
       for (const chunk of chunks) {
+        // The server seeks from a cursor and reads pages without gaps after it (no OFFSET):
+        // resume after the nearest page already seen and load any pages in between too
+        const anchorPage = this.pageBefore(knownCursors, chunk[0])
+        const cursor = anchorPage ? knownCursors.get(anchorPage) : undefined
+        const runPages: number[] = []
+        for (let page = anchorPage + 1; page <= chunk[chunk.length - 1]; page++) {
+          runPages.push(page)
+        }
         const chunkPromise = batchLoadWithRetry(
           () => batchFunction({
-            pages: chunk,
+            pages: runPages,
             items_per_page: itemsPerPage,
-            filters
+            filters,
+            ...(cursor ? { cursor } : {})
           }),
           retryAttempts
         )
-        results.push(await chunkPromise)
+        const result = await chunkPromise
+        for (const [page, pageCursor] of Object.entries(result.pagination.cursors || {})) {
+          knownCursors.set(Number(page), pageCursor)
+        }
+        results.push(result)
       }
       
       // Merge results
@@ -284,12 +311,23 @@ export function createSmartBatchLoader<T>(
       let totalItems = 0
       let totalPages = 0
       const loadedPages: number[] = []
+      const cursors: { [page: number]: string } = {}
+      let nextCursor: string | null = null
+      let hasMore = false
       
       for (const result of results) {
-        Object.assign(mergedData, result.data)
-        totalItems = result.pagination.total_items
-        totalPages = result.pagination.total_pages
-        loadedPages.push(...result.pagination.loaded_pages)
+        // Pages loaded only to bridge a gap are kept in knownCursors, not returned
+        for (const page of sortedPages) {
+          if (result.data[page] !== undefined) {
+            mergedData[page] = result.data[page]
+            loadedPages.push(page)
+          }
+        }
+        Object.assign(cursors, result.pagination.cursors)
+        totalItems = result.pagination.total_items ?? totalItems
+        totalPages = result.pagination.total_pages ?? totalPages
+        nextCursor = result.pagination.next_cursor
+        hasMore = result.pagination.has_more
       }
       
       return {
@@ -298,11 +336,25 @@ export function createSmartBatchLoader<T>(
           total_items: totalItems,
           total_pages: totalPages,
           items_per_page: itemsPerPage,
-          loaded_pages: loadedPages
+          loaded_pages: loadedPages,
+          cursors,
+          next_cursor: nextCursor,
+          has_more: hasMore
         }
       }
     },
     
+    // Nearest page before `page` with a known cursor; 0 (start from the first row) if none
+    pageBefore(knownCursors: Map<number, string>, page: number): number {
+      let best = 0
+      knownCursors.forEach((_, knownPage) => {
+        if (knownPage < page && knownPage > best) {
+          best = knownPage
+        }
+      })
+      return best
+    },
+    
     chunkArray<T>(array: T[], chunkSize: number): T[][] {
       const chunks: T[][] = []
       for (let i = 0; i < array.length; i += chunkSize) {
@@ -313,6 +365,7 @@ export function createSmartBatchLoader<T>(
     
     clearCache(): void {
       cache.clear()
+      cursorsByFilters.clear()
     },
     
     getCacheStats(): { size: number; keys: string[] } {